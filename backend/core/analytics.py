@@ -0,0 +1,76 @@
+"""
+Musician dashboard.
+
+Everything is read from the rollup tables maintained by ``core.events``
+rather than from raw play events, one query each: catalog totals are an
+aggregate over the musician's tracks, the time series is a range scan of
+``MusicianPlayRollup`` and the top tracks are the head of the musician's
+``TrackPlayWindow`` index. Windows are therefore limited to
+``core.events.WINDOWS``, and figures are as fresh as the last
+``rollup_plays`` run.
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .events import DAY, GRANULARITIES, HOUR, window_start
+
+
+def bucket_starts(granularity, days, now=None):
+    """Every bucket of the window ending now, oldest first."""
+    now = timezone.localtime(now)
+    if granularity == HOUR:
+        last = now.replace(minute=0, second=0, microsecond=0)
+        return [last - timedelta(hours=n) for n in range(days * 24 - 1, -1, -1)]
+    return [window_start(n + 1, now.date()) for n in range(days - 1, -1, -1)]
+
+
+def musician_dashboard(musician_id, days=30, granularity=DAY, top=10, now=None):
+    Track = apps.get_model('core', 'Track')
+    MusicianPlayRollup = apps.get_model('core', 'MusicianPlayRollup')
+    TrackPlayWindow = apps.get_model('core', 'TrackPlayWindow')
+
+    starts = bucket_starts(granularity, days, now)
+    totals = Track.objects.filter(musician_id=musician_id, is_active=True).aggregate(
+        tracks=Count('id'), plays=Coalesce(Sum('plays'), 0), likes=Coalesce(Sum('likes'), 0),
+    )
+
+    points = dict.fromkeys(starts, (0, 0))
+    points.update(
+        (bucket, (plays, listeners))
+        for bucket, plays, listeners in MusicianPlayRollup.objects.filter(
+            musician_id=musician_id, granularity=granularity, bucket__gte=starts[0],
+        ).values_list('bucket', 'plays', 'listeners')
+        if bucket in points
+    )
+    series = [
+        {'bucket': bucket, 'plays': plays, 'listeners': listeners}
+        for bucket, (plays, listeners) in points.items()
+    ]
+    totals['period_plays'] = sum(point['plays'] for point in series)
+
+    top_tracks = (
+        TrackPlayWindow.objects.filter(musician_id=musician_id, days=days)
+        .values('track_id', 'track__title', 'track__plays', 'plays')
+        .order_by('-plays')[:top]
+    )
+    return {
+        'musician': musician_id,
+        'granularity': granularity,
+        'start': starts[0],
+        'end': starts[-1] + GRANULARITIES[granularity][1],
+        'totals': totals,
+        'series': series,
+        'top_tracks': [
+            {
+                'id': row['track_id'],
+                'title': row['track__title'],
+                'plays': row['track__plays'],
+                'period_plays': row['plays'],
+            }
+            for row in top_tracks
+        ],
+    }
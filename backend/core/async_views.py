@@ -0,0 +1,228 @@
+"""
+Async versions of the hot read endpoints, mounted under ``/api/async/``.
+
+Under an ASGI server (``uvicorn vibetunes.asgi:application``) these views
+run on the event loop: queries go through the async ORM (``aget``,
+``async for``), streamed audio is read in worker threads, and a request
+waiting on the database or the disk holds no worker thread. They answer
+with the same JSON as their DRF counterparts, reusing the response cache,
+``FastTrackSerializer`` and the keyset paginator. DRF views are sync, so
+these are plain Django views with JWT authentication done here, sharing the
+user cache of ``CachedJWTAuthentication``; code without an async API (chart
+rebuilds, recommendation lookups) runs through ``sync_to_async``.
+
+All of them are reads, so they go to the read replicas (see
+``core.replicas``) unless the user is pinned to the primary.
+
+Under WSGI they still work, but every request then spins up an event loop,
+so the sync endpoints remain the ones to use there.
+"""
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from django.utils.http import parse_etags
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import CachedJWTAuthentication, cache_timeout, check_revoked, user_id_of, user_key
+from .charts import chart_engine
+from .models import Playlist, Track
+from .pagination import KeysetPagination
+from . import profiling, replicas
+from .recommendations import recommendation_size, recommended_ids
+from .renderers import ProfiledJSONRenderer
+from .response_cache import PLAYLISTS, TRACKS, response_cache, user_namespace
+from .serializers import CustomUserSerializer, FastTrackSerializer, TrackSerializer
+from .streaming import async_file_response, stream_file, valid_stream_signature
+from .views import TRACK_SORTS, TrackViewSet
+
+CustomUser = get_user_model()
+
+jwt_authentication = CachedJWTAuthentication()
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(
+        ProfiledJSONRenderer().render(data), status=status, headers=headers, content_type='application/json'
+    )
+
+
+def error_response(detail, status):
+    headers = {'WWW-Authenticate': jwt_authentication.authenticate_header(None)} if status == 401 else None
+    return json_response({'detail': detail}, status=status, headers=headers)
+
+
+async def authenticate(request):
+    """The user of the request's bearer token, from the cache when possible."""
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    token = jwt_authentication.get_validated_token(raw_token)
+    user_id = user_id_of(token)
+    key = user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = await CustomUser.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None or not user.is_active:
+            raise InvalidToken('User not found')
+        cache.set(key, user, cache_timeout())
+    try:
+        check_revoked(token, user)
+    except AuthenticationFailed as exc:
+        raise InvalidToken(str(exc.detail))
+    return user
+
+
+def async_api_view(view=None, *, signed_stream=False):
+    """
+    Authenticate like the DRF views and hand ``view`` a DRF ``Request``.
+    With ``signed_stream``, a signed stream URL for the ``pk`` track (see
+    ``core.streaming``) also lets the request through, as an anonymous user.
+    """
+    if view is None:
+        return partial(async_api_view, signed_stream=signed_stream)
+
+    @require_safe
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            with profiling.authenticating():
+                user = await authenticate(request)
+        except InvalidToken as exc:
+            return error_response(exc.detail.get('detail', str(exc)), 401)
+        if user is None:
+            if not (signed_stream and valid_stream_signature(kwargs.get('pk'), request.GET)):
+                return error_response('Authentication credentials were not provided.', 401)
+            user = AnonymousUser()
+        api_request = Request(request, authenticators=())
+        api_request.user = user
+        token = replicas.begin(user, read_only=True)
+        try:
+            return await view(api_request, *args, **kwargs)
+        finally:
+            replicas.end(token)
+    return wrapper
+
+
+async def cached(request, namespaces, build, per_user=False):
+    """
+    ``CachedResponseMixin.cached`` for async views: ``build()`` returns the
+    response data, or an error response which is passed through uncached.
+    """
+    if not response_cache.enabled:
+        data = await build()
+        return data if isinstance(data, HttpResponse) else json_response(data)
+    key = response_cache.key(request, namespaces, per_user)
+    data = response_cache.get(key, namespaces[0].split(':')[0])
+    if data is not None:
+        return json_response(data, headers={'X-Cache': 'HIT'})
+    data = await build()
+    if isinstance(data, HttpResponse):
+        return data
+    response_cache.set(key, data)
+    return json_response(data, headers={'X-Cache': 'MISS'})
+
+
+@async_api_view
+async def track_list(request):
+    if request.query_params.get('sort', 'plays') not in TRACK_SORTS:
+        return json_response({'error': f'Unknown sort, choose from: {", ".join(TRACK_SORTS)}'}, status=400)
+    view = TrackViewSet(request=request, format_kwarg=None, kwargs={}, action='list')
+
+    async def build():
+        if 'search' in request.query_params:
+            # Building the search index on first use reads the catalog.
+            queryset = await sync_to_async(view.get_queryset)()
+        else:
+            queryset = view.get_queryset()
+        serializer = FastTrackSerializer(request)
+        rows = serializer.rows(queryset, *(field.lstrip('-') for field in view.keyset_ordering))
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(rows, request, view)
+        return paginator.get_paginated_response(serializer.serialize(page)).data
+
+    return await cached(request, [TRACKS], build)
+
+
+@async_api_view
+async def track_charts(request):
+    genre = request.query_params.get('genre', None)
+    if genre and genre not in dict(Track.GENRE_CHOICES):
+        return json_response({'error': 'Unknown genre'}, status=400)
+    scope = genre or 'all'
+
+    # Charts are served from the cache; a due rebuild reads the database.
+    etag = await sync_to_async(chart_engine.etag)(scope)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return HttpResponse(status=304, headers={'ETag': etag})
+
+    etag, data = await sync_to_async(chart_engine.payload)(
+        scope,
+        lambda tracks: TrackSerializer(tracks, many=True, context={'request': request}).data,
+        variant=request.build_absolute_uri('/'),
+    )
+    return json_response(data, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+
+@async_api_view
+async def track_recommendations(request):
+    track_ids = await sync_to_async(recommended_ids)(request.user)
+    serializer = FastTrackSerializer(request)
+    rows = {
+        row['id']: row
+        async for row in serializer.rows(Track.objects.filter(pk__in=track_ids, is_active=True))
+    }
+    top_tracks = [rows[pk] for pk in track_ids if pk in rows][:recommendation_size()]
+    return json_response(serializer.serialize(top_tracks))
+
+
+@async_api_view
+async def playlist_detail(request, pk):
+    user = request.user
+
+    async def build():
+        playlist = await Playlist.objects.filter(pk=pk, user=user).values('id', 'name', 'created_at').afirst()
+        if playlist is None:
+            return error_response('No Playlist matches the given query.', 404)
+        serializer = FastTrackSerializer(request)
+        tracks = serializer.rows(
+            Track.objects.filter(playlisttrack__playlist_id=pk).order_by('playlisttrack__order')
+        )
+        return {
+            'id': playlist['id'],
+            'user': CustomUserSerializer(user).data,
+            'name': playlist['name'],
+            'tracks': serializer.serialize([row async for row in tracks]),
+            'created_at': serializers.DateTimeField().to_representation(playlist['created_at']),
+        }
+
+    return await cached(request, [user_namespace(PLAYLISTS, user.pk), TRACKS], build, per_user=True)
+
+
+@async_api_view(signed_stream=True)
+async def track_stream(request, pk):
+    track = await Track.objects.filter(pk=pk, is_active=True).afirst()
+    if track is None:
+        return error_response('No Track matches the given query.', 404)
+    name = track.audio_file.name
+    bitrate = request.query_params.get('bitrate')
+    if bitrate:
+        name = track.renditions.get(bitrate)
+        if name is None:
+            return json_response(
+                {'error': f'Rendition not available, choose from: {", ".join(sorted(track.renditions, key=int)) or "none"}'},
+                status=404
+            )
+    # stat() and open() are quick but blocking; the body is then read in threads.
+    response = await sync_to_async(stream_file, thread_sensitive=False)(
+        request, name, track.audio_file.storage
+    )
+    return async_file_response(response)
@@ -0,0 +1,107 @@
+"""
+Cached JWT authentication.
+
+simplejwt's ``JWTAuthentication`` loads the user row on every request, which
+is the only query of many cheap endpoints (a play costs one extra query for
+it). ``CachedJWTAuthentication`` keeps the loaded user in the default cache
+for ``AUTH_USER_CACHE_TIMEOUT`` seconds instead.
+
+Entries are keyed by user id and a per-user version. Saving or deleting a
+user bumps the version (see ``core.signals``), so deactivation, a role change
+or a new password take effect on the next request; a lookup racing the save
+can only fill the entry of the old version. Updates that bypass ``save()``
+(``QuerySet.update()``) are picked up when the entry expires.
+
+Like the other cache-backed state, this is per process with the local-memory
+backend; use a shared cache with several workers.
+"""
+import hmac
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .profiling import authenticating
+
+USER_KEY = 'auth:user:{}:{}'
+VERSION_KEY = 'auth:version:{}'
+
+
+def cache_timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def _version(user_id):
+    version = cache.get(VERSION_KEY.format(user_id))
+    if version is None:
+        # Start past any version an evicted counter may have reached.
+        cache.add(VERSION_KEY.format(user_id), int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY.format(user_id))
+    return version
+
+
+def user_key(user_id):
+    """Cache key of the user's current version; read it before loading the user."""
+    return USER_KEY.format(user_id, _version(user_id))
+
+
+def invalidate_user(user_id):
+    try:
+        cache.incr(VERSION_KEY.format(user_id))
+    except ValueError:
+        cache.set(VERSION_KEY.format(user_id), int(time.time() * 1000), None)
+
+
+def user_id_of(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+
+def check_revoked(validated_token, user):
+    if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+        api_settings.REVOKE_TOKEN_CLAIM
+    ) != get_md5_hash_password(user.password):
+        raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that reads the user from the cache."""
+
+    def authenticate(self, request):
+        with authenticating():
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        key = user_key(user_id_of(validated_token))
+        user = cache.get(key)
+        if user is None:
+            # Only active users pass, so only they are cached.
+            user = super().get_user(validated_token)
+            cache.set(key, user, cache_timeout())
+        else:
+            check_revoked(validated_token, user)
+        return user
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """Lets scrapers in with ``Authorization: Bearer <METRICS_TOKEN>``; ``request.auth`` is then ``'metrics'``."""
+
+    def authenticate(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if not token:
+            return None
+        if hmac.compare_digest(get_authorization_header(request), f'Bearer {token}'.encode()):
+            return AnonymousUser(), 'metrics'
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
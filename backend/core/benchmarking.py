@@ -0,0 +1,258 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+
+Benchmark data is tagged with a prefix on the musicians' emails so it can be
+removed afterwards without touching real accounts.
+"""
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+import urllib.request
+from datetime import timedelta
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ORDER_GAP, CustomUser, Playlist, PlaylistTrack, Track
+from .trending import score
+
+WORDS = (
+    'love night dance fire heart dream light summer rain city road home blue '
+    'golden wild river moon star electric neon ocean shadow midnight sunrise '
+    'echo velvet thunder silver paper broken lonely crazy sweet secret '
+    'forever young storm winter desert highway ghost angel diamond rhythm '
+    'groove soul funk bass drop wave signal static circuit pulse orbit'
+).split()
+
+GENRES = [choice for choice, _ in Track.GENRE_CHOICES]
+
+
+def seed_musicians(count, tag='bench'):
+    """Create ``count`` benchmark musicians and return their ids."""
+    users = [
+        CustomUser(
+            email=f'{tag}-{n}@bench.invalid', username=f'{tag}-{n}',
+            is_musician=True, password='!'
+        )
+        for n in range(count)
+    ]
+    CustomUser.objects.bulk_create(users, batch_size=1000)
+    return list(
+        CustomUser.objects.filter(
+            email__endswith='@bench.invalid', username__startswith=f'{tag}-', is_musician=True
+        ).values_list('id', flat=True)
+    )
+
+
+def seed_listeners(count, tag='bench'):
+    """Create ``count`` benchmark listeners (not musicians) and return their ids."""
+    CustomUser.objects.bulk_create(
+        [
+            CustomUser(email=f'{tag}-listener-{n}@bench.invalid', username=f'{tag}-listener-{n}', password='!')
+            for n in range(count)
+        ],
+        batch_size=1000,
+    )
+    return list(
+        CustomUser.objects.filter(email__endswith='@bench.invalid', username__startswith=f'{tag}-listener-')
+        .values_list('id', flat=True)
+    )
+
+
+def seed_tracks(count, musician_ids, batch_size=5000, seed=0):
+    """Bulk insert ``count`` tracks with random titles, descriptions, counters and trending scores."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    created = 0
+    while created < count:
+        batch = []
+        for _ in range(min(batch_size, count - created)):
+            batch.append(Track(
+                musician_id=rng.choice(musician_ids),
+                title=' '.join(rng.choices(WORDS, k=rng.randint(1, 3))).title(),
+                description=' '.join(rng.choices(WORDS, k=rng.randint(5, 25))),
+                genre=rng.choice(GENRES),
+                audio_file='tracks/bench.mp3',
+                plays=int(rng.paretovariate(1.2) * 10),
+                likes=int(rng.paretovariate(1.5) * 2),
+                # Last played days to months ago
+                trending=score(rng.paretovariate(1.2), now - timedelta(days=rng.expovariate(1 / 30))),
+            ))
+        with transaction.atomic():
+            Track.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def seed_playlists(user_ids, track_ids, count, size, batch_size=5000, seed=0):
+    """Bulk insert ``count`` playlists of ``size`` random tracks for random users; returns their ids."""
+    rng = random.Random(seed)
+    Playlist.objects.bulk_create(
+        [Playlist(user_id=rng.choice(user_ids), name=f'Bench mix {n}') for n in range(count)],
+        batch_size=batch_size,
+    )
+    playlist_ids = list(
+        Playlist.objects.filter(user_id__in=user_ids, name__startswith='Bench mix ').values_list('id', flat=True)
+    )
+    batch = []
+    for playlist_id in playlist_ids:
+        for n, track_id in enumerate(rng.sample(track_ids, min(size, len(track_ids))), 1):
+            batch.append(PlaylistTrack(playlist_id=playlist_id, track_id=track_id, order=n * ORDER_GAP))
+        if len(batch) >= batch_size:
+            with transaction.atomic():
+                PlaylistTrack.objects.bulk_create(batch)
+            batch = []
+    with transaction.atomic():
+        PlaylistTrack.objects.bulk_create(batch)
+    return playlist_ids
+
+
+def cleanup(tag='bench'):
+    """Delete benchmark users and everything they own."""
+    musicians = CustomUser.objects.filter(
+        email__endswith='@bench.invalid', username__startswith=f'{tag}-'
+    )
+    ids = list(musicians.values_list('id', flat=True))
+    if ids:
+        # Skip the ORM collector: it would load every track and playlist entry into memory.
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM core_playlisttrack WHERE track_id IN '
+                '(SELECT id FROM core_track WHERE musician_id IN (%s))' % placeholders,
+                ids,
+            )
+            cursor.execute(
+                'DELETE FROM core_playlisttrack WHERE playlist_id IN '
+                '(SELECT id FROM core_playlist WHERE user_id IN (%s))' % placeholders,
+                ids,
+            )
+            cursor.execute(
+                'DELETE FROM core_tracklike WHERE user_id IN (%s) OR track_id IN '
+                '(SELECT id FROM core_track WHERE musician_id IN (%s))' % (placeholders, placeholders),
+                ids + ids,
+            )
+            cursor.execute('DELETE FROM core_playevent WHERE musician_id IN (%s)' % placeholders, ids)
+            cursor.execute('DELETE FROM core_track WHERE musician_id IN (%s)' % placeholders, ids)
+        musicians.delete()
+
+
+def measure(func, repeat):
+    """Call ``func`` ``repeat`` times and return the latencies in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def count_queries(func):
+    """Call ``func`` once and return the number of queries it ran on the default database."""
+    count = 0
+
+    def counter(execute, sql, params, many, context):
+        nonlocal count
+        count += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        func()
+    return count
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'mean': statistics.fmean(samples) if samples else 0.0,
+    }
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    """Start the project's WSGI app on a random local port; returns ``(server, base_url)``."""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_internal_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class ASGIServer:
+    """A uvicorn server running in a background thread (``shutdown()`` like the WSGI one)."""
+
+    def __init__(self, server, thread):
+        self.server = server
+        self.thread = thread
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def serve_asgi():
+    """Start the project's ASGI app under uvicorn on a random local port; returns ``(server, base_url)``."""
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(get_asgi_application(), log_level='warning', access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return ASGIServer(server, thread), f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+def load(next_request, clients, seconds):
+    """
+    Run ``clients`` concurrent client threads for ``seconds``. Each calls
+    ``next_request(rng)`` for a ``(url, headers)`` pair and fetches it.
+    Returns ``(latencies in ms, errors, elapsed seconds)``.
+    """
+    deadline = time.perf_counter() + seconds
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            url, headers = next_request(rng)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                    body = response.read()
+                    if response.headers.get_content_type() == 'application/json':
+                        json.loads(body)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
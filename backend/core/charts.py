@@ -0,0 +1,263 @@
+"""
+Materialized track charts.
+
+Charts are the same for every listener, so instead of sorting the catalog on
+each request the top tracks are kept in the cache as small ranked lists:
+
+* all-time by plays and by likes, overall and per genre;
+* ``today`` and ``week`` by plays, from the hourly track rollups plus the
+  play events not rolled up yet (see ``core.events``).
+
+Lists are refreshed incrementally from the deltas written by
+``core.counters`` (one indexed lookup of the touched tracks per flush) and
+fully rebuilt from the database every ``CHARTS_REBUILD_INTERVAL`` seconds or
+when a track is edited, which also drops deactivated tracks. Between
+rebuilds a window only knows the totals of the tracks it lists, so a track
+below the kept depth may enter it late, at the next rebuild. Rendered
+payloads are cached per chart version, and the version doubles as the
+ETag; it only changes when a shown ranking does, so unchanged charts are
+answered with a 304 without touching the database.
+
+With the default local-memory cache every process keeps its own copy; a
+shared cache backend makes them consistent across workers. Updates
+(``record()`` and rebuilds) read, modify and write the whole state, so they
+hold a lock taken with ``cache.add()``, which is atomic on every backend
+and shared with the cache. A flush that cannot get it within
+``CHARTS_LOCK_WAIT`` seconds drops the state instead, and the next read
+rebuilds it from the database, which already has the flushed counts.
+"""
+import hashlib
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max, Sum
+
+from .events import HOUR, window_start
+
+STATE_KEY = 'charts:state'
+LOCK_KEY = 'charts:lock'
+# Seconds before the lock of a crashed holder expires
+LOCK_TIMEOUT = 60
+VERSION_KEY = 'charts:version'
+PAYLOAD_KEY = 'charts:payload:{}:{}:{}'
+
+ALL = 'all'
+RANKED_FIELDS = ('plays', 'likes')
+WINDOWS = {'today': 1, 'week': 7}
+
+
+class ChartEngine:
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def size(self):
+        return getattr(settings, 'CHARTS_SIZE', 10)
+
+    @property
+    def depth(self):
+        # Ranked lists keep more entries than are shown so a track dropping
+        # out of the top does not leave a hole until the next rebuild.
+        return max(self.size, getattr(settings, 'CHARTS_DEPTH', 50))
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, 'CHARTS_REBUILD_INTERVAL', 300)
+
+    @property
+    def lock_wait(self):
+        return getattr(settings, 'CHARTS_LOCK_WAIT', 2.0)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the chart lock of every process sharing the cache; yields whether it was taken."""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(LOCK_KEY, token, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                yield False
+                return
+            time.sleep(0.01)
+        try:
+            yield True
+        finally:
+            if self.cache.get(LOCK_KEY) == token:
+                self.cache.delete(LOCK_KEY)
+
+    @staticmethod
+    def scopes():
+        Track = apps.get_model('core', 'Track')
+        return [ALL] + [genre for genre, _ in Track.GENRE_CHOICES]
+
+    def _stale(self, state):
+        return state is None or time.time() - state['built_at'] > self.rebuild_interval
+
+    def state(self):
+        state = self.cache.get(STATE_KEY)
+        if self._stale(state):
+            with self._locked() as locked:
+                # Another worker may have rebuilt while this one waited.
+                state = self.cache.get(STATE_KEY)
+                if self._stale(state):
+                    state = self._rebuild(store=locked)
+        return state
+
+    def rebuild(self):
+        """Recompute every chart from the database."""
+        with self._locked() as locked:
+            return self._rebuild(store=locked)
+
+    def _rebuild(self, store):
+        # Without the lock the result is served but not stored, so it cannot
+        # overwrite a concurrent update.
+        Track = apps.get_model('core', 'Track')
+        lists = {}
+        for scope in self.scopes():
+            active = Track.objects.filter(is_active=True)
+            if scope != ALL:
+                active = active.filter(genre=scope)
+            lists[scope] = {
+                field: list(
+                    active.order_by(f'-{field}', '-created_at', '-id').values_list('id', field)[:self.depth]
+                )
+                for field in RANKED_FIELDS
+            }
+        self._build_windows(lists)
+        state = {
+            'version': self._next_version(),
+            'built_at': time.time(),
+            'lists': lists,
+        }
+        if store:
+            self.cache.set(STATE_KEY, state, None)
+        return state
+
+    def _next_version(self):
+        # Versions outlive the state entry, so a rebuild after eviction or
+        # invalidation never reuses the key of a stale rendered payload.
+        try:
+            return self.cache.incr(VERSION_KEY)
+        except ValueError:
+            version = int(time.time() * 1000)
+            self.cache.set(VERSION_KEY, version, None)
+            return version
+
+    def invalidate(self):
+        self.cache.delete(STATE_KEY)
+
+    def record(self, deltas):
+        """Merge counter deltas (``{track_id: {'plays': n, 'likes': m}}``) into the charts."""
+        Track = apps.get_model('core', 'Track')
+        rows = list(
+            Track.objects.filter(pk__in=list(deltas))
+            .values_list('id', 'plays', 'likes', 'genre', 'is_active')
+        )
+        with self._locked() as locked:
+            if not locked:
+                # The next read rebuilds from the database, deltas included.
+                self.invalidate()
+                return
+            state = self.cache.get(STATE_KEY)
+            if state is None:
+                # Nothing materialized yet; the next read rebuilds everything.
+                return
+            changed = False
+            for track_id, plays, likes, genre, is_active in rows:
+                played = deltas[track_id].get('plays', 0)
+                for scope in (ALL, genre):
+                    ranked = state['lists'].setdefault(scope, {name: [] for name in RANKED_FIELDS + tuple(WINDOWS)})
+                    scores = [('plays', plays), ('likes', likes)]
+                    for name in WINDOWS:
+                        if played:
+                            scores.append((name, dict(ranked.get(name, [])).get(track_id, 0) + played))
+                    for name, score in scores:
+                        merged = self._merge(ranked.get(name, []), track_id, score, is_active)
+                        changed |= self._shown(merged) != self._shown(ranked.get(name, []))
+                        ranked[name] = merged
+            if changed:
+                state['version'] = self._next_version()
+            self.cache.set(STATE_KEY, state, None)
+
+    def _merge(self, ranked, track_id, score, keep):
+        ranked = [entry for entry in ranked if entry[0] != track_id]
+        if keep:
+            ranked.append((track_id, score))
+            ranked.sort(key=lambda entry: (-entry[1], -entry[0]))
+        return ranked[:self.depth]
+
+    def _shown(self, ranked):
+        return [track_id for track_id, _ in ranked[:self.size]]
+
+    def _build_windows(self, lists):
+        """Rank the ``WINDOWS`` of every scope in ``lists`` from the rollups and recent events."""
+        TrackPlayRollup = apps.get_model('core', 'TrackPlayRollup')
+        PlayEvent = apps.get_model('core', 'PlayEvent')
+        rolled = TrackPlayRollup.objects.filter(granularity=HOUR).aggregate(last=Max('bucket'))['last']
+        for name, days in WINDOWS.items():
+            start = window_start(days)
+            # The last rolled-up hour may still be filling: count it from the events.
+            cutoff = max(rolled, start) if rolled is not None else start
+            totals, genres = Counter(), {}
+            sources = [
+                TrackPlayRollup.objects.filter(granularity=HOUR, bucket__gte=start, bucket__lt=cutoff)
+                .values('track_id', 'track__genre').annotate(total=Sum('plays')),
+                PlayEvent.objects.filter(played_at__gte=cutoff)
+                .values('track_id', 'track__genre').annotate(total=Count('id')),
+            ]
+            for rows in sources:
+                for row in rows.filter(track__is_active=True).order_by():
+                    totals[row['track_id']] += row['total']
+                    genres[row['track_id']] = row['track__genre']
+            ranked = sorted(totals.items(), key=lambda entry: (-entry[1], -entry[0]))
+            for scope in lists:
+                entries = ranked if scope == ALL else [e for e in ranked if genres[e[0]] == scope]
+                lists[scope][name] = entries[:self.depth]
+
+    @staticmethod
+    def _etag(version, scope):
+        return f'"charts-{version}-{hashlib.md5(scope.encode()).hexdigest()[:8]}"'
+
+    def etag(self, scope=ALL):
+        return self._etag(self.state()['version'], scope)
+
+    def payload(self, scope, serialize, variant=''):
+        """
+        Return ``(etag, data)`` for a scope. ``serialize(tracks)`` renders a
+        list of tracks; ``variant`` separates payloads that differ per request
+        (e.g. the host used for absolute media URLs).
+        """
+        Track = apps.get_model('core', 'Track')
+        state = self.state()
+        key = PAYLOAD_KEY.format(state['version'], scope, hashlib.md5(variant.encode()).hexdigest())
+        data = self.cache.get(key)
+        if data is None:
+            lists = state['lists'].get(scope, {})
+            charts = {
+                f'by_{name}' if name in RANKED_FIELDS else name: [
+                    track_id for track_id, _ in lists.get(name, [])
+                ]
+                for name in RANKED_FIELDS + tuple(WINDOWS)
+            }
+            wanted = {track_id for ids in charts.values() for track_id in ids}
+            tracks = list(
+                Track.objects.filter(pk__in=wanted, is_active=True).select_related('musician')
+            ) if wanted else []
+            rendered = dict(zip((track.pk for track in tracks), serialize(tracks)))
+            data = {
+                name: [rendered[track_id] for track_id in ids if track_id in rendered][:self.size]
+                for name, ids in charts.items()
+            }
+            self.cache.set(key, data, self.rebuild_interval)
+        return self._etag(state['version'], scope), data
+
+
+chart_engine = ChartEngine()
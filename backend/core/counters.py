@@ -0,0 +1,216 @@
+"""
+Buffered play/like counters.
+
+Increments are aggregated in process memory and written to ``Track`` as a
+single bulk UPDATE per flush, so a hot track costs one row write per flush
+interval instead of one per request. Deltas are applied with ``F()``
+expressions, which makes flushes from several worker processes safe to
+interleave.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('plays', 'likes')
+
+# Keep the CASE expressions (and their bound parameters) at a sane size.
+FLUSH_BATCH_SIZE = 500
+
+
+class BufferedWriter:
+    """
+    Base class for in-memory buffers drained to the database by a background thread.
+
+    Subclasses implement ``_swap()`` (take everything pending), ``_merge()``
+    (put a failed batch back) and ``write()`` (persist a batch). The flush
+    thread is started lazily on first use so management commands and forked
+    workers never inherit a running thread, and a final flush is registered
+    with ``atexit`` so buffered data survives a graceful shutdown.
+
+    An interval of ``0`` disables buffering: every add is written through
+    immediately, which keeps request-level tests deterministic.
+    """
+
+    interval_setting = None
+    max_pending_setting = None
+    default_interval = 2.0
+    default_max_pending = 10000
+
+    def __init__(self, interval=None, max_pending=None):
+        self._interval = interval
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self._registered = False
+
+    @property
+    def interval(self):
+        if self._interval is not None:
+            return self._interval
+        return getattr(settings, self.interval_setting, self.default_interval)
+
+    @property
+    def max_pending(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return getattr(settings, self.max_pending_setting, self.default_max_pending)
+
+    def _swap(self):
+        raise NotImplementedError
+
+    def _merge(self, batch):
+        raise NotImplementedError
+
+    def _pending_count(self):
+        raise NotImplementedError
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def _after_add(self):
+        """Called after every buffered add, outside of the buffer lock."""
+        if not self.interval:
+            self.flush()
+            return
+        self._ensure_thread()
+        if self._pending_count() >= self.max_pending:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything pending; on failure the batch is put back. Returns success."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._swap()
+            if not batch:
+                return True
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception('%s flush failed, keeping batch for retry', type(self).__name__)
+                with self._lock:
+                    self._merge(batch)
+                return False
+            return True
+
+    def start(self):
+        self._ensure_thread()
+
+    def stop(self):
+        """Stop the flush thread and write out whatever is still buffered."""
+        self._stopping = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.interval, 1) * 5)
+        self._thread = None
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name=type(self).__name__, daemon=True
+            )
+            self._thread.start()
+            if not self._registered:
+                atexit.register(self.stop)
+                self._registered = True
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+class CounterBuffer(BufferedWriter):
+    """Aggregates ``Track.plays``/``Track.likes`` increments per track id."""
+
+    interval_setting = 'COUNTER_FLUSH_INTERVAL'
+    max_pending_setting = 'COUNTER_MAX_PENDING'
+
+    def __init__(self, interval=None, max_pending=None):
+        super().__init__(interval, max_pending)
+        self._pending = Counter()
+        self._listeners = []
+
+    def increment(self, track_id, field, amount=1):
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f'Unknown counter field: {field}')
+        with self._lock:
+            self._pending[(track_id, field)] += amount
+        self._after_add()
+
+    def pending(self, track_id, field):
+        """Increments for a track that have not been flushed yet."""
+        with self._lock:
+            return self._pending[(track_id, field)]
+
+    def connect(self, listener):
+        """Call ``listener(deltas)`` after each successful flush.
+
+        ``deltas`` maps a track id to ``{'plays': n, 'likes': m}``.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _swap(self):
+        batch, self._pending = self._pending, Counter()
+        return batch
+
+    def _merge(self, batch):
+        self._pending.update(batch)
+
+    def _pending_count(self):
+        return len(self._pending)
+
+    def write(self, batch):
+        deltas = {}
+        for (track_id, field), amount in batch.items():
+            if amount:
+                deltas.setdefault(track_id, dict.fromkeys(COUNTER_FIELDS, 0))[field] += amount
+        if not deltas:
+            return
+
+        Track = apps.get_model('core', 'Track')
+        track_ids = sorted(deltas)
+        with transaction.atomic():
+            for start in range(0, len(track_ids), FLUSH_BATCH_SIZE):
+                chunk = track_ids[start:start + FLUSH_BATCH_SIZE]
+                updates = {}
+                for field in COUNTER_FIELDS:
+                    whens = [
+                        When(pk=track_id, then=Value(deltas[track_id][field]))
+                        for track_id in chunk if deltas[track_id][field]
+                    ]
+                    if whens:
+                        updates[field] = F(field) + Case(
+                            *whens, default=Value(0), output_field=IntegerField()
+                        )
+                Track.objects.filter(pk__in=chunk).update(**updates)
+
+        # Listeners must never put an already written batch back in the buffer.
+        for listener in self._listeners:
+            try:
+                listener(deltas)
+            except Exception:
+                logger.exception('Counter listener %r failed', listener)
+
+
+counters = CounterBuffer()
@@ -0,0 +1,184 @@
+"""
+Dropping duplicate play and like events before they reach the database.
+
+Plays: a user's play of a track counts once per ``PLAY_DEDUP_WINDOW``
+seconds, so retries, double clicks and scrapers replaying requests do not
+inflate the counters or the play log. The (user, track) pairs seen recently
+are kept in two Bloom filters, the current window's and the previous one's;
+when a window ends the current filter becomes the previous one and a fresh
+filter takes over. A repeat is therefore dropped for at least one and at
+most two windows after the first play, with no lookup anywhere. A Bloom
+filter never misses a pair it holds, and the rare false positive (sized by
+``PLAY_DEDUP_ERROR_RATE`` for ``PLAY_DEDUP_CAPACITY`` plays per window, a
+few MB) drops a genuine play, which counters can afford. A window that
+fills up rotates early so the error rate holds.
+
+Likes: ``TrackLike`` (unique per user and track) holds the state, and
+``Track.like()``/``Track.unlike()`` change it with one INSERT or DELETE.
+In front of it, the state each like or unlike left is remembered for one to
+two ``LIKE_DEDUP_WINDOW`` windows, in the same current/previous rotation
+but in dicts, since a like followed by an unlike must not hide the next like.
+A repeat of the remembered state is answered without a query. Likes changed
+elsewhere (another worker, a deleted track) can therefore be answered from
+the stale state until the window ends, after which the database decides again.
+
+The filters are per process, like the counters: with several workers a
+duplicate may reach the database once per worker. ``PLAY_DEDUP_WINDOW = 0``
+counts every play, ``LIKE_DEDUP_WINDOW = 0`` sends every like to the
+database.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+
+
+def play_window():
+    return getattr(settings, 'PLAY_DEDUP_WINDOW', 300)
+
+
+def like_window():
+    return getattr(settings, 'LIKE_DEDUP_WINDOW', 300)
+
+
+class BloomFilter:
+    """A fixed-size set of strings that answers "maybe present" or "certainly absent"."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + n * second) % self.size for n in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key):
+        """Add ``key``; returns whether it was (probably) present already."""
+        present = True
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                present = False
+        if not present:
+            self.count += 1
+        return present
+
+
+class RecentEvents:
+    """Keys seen in the current or the previous window, in two rotating Bloom filters."""
+
+    def __init__(self, window=None, capacity=None, error_rate=None):
+        self._window = window
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def window(self):
+        return self._window if self._window is not None else play_window()
+
+    def _filter(self):
+        return BloomFilter(
+            self._capacity or getattr(settings, 'PLAY_DEDUP_CAPACITY', 1000000),
+            self._error_rate or getattr(settings, 'PLAY_DEDUP_ERROR_RATE', 0.001),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._current = self._previous = None
+            self._started = time.monotonic()
+
+    def seen(self, key):
+        """Record ``key``; returns whether it was already seen within the window."""
+        if not self.window:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if self._current is None or now - self._started >= self.window * 2:
+                self._current, self._previous = self._filter(), None
+                self._started = now
+            elif now - self._started >= self.window or self._current.count >= self._current.capacity:
+                self._current, self._previous = self._filter(), self._current
+                self._started = now
+            if self._previous is not None and key in self._previous:
+                return True
+            return self._current.add(key)
+
+
+class RecentStates:
+    """The last state recorded per key in the current or the previous window."""
+
+    def __init__(self, window=None, capacity=None):
+        self._window = window
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def window(self):
+        return self._window if self._window is not None else like_window()
+
+    @property
+    def capacity(self):
+        return self._capacity or getattr(settings, 'LIKE_DEDUP_CAPACITY', 100000)
+
+    def clear(self):
+        with self._lock:
+            self._current, self._previous = {}, {}
+            self._started = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._started >= self.window * 2:
+            self._current, self._previous = {}, {}
+            self._started = now
+        elif now - self._started >= self.window or len(self._current) >= self.capacity:
+            self._current, self._previous = {}, self._current
+            self._started = now
+
+    def get(self, key):
+        """The state recorded for ``key`` within the window, else ``None``."""
+        if not self.window:
+            return None
+        with self._lock:
+            self._rotate()
+            state = self._current.get(key)
+            return self._previous.get(key) if state is None else state
+
+    def set(self, key, state):
+        if not self.window:
+            return
+        with self._lock:
+            self._rotate()
+            self._current[key] = state
+
+
+recent_plays = RecentEvents()
+recent_likes = RecentStates()
+
+
+def is_repeat_play(user_id, track_id):
+    """Whether the user played the track within the dedup window (and remember this play)."""
+    return recent_plays.seen(f'{user_id}:{track_id}')
+
+
+def recent_like(user_id, track_id):
+    """``True``/``False`` if the user liked/unliked the track within the window, else ``None``."""
+    return recent_likes.get((user_id, track_id))
+
+
+def remember_like(user_id, track_id, liked):
+    recent_likes.set((user_id, track_id), liked)
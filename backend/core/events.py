@@ -0,0 +1,212 @@
+"""
+Listening history.
+
+Every play is appended to ``PlayEvent`` (track, musician, genre, listener,
+time). Events are buffered in memory like the counters and inserted with
+one multi-row INSERT per flush, off the request path. On PostgreSQL the
+table is range-partitioned by day: ``ensure_partitions()`` creates the
+partitions ahead of time and expired days are dropped as whole tables
+instead of being deleted row by row.
+
+``rollup()`` folds events into hourly and daily ``*PlayRollup`` rows per
+track, musician and genre. Each run recomputes only the buckets from the
+latest rolled-up bucket onwards (one bucket of slack for events flushed
+late), so analytics queries read small pre-aggregated tables and never scan
+raw events. It also refreshes ``TrackPlayWindow``, each track's plays over
+the last ``WINDOWS`` days, so a musician's top tracks are read from an
+index instead of summing daily rows of the whole catalog. Run it
+periodically with ``manage.py rollup_plays``.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .counters import BufferedWriter
+
+logger = logging.getLogger(__name__)
+
+HOUR = 'hour'
+DAY = 'day'
+GRANULARITIES = {
+    HOUR: (TruncHour, timedelta(hours=1)),
+    DAY: (TruncDay, timedelta(days=1)),
+}
+# Rollup model name -> (its dimension field, the PlayEvent column it groups by)
+DIMENSIONS = {
+    'TrackPlayRollup': ('track', 'track_id'),
+    'MusicianPlayRollup': ('musician', 'musician_id'),
+    'GenrePlayRollup': ('genre', 'genre'),
+}
+PARTITION_PREFIX = 'core_playevent_p'
+WINDOWS = (7, 30, 90)
+INSERT_BATCH_SIZE = 1000
+
+
+class PlayEventBuffer(BufferedWriter):
+    """Collects plays and inserts them into ``PlayEvent`` in batches."""
+
+    interval_setting = 'PLAY_EVENT_FLUSH_INTERVAL'
+    max_pending_setting = 'PLAY_EVENT_MAX_PENDING'
+
+    def __init__(self, interval=None, max_pending=None):
+        super().__init__(interval, max_pending)
+        self._pending = []
+
+    def record(self, track, user=None, played_at=None):
+        event = (
+            track.pk, track.musician_id, track.genre,
+            user.pk if user is not None and user.is_authenticated else None,
+            played_at or timezone.now(),
+        )
+        with self._lock:
+            self._pending.append(event)
+        self._after_add()
+
+    def _swap(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _merge(self, batch):
+        self._pending[:0] = batch
+
+    def _pending_count(self):
+        return len(self._pending)
+
+    def write(self, batch):
+        PlayEvent = apps.get_model('core', 'PlayEvent')
+        PlayEvent.objects.bulk_create(
+            [
+                PlayEvent(track_id=track_id, musician_id=musician_id, genre=genre,
+                          user_id=user_id, played_at=played_at)
+                for track_id, musician_id, genre, user_id, played_at in batch
+            ],
+            batch_size=INSERT_BATCH_SIZE,
+        )
+
+
+play_events = PlayEventBuffer()
+
+
+def partition_name(day):
+    return f'{PARTITION_PREFIX}{day:%Y%m%d}'
+
+
+def ensure_partitions(days_ahead=7, today=None):
+    """Create the daily partitions from today on (PostgreSQL only). Returns the names created."""
+    if connection.vendor != 'postgresql':
+        return []
+    today = today or timezone.localdate()
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            name = partition_name(day)
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            try:
+                with transaction.atomic():
+                    cursor.execute(
+                        f'CREATE TABLE {connection.ops.quote_name(name)} PARTITION OF core_playevent '
+                        f'FOR VALUES FROM (%s) TO (%s)',
+                        [day.isoformat(), (day + timedelta(days=1)).isoformat()],
+                    )
+            except Exception:
+                # Rows for that day already sit in the default partition.
+                logger.exception('Could not create play event partition %s', name)
+                continue
+            created.append(name)
+    return created
+
+
+def purge_events(retention_days=None, today=None):
+    """Drop events older than the retention window; whole partitions on PostgreSQL."""
+    retention_days = retention_days or getattr(settings, 'PLAY_EVENTS_RETENTION_DAYS', 90)
+    cutoff = (today or timezone.localdate()) - timedelta(days=retention_days)
+    if connection.vendor != 'postgresql':
+        PlayEvent = apps.get_model('core', 'PlayEvent')
+        PlayEvent.objects.filter(played_at__date__lt=cutoff).delete()
+        return []
+    dropped = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'core_playevent'::regclass AND c.relname LIKE %s",
+            [PARTITION_PREFIX + '%'],
+        )
+        for (name,) in cursor.fetchall():
+            if name < partition_name(cutoff):
+                cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+                dropped.append(name)
+    return dropped
+
+
+def rollup():
+    """Refresh hourly and daily rollups from the events since the last run. Returns rows written."""
+    PlayEvent = apps.get_model('core', 'PlayEvent')
+    written = {}
+    for model_name, (dimension, column) in DIMENSIONS.items():
+        model = apps.get_model('core', model_name)
+        for granularity, (trunc, width) in GRANULARITIES.items():
+            last = model.objects.filter(granularity=granularity).aggregate(last=Max('bucket'))['last']
+            events = PlayEvent.objects.all()
+            if last is not None:
+                events = events.filter(played_at__gte=last - width)
+            rows = (
+                events.annotate(bucket=trunc('played_at'))
+                .values(column, 'bucket')
+                .annotate(plays=Count('id'), listeners=Count('user_id', distinct=True))
+                .order_by()
+            )
+            objs = [
+                model(granularity=granularity, bucket=row['bucket'], plays=row['plays'],
+                      listeners=row['listeners'], **{column: row[column]})
+                for row in rows.iterator(chunk_size=INSERT_BATCH_SIZE)
+            ]
+            model.objects.bulk_create(
+                objs,
+                batch_size=INSERT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=[dimension, 'granularity', 'bucket'],
+                update_fields=['plays', 'listeners'],
+            )
+            written[f'{model_name}.{granularity}'] = len(objs)
+    written.update(refresh_windows())
+    return written
+
+
+def window_start(days, today=None):
+    """The first daily bucket of a window of ``days`` days ending today."""
+    today = today or timezone.localdate()
+    return timezone.make_aware(datetime.combine(today - timedelta(days=days - 1), time()))
+
+
+def refresh_windows(today=None):
+    """Recompute ``TrackPlayWindow`` from the daily track rollups. Returns rows written."""
+    TrackPlayRollup = apps.get_model('core', 'TrackPlayRollup')
+    TrackPlayWindow = apps.get_model('core', 'TrackPlayWindow')
+    written = {}
+    for days in WINDOWS:
+        rows = (
+            TrackPlayRollup.objects.filter(granularity=DAY, bucket__gte=window_start(days, today))
+            .values('track_id', 'track__musician_id')
+            .annotate(plays=Sum('plays'))
+            .order_by()
+        )
+        objs = [
+            TrackPlayWindow(track_id=row['track_id'], musician_id=row['track__musician_id'],
+                            days=days, plays=row['plays'])
+            for row in rows.iterator(chunk_size=INSERT_BATCH_SIZE)
+        ]
+        # Swapped in one transaction: readers see the old or the new window, never a mix.
+        with transaction.atomic():
+            TrackPlayWindow.objects.filter(days=days).delete()
+            TrackPlayWindow.objects.bulk_create(objs, batch_size=INSERT_BATCH_SIZE)
+        written[f'TrackPlayWindow.{days}'] = len(objs)
+    return written
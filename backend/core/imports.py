@@ -0,0 +1,303 @@
+"""
+Bulk catalog imports.
+
+A label or musician onboarding a catalog supplies a manifest -- CSV with a
+header row, or JSON Lines -- next to the audio files and covers it refers
+to. Each row has ``title``, ``description``, ``genre``, ``audio`` and
+optionally ``cover`` and ``musician`` (an email; staff only, other rows
+belong to the importing user). Paths are relative to the manifest's
+directory and may not leave it.
+
+Rows are handled in batches of ``CATALOG_IMPORT_BATCH_SIZE``. A pool of
+``CATALOG_IMPORT_WORKERS`` threads validates each row with
+``TrackCreateSerializer`` and copies its files into storage, then the
+batch's tracks are inserted with one ``bulk_create`` in the same
+transaction that advances ``CatalogImport.next_row``. An import that fails
+or is interrupted therefore resumes at the first row not yet committed;
+copied files get deterministic names, so a retried batch overwrites its
+earlier copies instead of leaving orphans. Invalid rows are rejected and
+listed on the import without stopping it.
+
+``bulk_create`` sends no ``post_save``, so the search index, the charts
+and the response cache are updated here, and the new tracks are queued in
+the media pipeline. ``CATALOG_IMPORT_WORKERS = 0`` validates and copies
+inline and makes the API run imports in the request, which tests rely on.
+"""
+import csv
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .charts import chart_engine
+from .response_cache import TRACKS, response_cache
+from .search import refresh_search_vectors, track_index
+
+logger = logging.getLogger(__name__)
+
+IMPORT_PENDING = 'pending'
+IMPORT_RUNNING = 'running'
+IMPORT_DONE = 'done'
+IMPORT_FAILED = 'failed'
+IMPORT_STATUS_CHOICES = [
+    (IMPORT_PENDING, 'Pending'),
+    (IMPORT_RUNNING, 'Running'),
+    (IMPORT_DONE, 'Done'),
+    (IMPORT_FAILED, 'Failed'),
+]
+
+MANIFEST_EXTENSIONS = ('.csv', '.jsonl', '.ndjson')
+MAX_ERRORS = 100  # rejected rows listed on the import; the count covers all of them
+
+
+class CatalogImportError(Exception):
+    """A manifest, row or import that cannot be processed."""
+
+
+def workers():
+    return getattr(settings, 'CATALOG_IMPORT_WORKERS', 8)
+
+
+def batch_size():
+    return getattr(settings, 'CATALOG_IMPORT_BATCH_SIZE', 500)
+
+
+def stale_seconds():
+    return getattr(settings, 'CATALOG_IMPORT_STALE_SECONDS', 300)
+
+
+def resolve(base, relative):
+    """``relative`` inside the directory ``base``, which it may not leave."""
+    path = os.path.realpath(os.path.join(base, relative))
+    if os.path.commonpath([path, base]) != base:
+        raise CatalogImportError(f'{relative} is outside of {base}')
+    return path
+
+
+def manifest_path(relative):
+    """Absolute path of a manifest given relative to ``CATALOG_IMPORT_ROOT`` (for the API)."""
+    root = getattr(settings, 'CATALOG_IMPORT_ROOT', None)
+    if not root:
+        raise CatalogImportError('Catalog imports through the API are not enabled')
+    path = resolve(os.path.realpath(root), relative)
+    check_manifest(path)
+    return path
+
+
+def check_manifest(path):
+    if not path.lower().endswith(MANIFEST_EXTENSIONS):
+        raise CatalogImportError(f'Manifests must be one of {", ".join(MANIFEST_EXTENSIONS)}')
+    if not os.path.isfile(path):
+        raise CatalogImportError(f'Manifest {path} not found')
+
+
+def read_manifest(path):
+    """Yield the rows of a manifest as dicts; unparsable JSON lines carry an ``_error``."""
+    with open(path, newline='', encoding='utf-8-sig') as manifest:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(manifest)
+            return
+        for line in manifest:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = {'_error': f'Invalid JSON: {exc}'}
+            yield row if isinstance(row, dict) else {'_error': 'Rows must be JSON objects'}
+
+
+def claim(catalog_import):
+    """Mark an import as running; fails if it is running elsewhere or finished."""
+    CatalogImport = apps.get_model('core', 'CatalogImport')
+    now = timezone.now()
+    # A runner refreshes updated_at after every batch, so a stale one has died.
+    claimed = CatalogImport.objects.filter(pk=catalog_import.pk).filter(
+        Q(status__in=[IMPORT_PENDING, IMPORT_FAILED])
+        | Q(status=IMPORT_RUNNING, updated_at__lt=now - timedelta(seconds=stale_seconds()))
+    ).update(status=IMPORT_RUNNING, updated_at=now)
+    if not claimed:
+        catalog_import.refresh_from_db()
+        raise CatalogImportError(f'The import is {catalog_import.status}')
+    catalog_import.status = IMPORT_RUNNING
+
+
+def owners(rows, user):
+    """Map the musician emails of a batch to users, in one query."""
+    emails = {(row.get('musician') or '').strip() for _, row in rows} - {''}
+    if not emails or not user.is_staff:
+        return {}
+    CustomUser = apps.get_model('core', 'CustomUser')
+    return {musician.email: musician for musician in CustomUser.objects.filter(email__in=emails, is_musician=True)}
+
+
+def prepare(import_id, user, base, musicians, number, row):
+    """Validate a row and copy its files into storage; returns the unsaved ``Track`` and bytes copied."""
+    from .serializers import TrackCreateSerializer
+
+    Track = apps.get_model('core', 'Track')
+    if '_error' in row:
+        raise CatalogImportError(row['_error'])
+    email = (row.get('musician') or '').strip()
+    musician = user
+    if email and email != user.email:
+        if not user.is_staff:
+            raise CatalogImportError('Only staff can import tracks for other musicians')
+        musician = musicians.get(email)
+        if musician is None:
+            raise CatalogImportError(f'No musician with email {email}')
+    if not musician.is_musician:
+        raise CatalogImportError('Only musicians can own tracks')
+
+    files = {}
+    try:
+        for field, column in (('audio_file', 'audio'), ('cover_image', 'cover')):
+            if row.get(column):
+                path = resolve(base, row[column])
+                if not os.path.isfile(path):
+                    raise CatalogImportError(f'{row[column]} not found')
+                files[field] = File(open(path, 'rb'), name=os.path.basename(path))
+        serializer = TrackCreateSerializer(data={
+            'title': row.get('title') or '',
+            'description': row.get('description') or '',
+            'genre': row.get('genre') or '',
+            **files,
+        })
+        if not serializer.is_valid():
+            raise CatalogImportError('; '.join(
+                f'{field}: {" ".join(str(error) for error in errors)}'
+                for field, errors in serializer.errors.items()
+            ))
+        data = serializer.validated_data
+        copied = 0
+        for field, upload in files.items():
+            storage = Track._meta.get_field(field).storage
+            upload_to = Track._meta.get_field(field).upload_to
+            name = storage.generate_filename(f'{upload_to}imports/{import_id}/{number}-{upload.name}')
+            if storage.exists(name):
+                storage.delete(name)  # copied by an earlier attempt of this batch
+            upload.seek(0)
+            data[field] = storage.save(name, upload)
+            copied += upload.size
+        return Track(musician=musician, **data), copied
+    finally:
+        for upload in files.values():
+            upload.close()
+
+
+def index(tracks):
+    Track = apps.get_model('core', 'Track')
+    if connections['default'].vendor == 'postgresql':
+        refresh_search_vectors(Track.objects.filter(pk__in=[track.pk for track in tracks]))
+    else:
+        for track in tracks:
+            track_index.update_track(track)
+    chart_engine.invalidate()
+    response_cache.invalidate(TRACKS)
+
+
+def run(catalog_import, process=True, progress=None, pool_size=None, size=None):
+    """
+    Import the rows from ``next_row`` on; the import must have been claimed.
+    ``progress(catalog_import, rows)`` is called after every batch.
+    """
+    from .processing import media_pipeline
+
+    CatalogImport = apps.get_model('core', 'CatalogImport')
+    Track = apps.get_model('core', 'Track')
+    pool_size = workers() if pool_size is None else pool_size
+    size = size or batch_size()
+    user = catalog_import.user  # loaded here: pool threads must not query
+    base = os.path.dirname(os.path.realpath(catalog_import.manifest))
+    pool = ThreadPoolExecutor(pool_size) if pool_size else None
+    status = IMPORT_FAILED
+    mark = time.perf_counter()
+    try:
+        check_manifest(catalog_import.manifest)
+        rows = itertools.islice(enumerate(read_manifest(catalog_import.manifest)), catalog_import.next_row, None)
+        while batch := list(itertools.islice(rows, size)):
+            musicians = owners(batch, user)
+
+            def attempt(item):
+                try:
+                    return prepare(catalog_import.pk, user, base, musicians, *item)
+                except CatalogImportError as exc:
+                    return exc
+
+            results = list(pool.map(attempt, batch) if pool else map(attempt, batch))
+            prepared = [result for result in results if not isinstance(result, Exception)]
+            errors = [
+                {'row': number, 'error': str(result)}
+                for (number, _), result in zip(batch, results) if isinstance(result, Exception)
+            ]
+            tracks = [track for track, _ in prepared]
+            catalog_import.errors = (catalog_import.errors + errors)[:MAX_ERRORS]
+            catalog_import.next_row = batch[-1][0] + 1
+            now = time.perf_counter()
+            elapsed, mark = now - mark, now
+            with transaction.atomic():
+                Track.objects.bulk_create(tracks)
+                CatalogImport.objects.filter(pk=catalog_import.pk).update(
+                    next_row=catalog_import.next_row,
+                    imported=F('imported') + len(tracks),
+                    rejected=F('rejected') + len(errors),
+                    bytes_copied=F('bytes_copied') + sum(copied for _, copied in prepared),
+                    errors=catalog_import.errors,
+                    seconds=F('seconds') + elapsed,
+                    updated_at=timezone.now(),
+                )
+            index(tracks)
+            if process:
+                for track in tracks:
+                    media_pipeline.submit(track.pk)
+            if progress is not None:
+                catalog_import.refresh_from_db(fields=['imported', 'rejected', 'bytes_copied', 'seconds'])
+                progress(catalog_import, len(batch))
+        status = IMPORT_DONE
+    except Exception:
+        logger.exception('Catalog import %s failed at row %s', catalog_import.pk, catalog_import.next_row)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        CatalogImport.objects.filter(pk=catalog_import.pk).update(
+            status=status,
+            seconds=F('seconds') + (time.perf_counter() - mark),
+            updated_at=timezone.now(),
+        )
+        catalog_import.refresh_from_db(fields=[
+            'status', 'next_row', 'imported', 'rejected', 'bytes_copied', 'errors', 'seconds', 'updated_at',
+        ])
+
+
+def start(catalog_import):
+    """Claim and run an import for the API: inline without workers, else in a background thread."""
+    claim(catalog_import)
+    if not workers():
+        try:
+            run(catalog_import)
+        except Exception:
+            pass  # recorded on the import
+        return
+    threading.Thread(target=_run_in_background, args=(catalog_import.pk,), daemon=True).start()
+
+
+def _run_in_background(pk):
+    CatalogImport = apps.get_model('core', 'CatalogImport')
+    try:
+        run(CatalogImport.objects.select_related('user').get(pk=pk))
+    except Exception:
+        pass  # logged and recorded on the import
+    finally:
+        connections.close_all()
@@ -0,0 +1,282 @@
+import json
+import random
+import subprocess
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import benchmarking
+from core.counters import counters
+from core.events import play_events
+from core.models import CustomUser, Playlist, PlaylistTrack, Track
+
+# Scenario name -> share of the request mix in the load test (reads only: the load client only GETs).
+SCENARIOS = {
+    'track_list': 0.2,
+    'track_trending': 0.1,
+    'track_search': 0.1,
+    'charts': 0.15,
+    'recommendations': 0.15,
+    'playlist_detail': 0.3,
+    'play': 0,
+    'like': 0,
+    'playlist_add': 0,
+    'playlist_remove': 0,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a realistic catalog and measure the API scenario by scenario: latency percentiles and '
+        'queries per request, optionally saved as JSON and compared with an earlier run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=100000)
+        parser.add_argument('--musicians', type=int, default=1000)
+        parser.add_argument('--listeners', type=int, default=1000)
+        parser.add_argument('--playlists', type=int, default=2000)
+        parser.add_argument('--playlist-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--no-response-cache', action='store_true',
+                            help='Measure every read against the database')
+        parser.add_argument('--clients', type=int, nargs='*', default=[],
+                            help='Also run an HTTP load test of the read mix with this many clients')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each load test')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded data; later runs with the same volumes reuse it')
+        parser.add_argument('--json', help='Write the report to this file')
+        parser.add_argument('--compare', help='Compare with the report of an earlier run')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Relative p95 slowdown counted as a regression (as are extra queries)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        tag = 'bench-api'
+        try:
+            started = time.perf_counter()
+            data = self.seed(tag, options)
+            self.stdout.write(
+                f'{data["tracks"]} tracks, {data["musicians"]} musicians, {data["listeners"]} listeners, '
+                f'{data["playlists"]} playlists with {data["playlist_tracks"]} entries '
+                f'(ready in {time.perf_counter() - started:.0f} s)'
+            )
+            with override_settings(ALLOWED_HOSTS=['*'],
+                                   RESPONSE_CACHE_ENABLED=not options['no_response_cache']):
+                report = {
+                    'commit': self.commit(),
+                    'created_at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'response_cache': not options['no_response_cache'],
+                    'dataset': {name: data[name] for name in (
+                        'tracks', 'musicians', 'listeners', 'playlists', 'playlist_tracks'
+                    )},
+                    'scenarios': self.run_scenarios(data, options),
+                    'load': self.run_load(data, options),
+                }
+        finally:
+            counters.flush()
+            play_events.flush()
+            if not options['keep']:
+                benchmarking.cleanup(tag)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Report written to {options["json"]}')
+        if baseline is not None:
+            regressions = self.compare(baseline, report, options['tolerance'])
+            if regressions:
+                raise CommandError(f'{len(regressions)} scenario(s) regressed: {", ".join(regressions)}')
+
+    def seed(self, tag, options):
+        musicians = CustomUser.objects.filter(
+            email__endswith='@bench.invalid', username__startswith=f'{tag}-', is_musician=True
+        )
+        musician_ids = list(musicians.values_list('id', flat=True))
+        tracks = Track.objects.filter(musician_id__in=musicians)
+        listeners = CustomUser.objects.filter(
+            email__endswith='@bench.invalid', username__startswith=f'{tag}-listener-'
+        )
+        seeded = (len(musician_ids), tracks.count(), listeners.count(),
+                  Playlist.objects.filter(user__in=listeners).count())
+        wanted = (options['musicians'], options['tracks'], options['listeners'], options['playlists'])
+        if seeded != wanted:
+            benchmarking.cleanup(tag)
+            musician_ids = benchmarking.seed_musicians(options['musicians'], tag=tag)
+            benchmarking.seed_tracks(options['tracks'], musician_ids)
+            listener_ids = benchmarking.seed_listeners(options['listeners'], tag=tag)
+            benchmarking.seed_playlists(
+                listener_ids, list(tracks.values_list('id', flat=True)), options['playlists'],
+                options['playlist_size'],
+            )
+        else:
+            self.stdout.write('Reusing the data of an earlier --keep run')
+        playlists = {}
+        for playlist_id, user_id in Playlist.objects.filter(user__in=listeners).values_list('id', 'user_id'):
+            playlists.setdefault(user_id, []).append(playlist_id)
+        if not playlists:
+            raise CommandError('The benchmark needs at least one playlist (--listeners, --playlists)')
+        users = CustomUser.objects.in_bulk(list(playlists))
+        return {
+            'tracks': tracks.count(),
+            'musicians': len(musician_ids),
+            'listeners': listeners.count(),
+            'playlists': sum(len(ids) for ids in playlists.values()),
+            'playlist_tracks': PlaylistTrack.objects.filter(playlist__user__in=listeners).count(),
+            'track_ids': list(tracks.filter(is_active=True).values_list('id', flat=True)),
+            'listener_playlists': [
+                (f'Bearer {AccessToken.for_user(users[user_id])}', playlist_ids)
+                for user_id, playlist_ids in playlists.items()
+            ],
+        }
+
+    @staticmethod
+    def popular(rng, track_ids):
+        """A track, biased towards the start of the list like real listening."""
+        return track_ids[int(len(track_ids) * rng.random() ** 3)]
+
+    def request(self, name, rng, data):
+        """The ``(method, path, data, auth)`` of one request of a scenario."""
+        auth, playlist_ids = rng.choice(data['listener_playlists'])
+        track_ids = data['track_ids']
+        if name == 'track_list':
+            return 'get', '/api/tracks/', {'genre': rng.choice(benchmarking.GENRES)}, auth
+        if name == 'track_trending':
+            genre = rng.choice([None] + benchmarking.GENRES)
+            return 'get', '/api/tracks/', {'sort': 'trending', **({'genre': genre} if genre else {})}, auth
+        if name == 'track_search':
+            words = ' '.join(rng.sample(benchmarking.WORDS, rng.randint(1, 2)))
+            return 'get', '/api/tracks/', {'search': words}, auth
+        if name == 'charts':
+            genre = rng.choice([None] + benchmarking.GENRES)
+            return 'get', '/api/tracks/charts/', {'genre': genre} if genre else {}, auth
+        if name == 'recommendations':
+            return 'get', '/api/tracks/recommendations/', {}, auth
+        if name == 'playlist_detail':
+            return 'get', f'/api/playlists/{rng.choice(playlist_ids)}/', {}, auth
+        if name in ('play', 'like'):
+            return 'post', f'/api/tracks/{self.popular(rng, track_ids)}/{name}/', {}, auth
+        playlist_id = rng.choice(playlist_ids)
+        if name == 'playlist_add':
+            payload = {'track_ids': [self.popular(rng, track_ids) for _ in range(5)]}
+            return 'post', f'/api/playlists/{playlist_id}/add_tracks/', payload, auth
+        present = list(
+            PlaylistTrack.objects.filter(playlist_id=playlist_id).values_list('track_id', flat=True)[:50]
+        )
+        payload = {'track_ids': rng.sample(present, min(5, len(present)))}
+        return 'post', f'/api/playlists/{playlist_id}/remove_tracks/', payload, auth
+
+    @staticmethod
+    def send(client, method, path, data, auth):
+        if method == 'get':
+            return client.get(path, data, HTTP_AUTHORIZATION=auth)
+        return client.post(path, data, format='json', HTTP_AUTHORIZATION=auth)
+
+    def run_scenarios(self, data, options):
+        results = {}
+        client = APIClient()
+        self.stdout.write(f'{"scenario":<17}{"p50":>10}{"p95":>10}{"p99":>10}{"queries":>9}{"max":>5}')
+        for name in options['scenarios']:
+            rng = random.Random(name)
+            # Warm up: the first search builds the index, the first chart read the charts.
+            self.send(client, *self.request(name, rng, data))
+            latencies, queries, errors = [], [], 0
+            for _ in range(options['repeat']):
+                request = self.request(name, rng, data)
+                response = None
+
+                def call():
+                    nonlocal response
+                    response = self.send(client, *request)
+
+                started = time.perf_counter()
+                queries.append(benchmarking.count_queries(call))
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+            stats = benchmarking.summarize(latencies)
+            results[name] = {
+                **stats,
+                'requests': len(latencies),
+                'errors': errors,
+                'queries': sum(queries) / len(queries),
+                'max_queries': max(queries),
+            }
+            self.stdout.write(
+                f'{name:<17}{stats["p50"]:>7.1f} ms{stats["p95"]:>7.1f} ms{stats["p99"]:>7.1f} ms'
+                f'{results[name]["queries"]:>9.1f}{max(queries):>5}' + (f'  errors={errors}' if errors else '')
+            )
+        return results
+
+    def run_load(self, data, options):
+        if not options['clients']:
+            return {}
+        names = [name for name, share in SCENARIOS.items() if share]
+        weights = [SCENARIOS[name] for name in names]
+        results = {}
+        server, base_url = benchmarking.serve()
+        try:
+            def next_request(rng):
+                _, path, params, auth = self.request(rng.choices(names, weights)[0], rng, data)
+                query = f'?{urlencode(params)}' if params else ''
+                return f'{base_url}{path}{query}', {'Authorization': auth}
+
+            self.stdout.write(f'{"clients":>7}{"req/s":>10}{"p50":>10}{"p95":>10}{"p99":>10}')
+            for clients in options['clients']:
+                latencies, errors, elapsed = benchmarking.load(next_request, clients, options['seconds'])
+                stats = benchmarking.summarize(latencies)
+                results[str(clients)] = {**stats, 'throughput': len(latencies) / elapsed, 'errors': errors}
+                self.stdout.write(
+                    f'{clients:>7}{len(latencies) / elapsed:>10.1f}'
+                    f'{stats["p50"]:>7.1f} ms{stats["p95"]:>7.1f} ms{stats["p99"]:>7.1f} ms'
+                    + (f'  errors={errors}' if errors else '')
+                )
+        finally:
+            server.shutdown()
+        return results
+
+    @staticmethod
+    def commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, baseline, report, tolerance):
+        """Print the change of every scenario against ``baseline``; returns the regressed ones."""
+        self.stdout.write(f'Compared with {baseline.get("commit") or "the baseline"}:')
+        self.stdout.write(f'{"scenario":<17}{"p50":>9}{"p95":>9}{"p99":>9}{"queries":>14}')
+        regressions = []
+        for name, current in report['scenarios'].items():
+            before = baseline.get('scenarios', {}).get(name)
+            if before is None:
+                continue
+            changes = [
+                (current[pct] - before[pct]) / before[pct] if before[pct] else 0.0
+                for pct in ('p50', 'p95', 'p99')
+            ]
+            # Averages move a little between runs as the data changes; an extra query per request does not.
+            regressed = changes[1] > tolerance or current['queries'] > before['queries'] + 0.5
+            if regressed:
+                regressions.append(name)
+            self.stdout.write(
+                f'{name:<17}' + ''.join(f'{change:>+8.0%} ' for change in changes)
+                + f'{before["queries"]:>6.1f} -> {current["queries"]:<5.1f}'
+                + ('  REGRESSED' if regressed else '')
+            )
+        return regressions
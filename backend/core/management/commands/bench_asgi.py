@@ -0,0 +1,93 @@
+import os
+import random
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import benchmarking
+from core.models import CustomUser, Playlist, Track
+
+# Bytes per seek request
+SEEK_CHUNK = 65536
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync endpoints under WSGI with the async ones under uvicorn (one process each)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--clients', type=int, nargs='+', default=[8, 64])
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--size-kb', type=int, default=512,
+                            help=f'Size of the streamed audio file (more than {SEEK_CHUNK // 1024})')
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('The ASGI benchmark needs uvicorn (pip install uvicorn)')
+        if options['size_kb'] * 1024 <= SEEK_CHUNK:
+            raise CommandError(f'--size-kb must be more than {SEEK_CHUNK // 1024} (the seek size)')
+        tag = 'bench-asgi'
+        name = f'tracks/bench-{uuid.uuid4().hex[:8]}.mp3'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(options['size_kb'] * 1024))
+        try:
+            user_ids = benchmarking.seed_musicians(options['users'], tag=tag)
+            benchmarking.seed_tracks(options['tracks'], user_ids)
+            Track.objects.filter(musician_id__in=user_ids).update(audio_file=name)
+            track_ids = list(Track.objects.filter(musician_id__in=user_ids).values_list('id', flat=True))
+            rng = random.Random(0)
+            listeners = []
+            for user in CustomUser.objects.filter(pk__in=user_ids):
+                playlist = Playlist.objects.create(user=user, name='bench')
+                playlist.add_tracks(rng.sample(track_ids, 50))
+                listeners.append((f'Bearer {AccessToken.for_user(user)}', playlist.pk))
+
+            wsgi, wsgi_url = benchmarking.serve()
+            asgi, asgi_url = benchmarking.serve_asgi()
+            try:
+                self.stdout.write(f'{"clients":>7} {"server":<6}{"req/s":>10}{"p50":>10}{"p95":>10}{"p99":>10}')
+                for clients in options['clients']:
+                    for label, base_url in (('wsgi', f'{wsgi_url}/api/'), ('asgi', f'{asgi_url}/api/async/')):
+                        latencies, errors, elapsed = benchmarking.load(
+                            lambda rng: self.next_request(rng, base_url, listeners, track_ids, options),
+                            clients, options['seconds'],
+                        )
+                        stats = benchmarking.summarize(latencies)
+                        self.stdout.write(
+                            f'{clients:>7} {label:<6}{len(latencies) / elapsed:>10.1f}'
+                            f'{stats["p50"]:>7.1f} ms{stats["p95"]:>7.1f} ms{stats["p99"]:>7.1f} ms'
+                            + (f'  errors={errors}' if errors else '')
+                        )
+            finally:
+                wsgi.shutdown()
+                asgi.shutdown()
+        finally:
+            benchmarking.cleanup(tag)
+            os.remove(path)
+
+    @staticmethod
+    def next_request(rng, base_url, listeners, track_ids, options):
+        """A read mix over the async endpoints: catalog, charts, recommendations, playlists, seeks."""
+        token, playlist_id = rng.choice(listeners)
+        headers = {'Authorization': token}
+        kind = rng.random()
+        if kind < 0.3:
+            path = f'tracks/?genre={rng.choice(benchmarking.GENRES)}'
+        elif kind < 0.45:
+            path = 'tracks/charts/'
+        elif kind < 0.6:
+            path = 'tracks/recommendations/'
+        elif kind < 0.8:
+            path = f'playlists/{playlist_id}/'
+        else:
+            path = f'tracks/{rng.choice(track_ids)}/stream/'
+            start = rng.randrange(max(options['size_kb'] * 1024 - SEEK_CHUNK, 1))
+            headers['Range'] = f'bytes={start}-{start + SEEK_CHUNK - 1}'
+        return base_url + path.replace('R&B', 'R%26B'), headers
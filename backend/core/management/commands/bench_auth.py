@@ -0,0 +1,55 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import benchmarking
+from core.authentication import CachedJWTAuthentication
+from core.models import CustomUser, Playlist, Track
+from core.views import PlaylistViewSet, TrackViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and latency per request with and without the cached JWT user lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        tag = 'bench-auth'
+        factory = APIRequestFactory()
+        try:
+            user_ids = benchmarking.seed_musicians(2, tag=tag)
+            benchmarking.seed_tracks(options['tracks'], user_ids)
+            user = CustomUser.objects.get(pk=user_ids[0])
+            track = Track.objects.filter(musician_id__in=user_ids).first()
+            Playlist.objects.create(user=user, name='bench')
+            auth = f'Bearer {AccessToken.for_user(user)}'
+            endpoints = [
+                ('play', 'post', f'/api/tracks/{track.pk}/play/', TrackViewSet, {'post': 'play'}, {'pk': track.pk}),
+                ('tracks', 'get', '/api/tracks/?genre=Pop', TrackViewSet, {'get': 'list'}, {}),
+                ('playlists', 'get', '/api/playlists/', PlaylistViewSet, {'get': 'list'}, {}),
+            ]
+            self.stdout.write(f'{"endpoint":<10} {"backend":<8}{"queries":>8}{"p50":>10}{"p95":>10}{"p99":>10}')
+            for name, method, url, viewset, actions, kwargs in endpoints:
+                for label, backend in (('jwt', JWTAuthentication), ('cached', CachedJWTAuthentication)):
+                    cache.clear()
+                    view = viewset.as_view(actions, authentication_classes=[backend])
+
+                    def run():
+                        request = getattr(factory, method)(url, HTTP_AUTHORIZATION=auth, SERVER_NAME='localhost')
+                        response = view(request, **kwargs)
+                        assert response.status_code < 300, response.data
+                        return response
+
+                    run()  # warm the response cache and the user cache alike
+                    queries = benchmarking.count_queries(run)
+                    stats = benchmarking.summarize(benchmarking.measure(run, options['repeat']))
+                    self.stdout.write(
+                        f'{name:<10} {label:<8}{queries:>8}'
+                        f'{stats["p50"]:>7.2f} ms{stats["p95"]:>7.2f} ms{stats["p99"]:>7.2f} ms'
+                    )
+        finally:
+            benchmarking.cleanup(tag)
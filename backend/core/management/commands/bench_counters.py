@@ -0,0 +1,78 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.counters import CounterBuffer
+from core.models import CustomUser, Track
+
+
+class Command(BaseCommand):
+    help = 'Benchmark plays/sec on a single hot track: per-request row writes vs. the counter buffer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Flush interval for the buffered run')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        musician = CustomUser.objects.create_user(
+            email=f'bench-{tag}@example.com', username=f'bench-{tag}',
+            password=None, is_musician=True
+        )
+        track = Track.objects.create(
+            musician=musician, title='bench', description='', genre='Pop',
+            audio_file='tracks/bench.mp3'
+        )
+        try:
+            self.report('row writes', track, options, self.direct_play)
+            buffer = CounterBuffer(interval=options['interval'])
+            self.report('buffered', track, options,
+                        lambda pk: buffer.increment(pk, 'plays'), buffer)
+        finally:
+            musician.delete()
+
+    @staticmethod
+    def direct_play(pk):
+        # What Track.increment_plays() used to do: read, add, save the row.
+        track = Track.objects.get(pk=pk)
+        track.plays += 1
+        track.save(update_fields=['plays'])
+
+    def report(self, label, track, options, play, buffer=None):
+        Track.objects.filter(pk=track.pk).update(plays=0)
+        deadline = time.perf_counter() + options['seconds']
+        sent = [0] * options['threads']
+        errors = [0] * options['threads']
+
+        def worker(n):
+            try:
+                while time.perf_counter() < deadline:
+                    try:
+                        play(track.pk)
+                        sent[n] += 1
+                    except Exception:
+                        errors[n] += 1
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if buffer is not None:
+            buffer.stop()
+        elapsed = time.perf_counter() - started
+
+        stored = Track.objects.get(pk=track.pk).plays
+        total = sum(sent)
+        self.stdout.write(
+            f'{label:>12}: {total / elapsed:12.0f} plays/sec  '
+            f'sent={total} stored={stored} lost={total - stored} errors={sum(errors)}'
+        )
@@ -0,0 +1,72 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import benchmarking, events
+from core.analytics import bucket_starts
+from core.events import DAY
+from core.models import CustomUser, MusicianPlayRollup, Track, TrackPlayRollup
+from core.views import MusicianDashboardView
+
+
+class Command(BaseCommand):
+    help = 'Measure the musician dashboard for musicians with large catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, nargs='+', default=[1000, 5000])
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        tag = 'bench-dashboard'
+        rng = random.Random(0)
+        view = MusicianDashboardView.as_view()
+        factory = APIRequestFactory()
+        try:
+            self.stdout.write(f'{"tracks":>7} {"window":<10}{"queries":>8}{"p50":>10}{"p95":>10}{"p99":>10}')
+            for size in options['tracks']:
+                musician_id, = benchmarking.seed_musicians(1, tag=f'{tag}-{size}')
+                benchmarking.seed_tracks(size, [musician_id])
+                self.seed_rollups(musician_id, max(events.WINDOWS), rng)
+                refresh = benchmarking.measure(events.refresh_windows, 1)[0]
+                self.stdout.write(f'{size:>7} refreshing the top track windows took {refresh:.0f} ms')
+                musician = CustomUser.objects.get(pk=musician_id)
+                for days in events.WINDOWS:
+                    def run():
+                        request = factory.get(f'/api/musicians/{musician_id}/dashboard/?days={days}')
+                        force_authenticate(request, musician)
+                        response = view(request, pk=musician_id)
+                        assert response.status_code == 200, response.data
+                        return response
+
+                    queries = benchmarking.count_queries(run)
+                    stats = benchmarking.summarize(benchmarking.measure(run, options['repeat']))
+                    self.stdout.write(
+                        f'{size:>7} {f"{days} days":<10}{queries:>8}'
+                        f'{stats["p50"]:>7.1f} ms{stats["p95"]:>7.1f} ms{stats["p99"]:>7.1f} ms'
+                    )
+        finally:
+            benchmarking.cleanup(tag)
+
+    @staticmethod
+    def seed_rollups(musician_id, days, rng):
+        """Daily rollups for every track on every day, plus the musician's totals."""
+        track_ids = list(Track.objects.filter(musician_id=musician_id).values_list('id', flat=True))
+        buckets = bucket_starts(DAY, days)
+        totals = dict.fromkeys(buckets, 0)
+        for bucket in buckets:
+            rows = []
+            for track_id in track_ids:
+                plays = int(rng.paretovariate(1.5))
+                totals[bucket] += plays
+                rows.append(TrackPlayRollup(
+                    track_id=track_id, granularity=DAY, bucket=bucket, plays=plays, listeners=plays,
+                ))
+            with transaction.atomic():
+                TrackPlayRollup.objects.bulk_create(rows, batch_size=5000)
+        MusicianPlayRollup.objects.bulk_create(
+            MusicianPlayRollup(musician_id=musician_id, granularity=DAY, bucket=bucket,
+                               plays=plays, listeners=plays // 2)
+            for bucket, plays in totals.items()
+        )
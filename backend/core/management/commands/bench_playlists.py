@@ -0,0 +1,92 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import benchmarking
+from core.models import Playlist, PlaylistTrack, Track
+
+
+class Command(BaseCommand):
+    help = 'Benchmark filling, reordering and moving tracks in large playlists: per-row loops vs. bulk operations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, nargs='+', default=[500, 5000])
+        parser.add_argument('--moves', type=int, default=200)
+        parser.add_argument('--legacy-moves', type=int, default=5,
+                            help='Moves replayed the old way (each rewrites the whole playlist)')
+
+    def handle(self, *args, **options):
+        tag = 'bench-playlists'
+        rng = random.Random(0)
+        try:
+            musician_ids = benchmarking.seed_musicians(1, tag=tag)
+            benchmarking.seed_tracks(max(options['tracks']), musician_ids)
+            all_ids = list(Track.objects.filter(musician_id__in=musician_ids).values_list('id', flat=True))
+            self.stdout.write(f'{"tracks":>7} {"operation":<22}{"legacy":>21}{"bulk":>21}')
+            for size in options['tracks']:
+                track_ids = all_ids[:size]
+                legacy = Playlist.objects.create(user_id=musician_ids[0], name='legacy')
+                bulk = Playlist.objects.create(user_id=musician_ids[0], name='bulk')
+
+                self.row('add all', size, self.run(lambda: self.legacy_add(legacy, track_ids)),
+                         self.run(lambda: bulk.add_tracks(track_ids)))
+                shuffled = track_ids[:]
+                rng.shuffle(shuffled)
+                self.row('reorder all', size, self.run(lambda: self.legacy_reorder(legacy, shuffled)),
+                         self.run(lambda: bulk.reorder_tracks(shuffled)))
+                moves = [(rng.choice(track_ids), rng.randrange(size)) for _ in range(options['moves'])]
+                legacy_moves = moves[:options['legacy_moves']]
+                # The path behind reorder_tracks with track_id and position.
+                self.row('move one (avg)', size,
+                         self.run(lambda: self.legacy_moves(legacy, legacy_moves), len(legacy_moves)),
+                         self.run(lambda: [bulk.move_track(*move) for move in moves], len(moves)))
+                self.row('remove half', size,
+                         self.run(lambda: [legacy.remove_track(Track(pk=pk)) for pk in track_ids[::2]]),
+                         self.run(lambda: bulk.remove_tracks(track_ids[::2])))
+        finally:
+            benchmarking.cleanup(tag)
+
+    @staticmethod
+    def run(func, repeat=1):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        return elapsed / max(repeat, 1), len(queries) / max(repeat, 1)
+
+    def row(self, label, size, legacy, bulk):
+        cells = [f'{seconds * 1000:9.1f} ms {count:>6.0f} q' for seconds, count in (legacy, bulk)]
+        self.stdout.write(f'{size:>7} {label:<22}{cells[0]:>21}{cells[1]:>21}')
+
+    # What the playlist endpoints used to do, one row at a time.
+
+    @staticmethod
+    def legacy_add(playlist, track_ids):
+        for track_id in track_ids:
+            PlaylistTrack.objects.create(
+                playlist=playlist, track_id=track_id, order=playlist.tracks.count() + 1
+            )
+
+    @staticmethod
+    def legacy_reorder(playlist, track_ids):
+        for order, track_id in enumerate(track_ids, 1):
+            PlaylistTrack.objects.filter(playlist=playlist, track_id=track_id).update(order=order)
+
+    @classmethod
+    def legacy_moves(cls, playlist, moves):
+        # With dense orders a move means rewriting every entry's position.
+        for track_id, position in moves:
+            current = list(
+                PlaylistTrack.objects.filter(playlist=playlist).exclude(track_id=track_id)
+                .order_by('order').values_list('track_id', flat=True)
+            )
+            current.insert(position, track_id)
+            cls.legacy_reorder(playlist, current)
@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import benchmarking, recommendations
+from core.models import CustomUser, UserRecommendations
+
+
+class Command(BaseCommand):
+    help = 'Benchmark recommendation build time vs. catalog size, and serve latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalog', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--playlist-length', type=int, default=20)
+        parser.add_argument('--users', type=int, default=500, help='Users seeded for the serve test')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        length = options['playlist_length']
+        self.stdout.write(f'{"tracks":>10}{"playlists":>12}{"users":>10}{"build":>12}')
+        for tracks in options['catalog']:
+            playlists = max(1, tracks // 2)
+            users = max(1, playlists // 2)
+            # Zipf-ish popularity so co-occurrence is concentrated like real playlists.
+            track_ids = (rng.zipf(1.3, playlists * length) % tracks) + 1
+            playlist_ids = np.repeat(np.arange(playlists), length)
+            user_ids = playlist_ids % users
+            rows = np.unique(np.column_stack([playlist_ids, user_ids, track_ids]), axis=0)
+            started = time.perf_counter()
+            result = recommendations.compute(rows, np.arange(1, tracks + 1), recommendations.stored_size())
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{tracks:>10}{playlists:>12}{len(result):>10}{elapsed:>10.2f} s')
+
+        tag = 'bench-recs'
+        try:
+            user_ids = benchmarking.seed_musicians(options['users'], tag=tag)
+            now = timezone.now()
+            UserRecommendations.objects.bulk_create([
+                UserRecommendations(
+                    user_id=user_id, built_at=now,
+                    track_ids=recommendations.pack(rng.integers(1, 10**6, recommendations.stored_size())),
+                )
+                for user_id in user_ids
+            ])
+            users = list(CustomUser.objects.filter(pk__in=user_ids))
+            samples = benchmarking.measure(
+                lambda: recommendations.recommended_ids(users[rng.integers(len(users))]),
+                options['repeat'],
+            )
+            stats = benchmarking.summarize(samples)
+            self.stdout.write(
+                f'serve lookup: p50 {stats["p50"]:.2f} ms  p95 {stats["p95"]:.2f} ms  p99 {stats["p99"]:.2f} ms'
+            )
+        finally:
+            benchmarking.cleanup(tag)
@@ -0,0 +1,96 @@
+import json
+import random
+import threading
+import time
+import urllib.request
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import benchmarking
+from core.models import CustomUser, Playlist, Track
+from core.response_cache import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Load test track and playlist reads with the response cache disabled and enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        tag = 'bench-cache'
+        try:
+            user_ids = benchmarking.seed_musicians(options['users'], tag=tag)
+            benchmarking.seed_tracks(options['tracks'], user_ids)
+            track_ids = list(Track.objects.filter(musician_id__in=user_ids).values_list('id', flat=True))
+            rng = random.Random(0)
+            playlists = {}
+            for user in CustomUser.objects.filter(pk__in=user_ids):
+                playlist = Playlist.objects.create(user=user, name='bench')
+                playlist.add_tracks(rng.sample(track_ids, 50))
+                playlists[str(AccessToken.for_user(user))] = playlist.pk
+
+            server, base_url = benchmarking.serve()
+            try:
+                for enabled in (False, True):
+                    with override_settings(RESPONSE_CACHE_ENABLED=enabled):
+                        self.run('cached' if enabled else 'uncached', base_url, playlists, track_ids, options)
+            finally:
+                server.shutdown()
+        finally:
+            benchmarking.cleanup(tag)
+
+    def requests(self, rng, playlists, track_ids):
+        """A read mix: catalog pages, popular track details, the listener's playlist."""
+        token = rng.choice(list(playlists))
+        kind = rng.random()
+        if kind < 0.4:
+            genre = rng.choice(benchmarking.GENRES)
+            return token, f'/api/tracks/?genre={urllib.request.quote(genre)}'
+        if kind < 0.8:
+            # Skewed towards a head of popular tracks, like real traffic.
+            return token, f'/api/tracks/{track_ids[min(int(rng.paretovariate(1.0)) - 1, len(track_ids) - 1)]}/'
+        return token, f'/api/playlists/{playlists[token]}/'
+
+    def run(self, label, base_url, playlists, track_ids, options):
+        response_cache.reset_stats()
+        deadline = time.perf_counter() + options['seconds']
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+
+        def client(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                token, path = self.requests(rng, playlists, track_ids)
+                request = urllib.request.Request(base_url + path, headers={'Authorization': f'Bearer {token}'})
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request) as response:
+                        json.loads(response.read())
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(options['clients'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stats = benchmarking.summarize(latencies)
+        hits = sum(counts['hits'] for counts in response_cache.stats().values())
+        self.stdout.write(
+            f'{label:>9}: {len(latencies) / elapsed:8.1f} req/s  p50 {stats["p50"]:.1f} ms  '
+            f'p95 {stats["p95"]:.1f} ms  p99 {stats["p99"]:.1f} ms  '
+            f'hit ratio {hits / max(len(latencies), 1):.0%}  errors={errors[0]}'
+        )
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core import benchmarking
+from core.models import Track
+from core.search import refresh_search_vectors, search_tracks, track_index
+
+QUERIES = ['neon', 'midnight river', 'lov', 'thundr', 'electric soul groove', 'ghost']
+
+
+class Command(BaseCommand):
+    help = 'Compare ranked track search against the old icontains filter on a seeded catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=1_000_000)
+        parser.add_argument('--musicians', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=50, help='Rows fetched per query, as one page')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data afterwards')
+
+    def handle(self, *args, **options):
+        tag = 'bench-search'
+        if not Track.objects.filter(musician__username__startswith=f'{tag}-').exists():
+            started = time.perf_counter()
+            musician_ids = benchmarking.seed_musicians(options['musicians'], tag=tag)
+            benchmarking.seed_tracks(options['tracks'], musician_ids)
+            refresh_search_vectors(Track.objects.filter(search_vector__isnull=True))
+            self.stdout.write(f'seeded {options["tracks"]} tracks in {time.perf_counter() - started:.1f}s')
+
+        try:
+            started = time.perf_counter()
+            track_index.reset()
+            search_tracks(Track.objects.all(), 'warmup').exists()
+            self.stdout.write(f'search ready in {time.perf_counter() - started:.1f}s')
+
+            limit = options['limit']
+            base = Track.objects.filter(is_active=True).select_related('musician')
+            self.stdout.write(f'{"query":<24}{"icontains p50":>16}{"search p50":>14}{"hits":>8}')
+            for text in QUERIES:
+                def old():
+                    return list(base.filter(
+                        Q(title__icontains=text) | Q(description__icontains=text)
+                    ).order_by('-plays', '-created_at')[:limit])
+
+                def new():
+                    return list(search_tracks(base, text).order_by('-search_rank', '-id')[:limit])
+
+                old_ms = benchmarking.summarize(benchmarking.measure(old, options['repeat']))
+                new_ms = benchmarking.summarize(benchmarking.measure(new, options['repeat']))
+                self.stdout.write(
+                    f'{text:<24}{old_ms["p50"]:>13.1f} ms{new_ms["p50"]:>11.1f} ms{len(new()):>8}'
+                )
+        finally:
+            if not options['keep']:
+                benchmarking.cleanup(tag)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core import benchmarking
+from core.models import Track
+from core.serializers import FastTrackSerializer, TrackSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare TrackSerializer with the values()-based fast path on large track lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        tag = 'bench-serializers'
+        request = Request(APIRequestFactory().get('/api/tracks/', SERVER_NAME='localhost'))
+        try:
+            musician_ids = benchmarking.seed_musicians(20, tag=tag)
+            benchmarking.seed_tracks(max(options['tracks']), musician_ids)
+            queryset = Track.objects.filter(musician_id__in=musician_ids).order_by('-plays', '-id')
+            self.stdout.write(f'{"tracks":>7} {"path":<26}{"p50":>10}{"p95":>10}{"p99":>10}')
+            for size in options['tracks']:
+                instances = list(queryset.select_related('musician')[:size])
+                fast = FastTrackSerializer(request)
+                rows = list(fast.rows(queryset)[:size])
+                cases = [
+                    ('TrackSerializer', lambda: TrackSerializer(
+                        list(queryset.select_related('musician')[:size]), many=True,
+                        context={'request': request}).data),
+                    ('  serialize only', lambda: TrackSerializer(
+                        instances, many=True, context={'request': request}).data),
+                    ('FastTrackSerializer', lambda: FastTrackSerializer(request).serialize(
+                        fast.rows(queryset)[:size])),
+                    ('  serialize only', lambda: FastTrackSerializer(request).serialize(rows)),
+                ]
+                for label, run in cases:
+                    stats = benchmarking.summarize(benchmarking.measure(run, options['repeat']))
+                    self.stdout.write(
+                        f'{size:>7} {label:<26}{stats["p50"]:>7.1f} ms{stats["p95"]:>7.1f} ms{stats["p99"]:>7.1f} ms'
+                    )
+        finally:
+            benchmarking.cleanup(tag)
@@ -0,0 +1,89 @@
+import os
+import random
+import threading
+import time
+import urllib.request
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import benchmarking
+from core.models import CustomUser, Track
+
+
+class Command(BaseCommand):
+    help = 'Measure streaming throughput for concurrent listeners (full downloads and seeks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listeners', type=int, default=32)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--size-mb', type=int, default=20)
+        parser.add_argument('--chunk-kb', type=int, default=256, help='Bytes per seek request')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        name = f'tracks/bench-{tag}.mp3'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = options['size_mb'] * 1024 * 1024
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+
+        musician = CustomUser.objects.create_user(
+            email=f'bench-stream-{tag}@bench.invalid', username=f'bench-stream-{tag}',
+            password=None, is_musician=True
+        )
+        track = Track.objects.create(
+            musician=musician, title='bench', description='', genre='Pop', audio_file=name
+        )
+        server, base_url = benchmarking.serve()
+        url = f'{base_url}/api/tracks/{track.pk}/stream/'
+        token = str(AccessToken.for_user(musician))
+        try:
+            for mode in ('seek', 'full'):
+                self.run(mode, url, token, size, options)
+        finally:
+            server.shutdown()
+            musician.delete()
+            os.remove(path)
+
+    def run(self, mode, url, token, size, options):
+        chunk = options['chunk_kb'] * 1024
+        deadline = time.perf_counter() + options['seconds']
+        latencies, transferred, errors = [], [0], [0]
+        lock = threading.Lock()
+
+        def listener(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                headers = {'Authorization': f'Bearer {token}'}
+                if mode == 'seek':
+                    start = rng.randrange(0, size - chunk)
+                    headers['Range'] = f'bytes={start}-{start + chunk - 1}'
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                        received = len(response.read())
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    transferred[0] += received
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=listener, args=(n,)) for n in range(options['listeners'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stats = benchmarking.summarize(latencies)
+        self.stdout.write(
+            f'{mode:>5}: {len(latencies) / elapsed:8.1f} req/s {transferred[0] / elapsed / 2**20:8.1f} MiB/s  '
+            f'p50 {stats["p50"]:.1f} ms  p99 {stats["p99"]:.1f} ms  errors={errors[0]}'
+        )
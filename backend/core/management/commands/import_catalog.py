@@ -0,0 +1,74 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import imports
+from core.models import CatalogImport, CustomUser
+from core.processing import media_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Import tracks in bulk from a CSV or JSON Lines manifest (see core/imports.py), or resume an import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', nargs='?', help='Manifest; audio and cover paths are relative to it')
+        parser.add_argument('--user', help='Email of the importing user (owner of rows without a musician)')
+        parser.add_argument('--resume', type=int, metavar='ID', help='Continue an earlier import')
+        parser.add_argument('--workers', type=int, help='Validation and copy threads')
+        parser.add_argument('--batch-size', type=int, help='Rows inserted per transaction')
+        parser.add_argument('--no-processing', action='store_true',
+                            help='Leave the new tracks pending (run process_media later)')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                catalog_import = CatalogImport.objects.select_related('user').get(pk=options['resume'])
+            except CatalogImport.DoesNotExist:
+                raise CommandError(f'No import {options["resume"]}')
+        else:
+            if not options['manifest'] or not options['user']:
+                raise CommandError('Give a manifest and --user, or --resume')
+            try:
+                user = CustomUser.objects.get(email=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f'No user with email {options["user"]}')
+            path = os.path.realpath(options['manifest'])
+            try:
+                imports.check_manifest(path)
+            except imports.CatalogImportError as exc:
+                raise CommandError(str(exc))
+            catalog_import = CatalogImport.objects.create(user=user, manifest=path)
+            self.stdout.write(f'Import {catalog_import.pk} of {path}')
+
+        try:
+            imports.claim(catalog_import)
+        except imports.CatalogImportError as exc:
+            raise CommandError(str(exc))
+        process = not options['no_processing']
+        try:
+            imports.run(
+                catalog_import, process=process, progress=self.progress,
+                pool_size=options['workers'], size=options['batch_size'],
+            )
+        except Exception as exc:
+            raise CommandError(
+                f'Import {catalog_import.pk} failed at row {catalog_import.next_row}: {exc}; '
+                f'continue with --resume {catalog_import.pk}'
+            )
+        finally:
+            if process:
+                media_pipeline.shutdown()
+        for error in catalog_import.errors:
+            self.stdout.write(f'  row {error["row"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {catalog_import.imported} tracks, rejected {catalog_import.rejected} rows '
+            f'in {catalog_import.seconds:.1f} s'
+        ))
+
+    def progress(self, catalog_import, rows):
+        seconds = catalog_import.seconds or 1e-9
+        self.stdout.write(
+            f'{catalog_import.next_row:>8} rows  {catalog_import.imported:>8} imported  '
+            f'{catalog_import.rejected:>6} rejected  {catalog_import.next_row / seconds:>8.1f} rows/s  '
+            f'{catalog_import.bytes_copied / seconds / 1e6:>7.1f} MB/s'
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from core.models import Track
+from core.processing import FAILED, PENDING, PROCESSING, READY, media_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Process uploads whose media pipeline job never ran or failed (e.g. after a restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='also retry failed tracks')
+        parser.add_argument('--all', action='store_true', help='reprocess every track')
+        parser.add_argument(
+            '--missing-waveforms', action='store_true', help='also process ready tracks without waveform peaks'
+        )
+
+    def handle(self, *args, **options):
+        tracks = Track.objects.all()
+        if not options['all']:
+            statuses = [PENDING, PROCESSING] + ([FAILED] if options['retry_failed'] else [])
+            selected = Q(processing_status__in=statuses)
+            if options['missing_waveforms']:
+                # Tracks from before the waveform column have NULL there.
+                selected |= Q(processing_status=READY) & (Q(waveform='') | Q(waveform__isnull=True))
+            tracks = tracks.filter(selected)
+        track_ids = list(tracks.values_list('id', flat=True).order_by('id'))
+        for track_id in track_ids:
+            media_pipeline.submit(track_id)
+        media_pipeline.shutdown()
+        counts = dict(
+            Track.objects.filter(pk__in=track_ids).values_list('processing_status')
+            .annotate(n=Count('id'))
+            .order_by()
+        ) if track_ids else {}
+        self.stdout.write(f'Processed {len(track_ids)} tracks: {counts}')
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import UploadSession
+from core.uploads import discard
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that were not completed within CHUNKED_UPLOAD_EXPIRY'
+
+    def handle(self, *args, **options):
+        expiry = getattr(settings, 'CHUNKED_UPLOAD_EXPIRY', 24 * 3600)
+        stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=expiry))
+        count = 0
+        for session in stale.iterator():
+            discard(session)
+            session.delete()
+            count += 1
+        self.stdout.write(f'Removed {count} expired uploads')
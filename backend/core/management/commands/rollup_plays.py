@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import events
+
+
+class Command(BaseCommand):
+    help = 'Fold new play events into the hourly/daily rollups and maintain the event partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days-ahead', type=int, default=7, help='Partitions to create in advance')
+        parser.add_argument('--no-purge', action='store_true', help='Keep events past the retention window')
+
+    def handle(self, *args, **options):
+        created = events.ensure_partitions(options['days_ahead'])
+        written = events.rollup()
+        dropped = [] if options['no_purge'] else events.purge_events()
+        self.stdout.write(
+            f'Rollup rows written: {written}; partitions created: {len(created)}, dropped: {len(dropped)}'
+        )
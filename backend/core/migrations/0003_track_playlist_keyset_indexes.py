@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_customuser_managers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='playlist_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-plays', '-created_at', '-id'], name='track_active_plays_idx'),
+        ),
+    ]
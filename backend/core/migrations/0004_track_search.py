@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:39
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+SEARCH_CONFIG = 'simple'
+
+
+def search_vector(apps):
+    # The weighted vector of core.search as of this migration, inlined so
+    # later changes there cannot alter the migration.
+    CustomUser = apps.get_model('core', 'CustomUser')
+    username = Subquery(
+        CustomUser.objects.filter(pk=OuterRef('musician_id')).values('username')[:1]
+    )
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(username, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('genre', weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS track_search_vector_idx '
+        'ON core_track USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS track_title_trgm_idx '
+        'ON core_track USING gin (title gin_trgm_ops)'
+    )
+    Track = apps.get_model('core', 'Track')
+    Track.objects.update(search_vector=search_vector(apps))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS track_search_vector_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS track_title_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_track_playlist_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='track',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
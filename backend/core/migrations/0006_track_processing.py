@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_userrecommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='cover_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='covers/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='waveform',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='tracks/'),
+        ),
+    ]
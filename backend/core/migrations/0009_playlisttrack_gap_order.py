@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:54
+
+from django.db import migrations, models
+from django.db.models import F
+
+ORDER_GAP = 1024
+
+
+def spread_orders(apps, schema_editor):
+    # Keeps the relative order of existing entries and opens gaps between them.
+    PlaylistTrack = apps.get_model('core', 'PlaylistTrack')
+    PlaylistTrack.objects.update(order=F('order') * ORDER_GAP)
+
+
+def squeeze_orders(apps, schema_editor):
+    PlaylistTrack = apps.get_model('core', 'PlaylistTrack')
+    PlaylistTrack.objects.update(order=F('order') / ORDER_GAP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_track_waveform'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='playlisttrack',
+            name='order',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(spread_orders, squeeze_orders),
+        migrations.AddIndex(
+            model_name='playlisttrack',
+            index=models.Index(fields=['playlist', 'order'], name='playlisttrack_order_idx'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+PARTITIONED_TABLE = """
+CREATE TABLE core_playevent (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    genre varchar(50) NOT NULL,
+    played_at timestamp with time zone NOT NULL,
+    musician_id bigint NOT NULL,
+    track_id bigint NOT NULL,
+    user_id bigint NULL,
+    PRIMARY KEY (id, played_at)
+) PARTITION BY RANGE (played_at);
+CREATE TABLE core_playevent_default PARTITION OF core_playevent DEFAULT;
+CREATE INDEX core_playevent_played_at_idx ON core_playevent (played_at);
+"""
+
+
+def create_play_events(apps, schema_editor):
+    # On PostgreSQL the event log is range-partitioned by day (partitions are
+    # created by core.events.ensure_partitions); elsewhere it is a plain table.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(PARTITIONED_TABLE)
+    else:
+        schema_editor.create_model(apps.get_model('core', 'PlayEvent'))
+
+
+def drop_play_events(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('core', 'PlayEvent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_playlisttrack_gap_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenrePlayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('listeners', models.PositiveIntegerField(default=0)),
+                ('genre', models.CharField(max_length=50)),
+            ],
+            options={
+                'unique_together': {('genre', 'granularity', 'bucket')},
+            },
+        ),
+        # The state is a plain model; the table is created by create_play_events.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.CreateModel(
+                name='PlayEvent',
+                fields=[
+                    ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('genre', models.CharField(max_length=50)),
+                    ('played_at', models.DateTimeField(db_index=True)),
+                    ('musician', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                    ('track', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.track')),
+                    ('user', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ],
+            ),
+        ]),
+        migrations.RunPython(create_play_events, drop_play_events),
+        migrations.CreateModel(
+            name='MusicianPlayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('listeners', models.PositiveIntegerField(default=0)),
+                ('musician', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('musician', 'granularity', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackPlayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('listeners', models.PositiveIntegerField(default=0)),
+                ('track', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.track')),
+            ],
+            options={
+                'unique_together': {('track', 'granularity', 'bucket')},
+            },
+        ),
+    ]
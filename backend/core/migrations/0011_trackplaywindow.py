@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_play_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackPlayWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days', models.PositiveSmallIntegerField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('musician', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('track', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.track')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['musician', 'days', '-plays'], name='trackwindow_top_idx')],
+                'unique_together': {('track', 'days')},
+            },
+        ),
+    ]
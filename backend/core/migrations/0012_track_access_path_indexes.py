@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_trackplaywindow'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['genre', '-plays', '-created_at', '-id'], name='track_active_genre_plays_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['musician', '-plays', '-created_at', '-id'], name='track_active_musician_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-likes', '-created_at', '-id'], name='track_active_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['genre', '-likes', '-created_at', '-id'], name='track_active_genre_likes_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:36
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HALF_LIFE = 24 * 3600
+
+
+def seed_scores(apps, schema_editor):
+    # Start from the last week of hourly play rollups, as if those plays had
+    # been recorded by core.trending (likes carry no time and are left out).
+    Track = apps.get_model('core', 'Track')
+    TrackPlayRollup = apps.get_model('core', 'TrackPlayRollup')
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    sums = {}
+    rollups = TrackPlayRollup.objects.filter(granularity='hour', bucket__gte=since, plays__gt=0)
+    for track_id, bucket, plays in rollups.values_list('track_id', 'bucket', 'plays').iterator():
+        score = math.log(plays) + (bucket - EPOCH).total_seconds() * math.log(2) / HALF_LIFE
+        previous = sums.get(track_id)
+        sums[track_id] = score if previous is None else max(previous, score) + math.log1p(
+            math.exp(-abs(previous - score))
+        )
+    tracks = [Track(pk=track_id, trending=score) for track_id, score in sums.items()]
+    Track.objects.bulk_update(tracks, ['trending'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_catalogimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='trending',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(seed_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-trending', '-created_at', '-id'], name='track_active_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['genre', '-trending', '-created_at', '-id'], name='track_active_genre_trend_idx'),
+        ),
+    ]
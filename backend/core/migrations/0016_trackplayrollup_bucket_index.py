@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_tracklike'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trackplayrollup',
+            index=models.Index(fields=['granularity', 'bucket'], name='trackrollup_bucket_idx'),
+        ),
+    ]
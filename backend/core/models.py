@@ -1,7 +1,18 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Max
+from django.dispatch import Signal
 from django.utils import timezone
 from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.postgres.search import SearchVectorField
+
+from .counters import counters
+from .dedup import is_repeat_play, recent_like, remember_like
+from .events import DAY, HOUR, play_events
+from .imports import IMPORT_PENDING, IMPORT_STATUS_CHOICES
+from .processing import PENDING, STATUS_CHOICES
 
 class CustomUserManager(BaseUserManager):
     use_in_migrations = True
@@ -78,25 +89,133 @@ class Track(models.Model):
     cover_image = models.ImageField(upload_to='covers/', null=True, blank=True)
     plays = models.IntegerField(default=0)
     likes = models.IntegerField(default=0)
+    # Time-decayed plays and likes in log space, maintained by core.trending
+    trending = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     genre = models.CharField(max_length=50, choices=GENRE_CHOICES)
     is_active = models.BooleanField(default=True)  # For moderation
+    # Maintained by core.signals; only populated on PostgreSQL (see core.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Filled in by the media pipeline after upload (see core.processing)
+    processing_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    duration = models.FloatField(null=True, blank=True, editable=False)  # seconds
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # {'128': 'tracks/renditions/...'}
+    cover_thumbnail = models.ImageField(upload_to='covers/thumbs/', null=True, blank=True, editable=False)
+    waveform = models.FileField(upload_to='tracks/', null=True, blank=True, editable=False)  # int8 peaks
 
     class Meta:
         ordering = ['-plays', '-created_at']
+        indexes = [
+            # Keyset pagination of the catalog (see core.pagination)
+            models.Index(
+                fields=['-plays', '-created_at', '-id'],
+                name='track_active_plays_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # ?genre= and ?musician= catalog pages, and per-genre charts
+            models.Index(
+                fields=['genre', '-plays', '-created_at', '-id'],
+                name='track_active_genre_plays_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['musician', '-plays', '-created_at', '-id'],
+                name='track_active_musician_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # Charts by likes (see core.charts)
+            models.Index(
+                fields=['-likes', '-created_at', '-id'],
+                name='track_active_likes_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['genre', '-likes', '-created_at', '-id'],
+                name='track_active_genre_likes_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # ?sort=trending catalog pages (see core.trending)
+            models.Index(
+                fields=['-trending', '-created_at', '-id'],
+                name='track_active_trending_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['genre', '-trending', '-created_at', '-id'],
+                name='track_active_genre_trend_idx',
+                condition=models.Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
-    def increment_plays(self):
-        """Increment play count"""
+    def increment_plays(self, user=None):
+        """
+        Increment play count and log the play (buffered, see core.counters and
+        core.events), unless the user played the track within the dedup window
+        (see core.dedup). Returns whether the play counted.
+        """
+        if user is not None and user.is_authenticated and is_repeat_play(user.pk, self.pk):
+            return False
+        counters.increment(self.pk, 'plays')
+        play_events.record(self, user)
         self.plays += 1
-        self.save(update_fields=['plays'])
+        return True
+
+    def increment_likes(self, amount=1):
+        """Increment like count (buffered, see core.counters)"""
+        counters.increment(self.pk, 'likes', amount)
+        self.likes += amount
+
+    def like(self, user):
+        """Like the track once per user; returns whether the like is new (see core.dedup)"""
+        if recent_like(user.pk, self.pk):
+            return False
+        # The unique constraint decides, so concurrent likes count once.
+        try:
+            with transaction.atomic():
+                TrackLike.objects.create(user=user, track=self)
+        except IntegrityError:
+            created = False
+        else:
+            created = True
+            self.increment_likes()
+        transaction.on_commit(lambda: remember_like(user.pk, self.pk, True))
+        return created
 
-    def increment_likes(self):
-        """Increment like count"""
-        self.likes += 1
-        self.save(update_fields=['likes'])
+    def unlike(self, user):
+        """Take back the user's like; returns whether there was one"""
+        if recent_like(user.pk, self.pk) is False:
+            return False
+        deleted, _ = TrackLike.objects.filter(user=user, track=self).delete()
+        if deleted:
+            self.increment_likes(-1)
+        transaction.on_commit(lambda: remember_like(user.pk, self.pk, False))
+        return bool(deleted)
+
+class TrackLike(models.Model):
+    """A user's like of a track; one per pair, so liking is idempotent"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='track_likes')
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'track']
+
+# Sent when a playlist's tracks change through bulk queries that bypass
+# post_save/post_delete (see Playlist._touch)
+playlist_changed = Signal()
+
+# Spacing between consecutive PlaylistTrack.order values
+ORDER_GAP = 1024
+# Rows per UPDATE when renumbering a playlist (bounded by bind parameter limits)
+RENUMBER_BATCH = 10000
+
+def _order_between(before, after):
+    """Order midway between two neighbours (``after`` is None at the end), or None if the gap is used up"""
+    order = before + ORDER_GAP if after is None else (before + after) // 2
+    return order if order > before and (after is None or order < after) else None
 
 class Playlist(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -108,29 +227,321 @@ class Playlist(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', '-updated_at', '-id'], name='playlist_user_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def _touch(self):
+        # The UPDATE locks the playlist row until commit, so concurrent order
+        # changes to the same playlist are serialized.
+        Playlist.objects.filter(pk=self.pk).update(updated_at=timezone.now())
+        playlist_changed.send(sender=Playlist, playlist=self)
+
+    def add_tracks(self, track_ids):
+        """Append tracks in the given order, skipping ones already present; returns the added ids"""
+        track_ids = list(dict.fromkeys(track_ids))
+        with transaction.atomic():
+            self._touch()
+            entries = PlaylistTrack.objects.filter(playlist=self)
+            present = set(entries.filter(track_id__in=track_ids).values_list('track_id', flat=True))
+            added = [track_id for track_id in track_ids if track_id not in present]
+            last = entries.aggregate(last=Max('order'))['last'] or 0
+            PlaylistTrack.objects.bulk_create([
+                PlaylistTrack(playlist=self, track_id=track_id, order=last + ORDER_GAP * n)
+                for n, track_id in enumerate(added, 1)
+            ])
+        return added
+
     def add_track(self, track):
-        """Add track to playlist with order"""
-        PlaylistTrack.objects.create(
-            playlist=self,
-            track=track,
-            order=self.tracks.count() + 1
-        )
+        """Add track to the end of the playlist"""
+        if not self.add_tracks([track.pk]):
+            raise ValueError('Track is already in the playlist')
+
+    def remove_tracks(self, track_ids):
+        """Remove tracks with a single DELETE; returns the number removed"""
+        with transaction.atomic():
+            self._touch()
+            removed, _ = PlaylistTrack.objects.filter(playlist=self, track_id__in=track_ids).delete()
+        return removed
 
     def remove_track(self, track):
         """Remove track from playlist"""
-        PlaylistTrack.objects.filter(playlist=self, track=track).delete()
+        self.remove_tracks([track.pk])
+
+    def reorder_tracks(self, track_ids):
+        """Put the given tracks first, in this order, followed by the rest in their current order"""
+        with transaction.atomic():
+            self._touch()
+            current = dict(
+                PlaylistTrack.objects.filter(playlist=self).order_by('order', 'id')
+                .values_list('track_id', 'order')
+            )
+            listed = [track_id for track_id in dict.fromkeys(track_ids) if track_id in current]
+            chosen = set(listed)
+            self._renumber(listed + [track_id for track_id in current if track_id not in chosen], current)
+
+    def set_track_orders(self, orders):
+        """
+        Legacy explicit orders (``{track_id: order}``): unlisted tracks keep
+        their 0-based position as their order, and a listed track goes before
+        an unlisted one with the same order, so ``order`` is its new position
+        """
+        with transaction.atomic():
+            self._touch()
+            current = dict(
+                PlaylistTrack.objects.filter(playlist=self).order_by('order', 'id')
+                .values_list('track_id', 'order')
+            )
+            keys = {
+                track_id: (orders[track_id], 0, position) if track_id in orders else (position, 1, position)
+                for position, track_id in enumerate(current)
+            }
+            self._renumber(sorted(current, key=keys.__getitem__), current)
+
+    def move_track(self, track_id, position):
+        """Move a track to a 0-based position, usually by updating only its own row"""
+        with transaction.atomic():
+            self._touch()
+            others = PlaylistTrack.objects.filter(playlist=self).exclude(track_id=track_id).order_by('order', 'id')
+            position = max(position, 0)
+            window = list(others.values_list('order', flat=True)[max(position - 1, 0):position + 1])
+            if not position:
+                before, after = 0, (window[0] if window else None)
+            elif len(window) == 2:
+                before, after = window
+            else:
+                # At or past the end: go after the last entry.
+                before = window[0] if window else others.aggregate(last=Max('order'))['last'] or 0
+                after = None
+            order = _order_between(before, after)
+            if order is not None:
+                if not PlaylistTrack.objects.filter(playlist=self, track_id=track_id).update(order=order):
+                    raise ValueError('Track is not in the playlist')
+                return
+            # Out of room between the neighbours: spread everything out again.
+            current = dict(PlaylistTrack.objects.filter(playlist=self).values_list('track_id', 'order'))
+            if track_id not in current:
+                raise ValueError('Track is not in the playlist')
+            ordered = list(others.values_list('track_id', flat=True))
+            ordered.insert(position, track_id)
+            self._renumber(ordered, current)
+
+    def apply_operations(self, operations):
+        """
+        Apply ``{'op': 'add'|'remove'|'move', 'track_id': ..., 'position': ...}``
+        operations in order, in one transaction and a fixed number of queries.
+        Operations that cannot be applied are skipped; returns one result per operation.
+        """
+        with transaction.atomic():
+            self._touch()
+            known = dict(
+                Track.objects.filter(pk__in={operation['track_id'] for operation in operations})
+                .values_list('pk', 'is_active')
+            )
+            current = dict(
+                PlaylistTrack.objects.filter(playlist=self).order_by('order', 'id')
+                .values_list('track_id', 'order')
+            )
+            ordered, members = list(current), set(current)
+            orders = dict(current)
+            # Each placed track gets the midpoint order between its new neighbours;
+            # only when a gap is used up does the whole playlist get renumbered.
+            renumber = False
+            results = []
+            for operation in operations:
+                op, track_id, position = operation['op'], operation['track_id'], operation.get('position')
+                result = {'op': op, 'track_id': track_id}
+                results.append(result)
+                if op == 'add':
+                    if not known.get(track_id):
+                        result['error'] = 'Unknown track'
+                        continue
+                    if track_id in members:
+                        result['error'] = 'Track is already in the playlist'
+                        continue
+                    members.add(track_id)
+                    result['status'] = 'added'
+                elif track_id not in members:
+                    result['error'] = 'Track is not in the playlist'
+                    continue
+                elif op == 'remove':
+                    members.remove(track_id)
+                    ordered.remove(track_id)
+                    result['status'] = 'removed'
+                    continue
+                else:
+                    ordered.remove(track_id)
+                    result['status'] = 'moved'
+                index = len(ordered) if position is None else min(position, len(ordered))
+                ordered.insert(index, track_id)
+                if not renumber:
+                    before = orders[ordered[index - 1]] if index else 0
+                    after = orders[ordered[index + 1]] if index + 1 < len(ordered) else None
+                    order = _order_between(before, after)
+                    renumber = order is None
+                    orders[track_id] = order
+
+            removed = [track_id for track_id in current if track_id not in members]
+            added = [track_id for track_id in ordered if track_id not in current]
+            if removed:
+                PlaylistTrack.objects.filter(playlist=self, track_id__in=removed).delete()
+            if renumber:
+                orders = {track_id: ORDER_GAP * n for n, track_id in enumerate(ordered, 1)}
+            PlaylistTrack.objects.bulk_create([
+                PlaylistTrack(playlist=self, track_id=track_id, order=orders[track_id]) for track_id in added
+            ])
+            self._write_orders([
+                (track_id, orders[track_id]) for track_id in ordered
+                if track_id in current and orders[track_id] != current[track_id]
+            ])
+        for result in results:
+            result.setdefault('status', 'error')
+        return results
+
+    def _renumber(self, ordered_ids, current):
+        """Give ``ordered_ids`` evenly spaced orders, updating the rows that change in one statement"""
+        changed = [
+            (track_id, ORDER_GAP * n)
+            for n, track_id in enumerate(ordered_ids, 1) if current[track_id] != ORDER_GAP * n
+        ]
+        self._write_orders(changed)
+
+    def _write_orders(self, changed):
+        """Set ``(track_id, order)`` pairs in one UPDATE per batch"""
+        # UPDATE ... FROM a VALUES list is a single hash join, where a CASE
+        # with one branch per row would be quadratic on large playlists.
+        table = connection.ops.quote_name(PlaylistTrack._meta.db_table)
+        for start in range(0, len(changed), RENUMBER_BATCH):
+            batch = changed[start:start + RENUMBER_BATCH]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'WITH new_order (track_id, position) AS (VALUES {", ".join(["(%s, %s)"] * len(batch))}) '
+                    f'UPDATE {table} SET "order" = new_order.position FROM new_order '
+                    f'WHERE {table}."playlist_id" = %s AND {table}."track_id" = new_order.track_id',
+                    [value for row in batch for value in row] + [self.pk],
+                )
 
 class PlaylistTrack(models.Model):
     """Through model for Playlist-Track relationship with ordering"""
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE)
     track = models.ForeignKey(Track, on_delete=models.CASCADE)
-    order = models.PositiveIntegerField(default=0)
+    # Sparse: consecutive entries are ORDER_GAP apart so a move only rewrites one row
+    order = models.PositiveBigIntegerField(default=0)
     added_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['order']
-        unique_together = ['playlist', 'track']
\ No newline at end of file
+        unique_together = ['playlist', 'track']
+        indexes = [
+            models.Index(fields=['playlist', 'order'], name='playlisttrack_order_idx'),
+        ]
+
+class UserRecommendations(models.Model):
+    """Precomputed recommendations for a user (built by core.recommendations)"""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True)
+    track_ids = models.BinaryField()  # packed little-endian int64 track ids, best first
+    built_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'Recommendations for {self.user}'
+
+class UploadSession(models.Model):
+    """Resumable chunked upload of a track's audio file (see core.uploads)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64, blank=True)  # hex SHA-256 of the whole file
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.size} bytes)'
+
+class CatalogImport(models.Model):
+    """Bulk track import from a manifest file (see core.imports)"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    manifest = models.CharField(max_length=500)  # absolute path; media paths are relative to its directory
+    status = models.CharField(max_length=20, choices=IMPORT_STATUS_CHOICES, default=IMPORT_PENDING)
+    # Rows before next_row are done (imported or rejected); a resumed import starts here.
+    next_row = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    bytes_copied = models.PositiveBigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # [{'row': n, 'error': '...'}], first ones only
+    seconds = models.FloatField(default=0)  # time spent running, over all attempts
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Import of {self.manifest} ({self.status})'
+
+class PlayEvent(models.Model):
+    """One play, appended by core.events (partitioned by day on PostgreSQL)"""
+    # No foreign key constraints or indexes besides played_at: the log is
+    # append-only, only scanned by time range, and outlives deleted rows.
+    track = models.ForeignKey(
+        Track, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    musician = models.ForeignKey(
+        CustomUser, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    genre = models.CharField(max_length=50)
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True,
+        related_name='+'
+    )
+    played_at = models.DateTimeField(db_index=True)
+
+class PlayRollup(models.Model):
+    """Plays and distinct listeners per hour or day (built by core.events.rollup)"""
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()  # start of the hour/day
+    plays = models.PositiveIntegerField(default=0)
+    listeners = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class TrackPlayRollup(PlayRollup):
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+
+    class Meta:
+        unique_together = ['track', 'granularity', 'bucket']
+        indexes = [
+            # The charts' today and week windows (see core.charts)
+            models.Index(fields=['granularity', 'bucket'], name='trackrollup_bucket_idx'),
+        ]
+
+class MusicianPlayRollup(PlayRollup):
+    musician = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+
+    class Meta:
+        unique_together = ['musician', 'granularity', 'bucket']
+
+class GenrePlayRollup(PlayRollup):
+    genre = models.CharField(max_length=50)
+
+    class Meta:
+        unique_together = ['genre', 'granularity', 'bucket']
+
+class TrackPlayWindow(models.Model):
+    """A track's plays over the last ``days`` days (refreshed by core.events.rollup)"""
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, db_constraint=False, related_name='+')
+    musician = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='+'
+    )
+    days = models.PositiveSmallIntegerField()
+    plays = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['track', 'days']
+        indexes = [
+            # A musician's top tracks for a window are read straight off this index.
+            models.Index(fields=['musician', 'days', '-plays'], name='trackwindow_top_idx'),
+        ]
@@ -0,0 +1,155 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F
+from django.db.models.fields.tuple_lookups import Tuple, TupleGreaterThan, TupleLessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a fixed multi-column ordering.
+
+    The cursor carries the ordering values of the row at the page boundary and
+    the next page is selected with a row-value comparison such as
+    ``(plays, created_at, id) < (%s, %s, %s)``. With a composite index that
+    matches the ordering, page N costs the same as page 1, unlike offset
+    pagination. The last ordering field must be unique (the primary key) so
+    rows with equal ``plays`` are never skipped or repeated.
+
+    Views declare their ordering with ``keyset_ordering``; all fields must
+    sort in the same direction so the comparison can use a single index scan.
+    Pages may be model instances or ``values()`` dicts.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE or 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        if len({field.startswith('-') for field in ordering}) != 1:
+            raise ValueError('keyset_ordering fields must all sort in the same direction')
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, fetching the page with the async ORM"""
+        return self.paginate_rows([row async for row in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view=None):
+        """The unevaluated page (plus one row to detect a next page)"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.limit = self.get_page_size(request)
+
+        self.position, self.reverse = self.decode_cursor(request, queryset.model)
+        descending = self.ordering[0].startswith('-')
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        queryset = queryset.order_by(*ordering)
+
+        if self.position is not None:
+            lookup = TupleLessThan if descending != self.reverse else TupleGreaterThan
+            queryset = queryset.filter(
+                lookup(Tuple(*(F(field) for field in self.fields)), self.position)
+            )
+        return queryset[:self.limit + 1]
+
+    def paginate_rows(self, rows):
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for field in self.fields:
+            value = row[field] if isinstance(row, dict) else getattr(row, field)
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            values.append(value)
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    @staticmethod
+    def to_python(model, field, value):
+        try:
+            return model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            # Annotations such as a search rank are JSON-native already
+            return value
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            values = payload['v']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = tuple(
+                self.to_python(model, field, value)
+                for field, value in zip(self.fields, values)
+            )
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
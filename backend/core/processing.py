@@ -0,0 +1,263 @@
+"""
+Background processing of uploaded media.
+
+Uploads are stored by the request as before, but everything derived from
+them happens in a process pool after the transaction commits:
+
+* the duration is probed (``wave`` for WAV, ``ffprobe`` otherwise);
+* loudness-normalized MP3 renditions are transcoded for each of
+  ``MEDIA_BITRATES`` with ``ffmpeg`` (skipped when it is not installed);
+* a square JPEG thumbnail is rendered from the cover with Pillow;
+* waveform peaks are computed with NumPy and stored next to the audio file
+  as a compact int8 array (see ``compute_peaks``).
+
+Worker processes only see file paths and return a result dict; the parent
+writes it to the ``Track`` row and moves ``processing_status`` from
+``processing`` to ``ready`` or ``failed``. The queue lives in the pool, so
+jobs lost to a restart are picked up again by ``manage.py process_media``.
+``MEDIA_WORKERS = 0`` runs jobs inline, which tests rely on.
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import hashlib
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+
+from .response_cache import TRACKS, response_cache
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+READY = 'ready'
+FAILED = 'failed'
+STATUS_CHOICES = [
+    (PENDING, 'Pending'),
+    (PROCESSING, 'Processing'),
+    (READY, 'Ready'),
+    (FAILED, 'Failed'),
+]
+
+THUMBNAIL_SIZE = (300, 300)
+PEAKS_SAMPLE_RATE = 8000
+LOUDNESS_FILTER = 'loudnorm=I=-14:TP=-1.5:LRA=11'
+
+
+def probe_duration(job, result):
+    path = job['audio_path']
+    if path.lower().endswith('.wav'):
+        with wave.open(path) as audio:
+            result['duration'] = audio.getnframes() / audio.getframerate()
+        return
+    if not job['ffprobe']:
+        return
+    output = subprocess.run(
+        [job['ffprobe'], '-v', 'error', '-show_entries', 'format=duration',
+         '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        capture_output=True, text=True, check=True, timeout=60,
+    ).stdout.strip()
+    result['duration'] = float(output) if output else None
+
+
+def transcode(job, result):
+    if not job['ffmpeg']:
+        return
+    for bitrate in job['bitrates']:
+        name = f'tracks/renditions/{job["stem"]}_{bitrate}k.mp3'
+        target = os.path.join(job['media_root'], name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        subprocess.run(
+            [job['ffmpeg'], '-nostdin', '-v', 'error', '-y', '-i', job['audio_path'],
+             '-vn', '-af', LOUDNESS_FILTER, '-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k', target],
+            check=True, timeout=600,
+        )
+        result['renditions'][str(bitrate)] = name
+
+
+def thumbnail(job, result):
+    if not job['cover_path']:
+        return
+    from PIL import Image, ImageOps
+
+    name = f'covers/thumbs/{job["stem"]}.jpg'
+    target = os.path.join(job['media_root'], name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(job['cover_path']) as image:
+        ImageOps.fit(image.convert('RGB'), THUMBNAIL_SIZE).save(target, 'JPEG', quality=85)
+    result['cover_thumbnail'] = name
+
+
+def decode_samples(job):
+    """Decode the audio to a mono float array in [-1, 1], or None if it cannot be decoded."""
+    path = job['audio_path']
+    if path.lower().endswith('.wav'):
+        with wave.open(path) as audio:
+            width, channels = audio.getsampwidth(), audio.getnchannels()
+            raw = audio.readframes(audio.getnframes())
+        if width == 1:
+            samples = np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128
+        elif width == 3:
+            padded = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+            padded[:, 1:] = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+            samples = padded.view('<i4').ravel() >> 8
+        else:
+            samples = np.frombuffer(raw, dtype=f'<i{width}')
+        samples = samples.reshape(-1, channels) / float(1 << (8 * width - 1))
+        # Keep the loudest channel so one-sided stereo still shows up.
+        loudest = np.abs(samples).argmax(axis=1)
+        return samples[np.arange(len(samples)), loudest]
+    if not job['ffmpeg']:
+        return None
+    raw = subprocess.run(
+        [job['ffmpeg'], '-nostdin', '-v', 'error', '-i', path, '-vn', '-ac', '1',
+         '-ar', str(PEAKS_SAMPLE_RATE), '-f', 's16le', '-'],
+        capture_output=True, check=True, timeout=600,
+    ).stdout
+    return np.frombuffer(raw, dtype='<i2') / 32768.0
+
+
+def peaks(samples, points):
+    """
+    Downsample to ``points`` (min, max) pairs, interleaved and scaled to int8.
+
+    The result is at most ``2 * points`` bytes: ``[min0, max0, min1, max1, ...]``
+    with -127..127 standing for full scale, ready for a JS ``Int8Array``.
+    """
+    if not len(samples):
+        return np.zeros(0, dtype=np.int8)
+    points = min(points, len(samples))
+    edges = np.linspace(0, len(samples), points + 1).astype(np.intp)[:-1]
+    pairs = np.empty((points, 2), dtype=np.float64)
+    pairs[:, 0] = np.minimum.reduceat(samples, edges)
+    pairs[:, 1] = np.maximum.reduceat(samples, edges)
+    return np.clip(np.round(pairs * 127), -127, 127).astype(np.int8).ravel()
+
+
+def compute_peaks(job, result):
+    samples = decode_samples(job)
+    if samples is None:
+        return
+    data = peaks(samples, job['peaks']).tobytes()
+    # The digest in the name lets clients cache the peaks forever.
+    name = f'{os.path.splitext(job["audio_name"])[0]}.{hashlib.md5(data).hexdigest()[:8]}.peaks'
+    with open(os.path.join(job['media_root'], name), 'wb') as f:
+        f.write(data)
+    result['waveform'] = name
+
+
+def waveform_version(name):
+    """The content digest embedded in a waveform file name by ``compute_peaks``."""
+    return name.rsplit('.', 2)[-2] if name.count('.') >= 2 else ''
+
+
+STEPS = [probe_duration, transcode, thumbnail, compute_peaks]
+
+
+def run_job(job):
+    """Run every processing step for one upload. Executes in a worker process."""
+    result = {'duration': None, 'renditions': {}, 'cover_thumbnail': None, 'waveform': None}
+    for step in STEPS:
+        step(job, result)
+    return result
+
+
+def build_job(track):
+    audio = track.audio_file
+    return {
+        'audio_path': audio.path,
+        'audio_name': audio.name,
+        'cover_path': track.cover_image.path if track.cover_image else None,
+        'media_root': str(settings.MEDIA_ROOT),
+        'stem': f'{track.pk}_{os.path.splitext(os.path.basename(audio.name))[0]}',
+        'bitrates': list(getattr(settings, 'MEDIA_BITRATES', ())),
+        'peaks': getattr(settings, 'WAVEFORM_POINTS', 1000),
+        'ffmpeg': shutil.which('ffmpeg'),
+        'ffprobe': shutil.which('ffprobe'),
+    }
+
+
+class MediaPipeline:
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return getattr(settings, 'MEDIA_WORKERS', 2)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a web worker that has threads and DB connections.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def submit(self, track_id):
+        """Queue processing for a track; returns immediately unless MEDIA_WORKERS is 0."""
+        Track = apps.get_model('core', 'Track')
+        track = Track.objects.get(pk=track_id)
+        job = build_job(track)
+        Track.objects.filter(pk=track_id).update(processing_status=PROCESSING)
+        if not self.workers:
+            try:
+                result = run_job(job)
+            except Exception as exc:
+                result = self._failure(track_id, exc)
+            self.finish(track_id, result)
+            return
+        future = self._get_executor().submit(run_job, job)
+        future.add_done_callback(partial(self._done, track_id))
+
+    def shutdown(self, wait=True):
+        """Wait for queued jobs (and their result callbacks) and stop the workers."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _failure(self, track_id, exc):
+        logger.error('Processing track %s failed: %s', track_id, exc, exc_info=exc)
+        return None
+
+    def _done(self, track_id, future):
+        # Runs on the executor's management thread, which has its own connection.
+        try:
+            try:
+                result = future.result()
+            except Exception as exc:
+                result = self._failure(track_id, exc)
+            self.finish(track_id, result)
+        except Exception:
+            logger.exception('Saving processing results for track %s failed', track_id)
+        finally:
+            connection.close()
+
+    def finish(self, track_id, result):
+        Track = apps.get_model('core', 'Track')
+        # Queryset updates send no post_save, so drop cached track responses here.
+        response_cache.invalidate(TRACKS)
+        if result is None:
+            Track.objects.filter(pk=track_id).update(processing_status=FAILED)
+            return
+        Track.objects.filter(pk=track_id).update(
+            processing_status=READY,
+            duration=result['duration'],
+            renditions=result['renditions'],
+            cover_thumbnail=result['cover_thumbnail'] or '',
+            waveform=result['waveform'] or '',
+        )
+
+
+media_pipeline = MediaPipeline()
@@ -0,0 +1,323 @@
+"""
+Request profiling and Prometheus metrics.
+
+``ProfilingMiddleware`` times every request and splits it into:
+
+* SQL: every query on any connection while the request is handled, also
+  from ``sync_to_async`` threads, through an execute wrapper that
+  ``core.signals`` installs on each new connection;
+* authentication: ``authenticating()`` in ``CachedJWTAuthentication`` and
+  the async views;
+* serialization: ``serializing()`` around serializers' ``.data``
+  (``ProfiledSerializerMixin``), ``FastTrackSerializer.serialize()`` and
+  JSON rendering (``core.renderers``), less the queries run meanwhile;
+* other: what is left, i.e. routing, permissions, view code and middleware.
+
+Per endpoint (the URL name) it keeps histograms of these, of the query count
+and of the response size, plus request counts by status, and serves them in
+the Prometheus text format at ``/api/metrics/``, together with the response
+cache counters. Requests slower than ``PROFILING_SLOW_REQUEST_MS`` are logged
+to ``core.profiling`` (a ``PROFILING_SLOW_SAMPLE_RATE`` fraction of them)
+with their slowest and most repeated queries. Responses carry the breakdown
+in a ``Server-Timing`` header.
+
+Metrics live in process memory: each worker reports its own, so scrape the
+workers individually (Prometheus adds them up).
+"""
+import contextvars
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def enabled():
+    return getattr(settings, 'PROFILING_ENABLED', True)
+
+
+@dataclass
+class Profile:
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    sql_time: float = 0.0
+    auth_time: float = 0.0
+    auth_sql_time: float = 0.0
+    serialization_time: float = 0.0
+    serialization_sql_time: float = 0.0
+    serializing: bool = False
+    slowest: list = field(default_factory=list)  # heap of (seconds, sql)
+    statements: Counter = field(default_factory=Counter)
+
+
+_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+def profile_query(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` callback that records the query in the request's profile."""
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        profile.queries += 1
+        profile.sql_time += duration
+        profile.statements[sql] += 1
+        entry = (duration, sql)
+        if len(profile.slowest) < slow_queries():
+            heapq.heappush(profile.slowest, entry)
+        else:
+            heapq.heappushpop(profile.slowest, entry)
+
+
+def install(connection):
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_query)
+
+
+@contextmanager
+def authenticating():
+    """Attribute the enclosed code, queries included, to authentication."""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    started, sql_before = time.perf_counter(), profile.sql_time
+    try:
+        yield
+    finally:
+        profile.auth_time += time.perf_counter() - started
+        profile.auth_sql_time += profile.sql_time - sql_before
+
+
+@contextmanager
+def serializing():
+    """Attribute the enclosed code to serialization; its queries still count as SQL."""
+    profile = _profile.get()
+    if profile is None or profile.serializing:
+        # Nested serializers are part of the outer one's time.
+        yield
+        return
+    profile.serializing = True
+    started, sql_before = time.perf_counter(), profile.sql_time
+    try:
+        yield
+    finally:
+        profile.serializing = False
+        profile.serialization_time += time.perf_counter() - started
+        profile.serialization_sql_time += profile.sql_time - sql_before
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=('endpoint', 'method')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, values, amount):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [0] * len(self.buckets) + [0, 0]
+        for index, bound in enumerate(self.buckets):
+            if amount <= bound:
+                series[index] += 1
+        series[-2] += amount
+        series[-1] += 1
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} histogram')
+        for values, series in sorted(self.series.items()):
+            labels = format_labels(zip(self.labels, values))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-2]:.6g}')
+            lines.append(f'{self.name}_count{{{labels}}} {series[-1]}')
+
+
+def format_labels(pairs):
+    escaped = ((name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in pairs)
+    return ','.join(f'{name}="{value}"' for name, value in escaped)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()  # (endpoint, method, status) -> count
+            self.histograms = {
+                'duration': Histogram(
+                    'vibetunes_request_duration_seconds', 'Time to produce the response.', DURATION_BUCKETS),
+                'sql': Histogram(
+                    'vibetunes_request_sql_seconds', 'Time spent in SQL queries.', DURATION_BUCKETS),
+                'queries': Histogram(
+                    'vibetunes_request_queries', 'SQL queries per request.', QUERY_BUCKETS),
+                'auth': Histogram(
+                    'vibetunes_request_auth_seconds', 'Time spent authenticating, queries included.',
+                    DURATION_BUCKETS),
+                'serialization': Histogram(
+                    'vibetunes_request_serialization_seconds',
+                    'Time spent in serializers and rendering, queries excluded.', DURATION_BUCKETS),
+                'other': Histogram(
+                    'vibetunes_request_other_seconds',
+                    'Time outside SQL, authentication and serialization (routing, permissions, view code).',
+                    DURATION_BUCKETS),
+                'size': Histogram(
+                    'vibetunes_response_size_bytes', 'Response body size.', SIZE_BUCKETS),
+            }
+
+    def observe(self, endpoint, method, status, observations):
+        labels = (endpoint, method)
+        with self._lock:
+            self.requests[(endpoint, method, str(status))] += 1
+            for name, amount in observations.items():
+                self.histograms[name].observe(labels, amount)
+
+    def render(self):
+        lines = [
+            '# HELP vibetunes_requests_total Requests handled, by response status.',
+            '# TYPE vibetunes_requests_total counter',
+        ]
+        with self._lock:
+            for values, count in sorted(self.requests.items()):
+                labels = format_labels(zip(('endpoint', 'method', 'status'), values))
+                lines.append(f'vibetunes_requests_total{{{labels}}} {count}')
+            for histogram in self.histograms.values():
+                histogram.render(lines)
+        lines.append('# HELP vibetunes_response_cache_total Response cache lookups and invalidations.')
+        lines.append('# TYPE vibetunes_response_cache_total counter')
+        for namespace, counts in sorted(response_cache.stats().items()):
+            for result in ('hits', 'misses', 'invalidations'):
+                labels = format_labels((('namespace', namespace), ('result', result)))
+                lines.append(f'vibetunes_response_cache_total{{{labels}}} {counts[result]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def slow_request_ms():
+    return getattr(settings, 'PROFILING_SLOW_REQUEST_MS', 500)
+
+
+def slow_sample_rate():
+    return getattr(settings, 'PROFILING_SLOW_SAMPLE_RATE', 1.0)
+
+
+def slow_queries():
+    return getattr(settings, 'PROFILING_SLOW_QUERIES', 5)
+
+
+def endpoint_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def finish(request, response, profile):
+    elapsed = time.perf_counter() - profile.started
+    endpoint = endpoint_of(request)
+    own_sql = profile.sql_time - profile.auth_sql_time
+    serialization = max(0.0, profile.serialization_time - profile.serialization_sql_time)
+    other = max(0.0, elapsed - profile.auth_time - own_sql - serialization)
+    metrics.observe(endpoint, request.method, response.status_code, {
+        'duration': elapsed,
+        'sql': profile.sql_time,
+        'queries': profile.queries,
+        'auth': profile.auth_time,
+        'serialization': serialization,
+        'other': other,
+        'size': response_size(response),
+    })
+    response['Server-Timing'] = ', '.join(
+        f'{name};dur={seconds * 1000:.1f}'
+        for name, seconds in (('db', own_sql), ('auth', profile.auth_time),
+                              ('serialization', serialization), ('other', other), ('total', elapsed))
+    )
+    if elapsed * 1000 >= slow_request_ms() and random.random() < slow_sample_rate():
+        log_slow_request(request, response, endpoint, elapsed, profile, serialization, other)
+
+
+def shorten(sql, limit=1000):
+    return sql if len(sql) <= limit else f'{sql[:limit]}... ({len(sql)} characters)'
+
+
+def log_slow_request(request, response, endpoint, elapsed, profile, serialization, other):
+    lines = [
+        f'Slow request {request.method} {request.get_full_path()} ({endpoint}) -> {response.status_code}: '
+        f'{elapsed * 1000:.1f} ms total, {profile.queries} queries in {profile.sql_time * 1000:.1f} ms, '
+        f'auth {profile.auth_time * 1000:.1f} ms, serialization {serialization * 1000:.1f} ms, '
+        f'other {other * 1000:.1f} ms'
+    ]
+    for duration, sql in sorted(profile.slowest, reverse=True):
+        lines.append(f'  {duration * 1000:8.1f} ms  {shorten(sql)}')
+    repeated = [(count, sql) for sql, count in profile.statements.most_common(3) if count > 1]
+    for count, sql in repeated:
+        lines.append(f'  repeated {count}x  {shorten(sql)}')
+    logger.warning('\n'.join(lines))
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        profile = Profile()
+        token = _profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        finish(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        profile = Profile()
+        token = _profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        finish(request, response, profile)
+        return response
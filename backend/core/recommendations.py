@@ -0,0 +1,191 @@
+"""
+Item-to-item recommendations from playlist co-occurrence.
+
+``build()`` is a batch job (see the ``build_recommendations`` command): it
+loads every ``PlaylistTrack`` row, builds a sparse playlist x track matrix
+``X`` and the cosine-normalized track x track co-occurrence matrix
+``C = X.T @ X`` pruned to each track's ``NEIGHBOURS`` most similar active
+tracks, then scores every user's tracks against ``C`` and keeps the best
+unseen ones. Results are stored per user as a packed int64 array in
+``UserRecommendations``, so serving is a single primary-key lookup.
+
+Users without precomputed recommendations (new users, or users created
+since the last build) and short lists are filled from the materialized
+charts, which are already in memory.
+"""
+import time
+from itertools import zip_longest
+
+import numpy as np
+from scipy import sparse
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .charts import ALL, chart_engine
+
+ID_DTYPE = np.dtype('<i8')
+BATCH_USERS = 2048
+# Similar tracks kept per track; pruning the long tail keeps scoring sparse.
+NEIGHBOURS = 50
+
+
+def recommendation_size():
+    return getattr(settings, 'RECOMMENDATIONS_SIZE', 15)
+
+
+def stored_size():
+    # Keep extra candidates so tracks deactivated after the build can be skipped.
+    return recommendation_size() * 2
+
+
+def pack(track_ids):
+    return np.asarray(track_ids, dtype=ID_DTYPE).tobytes()
+
+
+def unpack(data):
+    return np.frombuffer(bytes(data), dtype=ID_DTYPE).tolist()
+
+
+def similarity_matrix(playlist_idx, track_idx, n_playlists, n_tracks):
+    """Cosine-normalized track x track co-occurrence matrix (CSR, zero diagonal)."""
+    ones = np.ones(len(track_idx), dtype=np.float32)
+    X = sparse.csr_matrix((ones, (playlist_idx, track_idx)), shape=(n_playlists, n_tracks))
+    X.data[:] = 1
+    C = (X.T @ X).tocsr()
+    norms = C.diagonal()
+    C.setdiag(0)
+    C.eliminate_zeros()
+    scale = sparse.diags(1 / np.sqrt(np.maximum(norms, 1)))
+    return (scale @ C @ scale).tocsr()
+
+
+def prune(C, k):
+    """Keep only the ``k`` largest entries of each row of a CSR matrix."""
+    indptr, indices, data = [0], [], []
+    for row in range(C.shape[0]):
+        begin, end = C.indptr[row], C.indptr[row + 1]
+        row_indices, row_data = C.indices[begin:end], C.data[begin:end]
+        if end - begin > k:
+            top = np.argpartition(-row_data, k - 1)[:k]
+            row_indices, row_data = row_indices[top], row_data[top]
+        indices.append(row_indices)
+        data.append(row_data)
+        indptr.append(indptr[-1] + len(row_indices))
+    return sparse.csr_matrix(
+        (np.concatenate(data), np.concatenate(indices), np.asarray(indptr)), shape=C.shape
+    )
+
+
+def compute(rows, eligible_ids, size):
+    """
+    Compute recommendations from ``(playlist_id, user_id, track_id)`` rows.
+
+    Returns ``{user_id: [track_id, ...]}`` with at most ``size`` tracks per
+    user, best first, never including tracks already in the user's playlists
+    or tracks outside ``eligible_ids``.
+    """
+    rows = np.asarray(rows, dtype=ID_DTYPE).reshape(-1, 3)
+    if not len(rows):
+        return {}
+    playlists, playlist_idx = np.unique(rows[:, 0], return_inverse=True)
+    users, user_idx = np.unique(rows[:, 1], return_inverse=True)
+    tracks, track_idx = np.unique(rows[:, 2], return_inverse=True)
+
+    eligible = sparse.diags(np.isin(tracks, np.asarray(eligible_ids, dtype=ID_DTYPE)).astype(np.float32))
+    C = prune(
+        (similarity_matrix(playlist_idx, track_idx, len(playlists), len(tracks)) @ eligible).tocsr(),
+        NEIGHBOURS,
+    )
+    ones = np.ones(len(track_idx), dtype=np.float32)
+    U = sparse.csr_matrix((ones, (user_idx, track_idx)), shape=(len(users), len(tracks)))
+    U.data[:] = 1
+    result = {}
+    for start in range(0, len(users), BATCH_USERS):
+        known = U[start:start + BATCH_USERS]
+        scores = (known @ C).tocsr()
+        # Drop tracks already in the user's playlists.
+        scores = (scores - scores.multiply(known)).tocsr()
+        scores.eliminate_zeros()
+        for offset in range(scores.shape[0]):
+            begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+            if begin == end:
+                continue
+            candidates, values = scores.indices[begin:end], scores.data[begin:end]
+            if len(candidates) > size:
+                top = np.argpartition(-values, size - 1)[:size]
+                candidates, values = candidates[top], values[top]
+            order = np.lexsort((-tracks[candidates], -values))
+            result[int(users[start + offset])] = tracks[candidates[order]].tolist()
+    return result
+
+
+def build():
+    """Rebuild and store recommendations for every user with playlists. Returns stats."""
+    PlaylistTrack = apps.get_model('core', 'PlaylistTrack')
+    Track = apps.get_model('core', 'Track')
+    UserRecommendations = apps.get_model('core', 'UserRecommendations')
+
+    started = time.perf_counter()
+    rows = np.fromiter(
+        (
+            value
+            for row in PlaylistTrack.objects.values_list(
+                'playlist_id', 'playlist__user_id', 'track_id'
+            ).order_by().iterator(chunk_size=10000)
+            for value in row
+        ),
+        dtype=ID_DTYPE,
+    )
+    eligible = np.fromiter(
+        Track.objects.filter(is_active=True).values_list('id', flat=True).order_by().iterator(chunk_size=10000),
+        dtype=ID_DTYPE,
+    )
+    loaded = time.perf_counter()
+    recommendations = compute(rows, eligible, stored_size())
+    computed = time.perf_counter()
+
+    built_at = timezone.now()
+    with transaction.atomic():
+        UserRecommendations.objects.exclude(user_id__in=list(recommendations)).delete()
+        UserRecommendations.objects.bulk_create(
+            [
+                UserRecommendations(user_id=user_id, track_ids=pack(track_ids), built_at=built_at)
+                for user_id, track_ids in recommendations.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['track_ids', 'built_at'],
+        )
+    return {
+        'users': len(recommendations),
+        'pairs': len(rows) // 3,
+        'load_seconds': loaded - started,
+        'compute_seconds': computed - loaded,
+        'store_seconds': time.perf_counter() - computed,
+    }
+
+
+def recommended_ids(user):
+    """Ordered track ids to recommend to ``user``: one lookup plus in-memory charts."""
+    UserRecommendations = apps.get_model('core', 'UserRecommendations')
+    lists = chart_engine.state()['lists']
+
+    def top(scope):
+        return [track_id for track_id, _ in lists.get(scope, {}).get('plays', [])]
+
+    stored = UserRecommendations.objects.filter(user=user).values_list('track_ids', flat=True).first()
+    if stored is not None:
+        ids = unpack(stored) + top(ALL)
+    else:
+        # Cold start, as before the engine existed: what is popular overall,
+        # then the best of the genres in the user's playlists.
+        popular = top(ALL)
+        genre_tops = [top(genre) for genre in user.get_listened_genres()]
+        interleaved = [
+            track_id for group in zip_longest(*genre_tops) for track_id in group if track_id
+        ]
+        ids = popular[:10] + interleaved + popular[10:]
+    return list(dict.fromkeys(ids))[:stored_size()]
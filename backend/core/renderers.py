@@ -0,0 +1,13 @@
+"""
+JSON rendering that counts as serialization in the request profile (see
+``core.profiling``).
+"""
+from rest_framework.renderers import JSONRenderer
+
+from . import profiling
+
+
+class ProfiledJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with profiling.serializing():
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,111 @@
+"""
+Read replica routing.
+
+Replicas are extra ``DATABASES`` aliases listed in ``DATABASE_REPLICAS``.
+``ReplicaRouter`` only sends a query to one when the request it runs in has
+been marked read-only: viewsets opt in per action with
+``ReplicaReadMixin.replica_actions`` (the async read views always do).
+Everything else -- writes, other views, background threads, management
+commands, reads inside a transaction -- stays on the primary.
+
+Replicas lag behind the primary, so a user who just changed something would
+not see it on their next page. Any write made while handling a user's
+request pins that user to the primary for ``REPLICA_STICKY_SECONDS``
+(read-your-writes). The pin lives in the default cache, so with the
+per-process local-memory backend it only holds within one process; use a
+shared cache with several workers.
+"""
+import contextvars
+import random
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+STICKY_KEY = 'db:sticky:{}'
+
+
+@dataclass
+class RequestRouting:
+    user_id: object = None
+    replica: str = None  # None: read from the primary
+    wrote: bool = False
+
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def is_sticky(user_id):
+    return user_id is not None and cache.get(STICKY_KEY.format(user_id)) is not None
+
+
+def mark_sticky(user_id):
+    cache.set(STICKY_KEY.format(user_id), 1, sticky_seconds())
+
+
+def begin(user, read_only):
+    """Set up routing for the request of ``user``; pass the result to ``end()``."""
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    available = replicas()
+    replica = None
+    if read_only and available and not is_sticky(user_id):
+        # One replica per request, so its queries see a consistent snapshot.
+        replica = random.choice(available)
+    return _routing.set(RequestRouting(user_id=user_id, replica=replica))
+
+
+def end(token):
+    _routing.reset(token)
+
+
+def in_transaction():
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.replica is None or in_transaction():
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            if state.user_id is not None and not state.wrote:
+                mark_sticky(state.user_id)
+                state.wrote = True
+            # Later reads of this request must see the write, too.
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+
+class ReplicaReadMixin:
+    """Route the ``replica_actions`` of a viewset to the read replicas."""
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        read_only = request.method in SAFE_METHODS and self.action in self.replica_actions
+        self._routing_token = begin(request.user, read_only)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_routing_token', None)
+        if token is not None:
+            end(token)
+            self._routing_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,151 @@
+"""
+Cached API reads.
+
+``CachedResponseMixin`` stores the serialized data of successful ``list``
+and ``retrieve`` responses in the ``responses`` cache, keyed on the path,
+query string and host (media URLs are absolute), plus the user for
+per-user endpoints. Every key also embeds the current generation of the
+namespaces the view depends on; ``invalidate()`` bumps a generation, which
+orphans every entry built from it without having to find them. Orphans
+and cold entries fall out through the backend's eviction: configured with
+``CULL_FREQUENCY == MAX_ENTRIES`` the local-memory backend evicts exactly
+the least recently used entry when full.
+
+Generations are bumped from model signals (see ``core.signals``) on
+``Track``, ``Playlist`` and ``PlaylistTrack`` changes. Play and like
+counts are written in bulk without signals, so they can lag by up to
+``RESPONSE_CACHE_TIMEOUT`` seconds in cached responses. As with the
+charts, a per-process cache only sees invalidations from its own process;
+use a shared backend with several workers.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+GENERATION_KEY = 'resp:gen:{}'
+ENTRY_KEY = 'resp:{}:{}'
+
+TRACKS = 'tracks'
+PLAYLISTS = 'playlists'
+
+
+def user_namespace(namespace, user_id):
+    return f'{namespace}:{user_id}'
+
+
+class ResponseCache:
+    def __init__(self, cache_alias='responses'):
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60)
+
+    def _count(self, name, namespace):
+        with self._lock:
+            self._stats[(name, namespace)] += 1
+
+    def generations(self, namespaces):
+        keys = [GENERATION_KEY.format(namespace) for namespace in namespaces]
+        found = self.cache.get_many(keys)
+        missing = {key: int(time.time() * 1000) for key in keys if key not in found}
+        if missing:
+            # A fresh clock value never matches an earlier generation, so
+            # entries cannot be resurrected when a generation is evicted.
+            self.cache.set_many(missing, None)
+            found.update(missing)
+        return [found[key] for key in keys]
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            key = GENERATION_KEY.format(namespace)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, int(time.time() * 1000), None)
+            self._count('invalidations', namespace.split(':')[0])
+
+    def key(self, request, namespaces, per_user=False):
+        parts = [
+            request.get_host(),
+            request.path,
+            '&'.join(sorted(f'{k}={v}' for k, values in request.query_params.lists() for v in values)),
+            str(request.user.pk) if per_user else '',
+            *map(str, self.generations(namespaces)),
+        ]
+        digest = hashlib.md5('\n'.join(parts).encode()).hexdigest()
+        return ENTRY_KEY.format(namespaces[0].split(':')[0], digest)
+
+    def get(self, key, namespace):
+        data = self.cache.get(key)
+        self._count('hits' if data is not None else 'misses', namespace)
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.timeout)
+
+    def stats(self):
+        """Per-namespace hit/miss/invalidation counts of this process"""
+        with self._lock:
+            result = {}
+            for (name, namespace), value in self._stats.items():
+                result.setdefault(namespace, {'hits': 0, 'misses': 0, 'invalidations': 0})[name] = value
+        for counts in result.values():
+            lookups = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = counts['hits'] / lookups if lookups else 0.0
+        return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+response_cache = ResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Serve ``list``/``retrieve`` from the response cache. Views set
+    ``cache_namespace`` and ``cache_per_user`` (whether responses depend
+    on the requesting user) and may override ``get_cache_namespaces()``.
+    """
+    cache_namespace = None
+    cache_per_user = False
+
+    def get_cache_namespaces(self):
+        return [self.cache_namespace]
+
+    def cached(self, handler, request, *args, **kwargs):
+        if not response_cache.enabled:
+            return handler(request, *args, **kwargs)
+        namespaces = self.get_cache_namespaces()
+        key = response_cache.key(request, namespaces, self.cache_per_user)
+        data = response_cache.get(key, self.cache_namespace)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,294 @@
+"""
+Ranked track search.
+
+On PostgreSQL tracks carry a weighted ``search_vector`` (title > musician >
+genre > description) kept up to date by ``core.signals`` and backed by a GIN
+index, plus a trigram index on the title for typo tolerance. Every query term
+is matched as a prefix, so partial words typed into a search box already hit.
+
+Other databases (SQLite in tests and local development) use an in-process
+inverted index with the same weighting, prefix expansion and an edit-distance
+fallback for misspelled terms. It is built lazily from the database on the
+first search and maintained by the same signals, so it only reflects writes
+made by the current process.
+"""
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Value, When
+
+SEARCH_CONFIG = 'simple'
+
+# Ranking weights for the fallback index, mirroring PostgreSQL's default
+# ts_rank weights for the A/B/C/D labels used in the search vector.
+FIELD_WEIGHTS = {
+    'title': 1.0,
+    'username': 0.4,
+    'genre': 0.2,
+    'description': 0.1,
+}
+INDEXED_FIELDS = {'title', 'description', 'genre', 'musician'}
+
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.6
+FUZZY_MATCH = 0.3
+
+# Upper bounds that keep a single query cheap on a large catalog.
+MAX_PREFIX_EXPANSION = 100
+MAX_RESULTS = 1000
+TRIGRAM_THRESHOLD = 0.3
+
+_word_re = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _word_re.findall((text or '').lower())
+
+
+def search_vector():
+    """Weighted search vector expression over a track and its musician."""
+    CustomUser = apps.get_model('core', 'CustomUser')
+    username = Subquery(
+        CustomUser.objects.filter(pk=OuterRef('musician_id')).values('username')[:1]
+    )
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(username, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('genre', weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(queryset):
+    """Recompute ``search_vector`` for the given tracks in a single UPDATE."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return 0
+    return queryset.update(search_vector=search_vector())
+
+
+def search_tracks(queryset, text):
+    """Filter ``queryset`` to tracks matching ``text``, annotated with ``search_rank``."""
+    words = tokenize(text)
+    if not words:
+        return _no_results(queryset)
+    if connections[queryset.db].vendor == 'postgresql':
+        return _postgres_search(queryset, text, words)
+    return _index_search(queryset, words)
+
+
+def _no_results(queryset):
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+def _postgres_search(queryset, text, words):
+    query = SearchQuery(
+        ' & '.join(f'{word}:*' for word in words),
+        search_type='raw', config=SEARCH_CONFIG,
+    )
+    return queryset.filter(
+        Q(search_vector=query) | Q(title__trigram_word_similar=text)
+    ).annotate(
+        search_rank=(
+            SearchRank(F('search_vector'), query)
+            + TrigramWordSimilarity(text, 'title') * FUZZY_MATCH
+        ),
+    )
+
+
+def _index_search(queryset, words):
+    track_index.ensure_built()
+    hits = track_index.search(words, limit=MAX_RESULTS)
+    if not hits:
+        return _no_results(queryset)
+    # Scores come from a handful of weight products, so one WHEN per distinct
+    # score keeps the CASE short however many tracks matched.
+    by_score = defaultdict(list)
+    for doc_id, score in hits:
+        by_score[score].append(doc_id)
+    return queryset.filter(pk__in=[doc_id for doc_id, _ in hits]).annotate(
+        search_rank=Case(
+            *[When(pk__in=ids, then=Value(score)) for score, ids in by_score.items()],
+            default=Value(0.0), output_field=FloatField(),
+        ),
+    )
+
+
+def edit_distance(a, b, limit):
+    """
+    Edit distance between ``a`` and ``b`` counting adjacent transpositions as
+    one edit (optimal string alignment), or ``limit + 1`` once it is exceeded.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """
+    Weighted inverted index with prefix and typo-tolerant term matching.
+
+    Documents are dicts of field name to text; a term's weight in a document
+    is the highest ``FIELD_WEIGHTS`` entry of a field containing it. Terms are
+    ANDed and scored by summing their best match weight.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._vocabulary = []
+        self._trigrams = defaultdict(set)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id, fields):
+        weights = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 0)
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0), weight)
+        with self._lock:
+            self._remove(doc_id)
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    bisect.insort(self._vocabulary, token)
+                    for gram in trigrams(token):
+                        self._trigrams[gram].add(token)
+                self._postings[token][doc_id] = weight
+            self._documents[doc_id] = tuple(weights)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._vocabulary.clear()
+            self._trigrams.clear()
+
+    def _remove(self, doc_id):
+        for token in self._documents.pop(doc_id, ()):
+            postings = self._postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+                for gram in trigrams(token):
+                    self._trigrams[gram].discard(token)
+
+    def expand(self, term):
+        """Vocabulary tokens matching ``term`` with their match weight."""
+        matches = {}
+        if term in self._postings:
+            matches[term] = EXACT_MATCH
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:start + MAX_PREFIX_EXPANSION + 1]:
+            if not token.startswith(term):
+                break
+            matches.setdefault(token, PREFIX_MATCH)
+        if not matches and len(term) >= 4:
+            limit = 1 if len(term) < 8 else 2
+            grams = trigrams(term)
+            shared = defaultdict(int)
+            for gram in grams:
+                for token in self._trigrams.get(gram, ()):
+                    shared[token] += 1
+            for token, count in shared.items():
+                if count / len(grams | trigrams(token)) < TRIGRAM_THRESHOLD:
+                    continue
+                if edit_distance(term, token, limit) <= limit:
+                    matches[token] = FUZZY_MATCH
+        return matches
+
+    def search(self, terms, limit=MAX_RESULTS):
+        """Return up to ``limit`` ``(doc_id, score)`` pairs, best first."""
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token, match in self.expand(term).items():
+                    for doc_id, weight in self._postings[token].items():
+                        score = match * weight
+                        if score > term_scores.get(doc_id, 0):
+                            term_scores[doc_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        doc_id: score + term_scores[doc_id]
+                        for doc_id, score in scores.items() if doc_id in term_scores
+                    }
+                if not scores:
+                    return []
+        return heapq.nlargest(limit, scores.items(), key=lambda hit: (hit[1], hit[0]))
+
+
+class TrackSearchIndex(InvertedIndex):
+    """The process-wide fallback index over all tracks."""
+
+    def __init__(self):
+        super().__init__()
+        self.built = False
+
+    @staticmethod
+    def document(title, description, genre, username):
+        return {'title': title, 'description': description, 'genre': genre, 'username': username}
+
+    def ensure_built(self):
+        if self.built:
+            return
+        with self._lock:
+            if self.built:
+                return
+            Track = apps.get_model('core', 'Track')
+            rows = Track.objects.values_list(
+                'id', 'title', 'description', 'genre', 'musician__username'
+            ).order_by().iterator(chunk_size=5000)
+            for doc_id, *fields in rows:
+                self.add(doc_id, self.document(*fields))
+            self.built = True
+
+    def update_track(self, track):
+        if self.built:
+            self.add(track.pk, self.document(
+                track.title, track.description, track.genre, track.musician.username
+            ))
+
+    def reset(self):
+        with self._lock:
+            self.clear()
+            self.built = False
+
+
+track_index = TrackSearchIndex()
@@ -1,12 +1,41 @@
+import os
+import re
+
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.contrib.auth import get_user_model
-from .models import Track, Playlist
+from django.utils.encoding import filepath_to_uri
+from .models import Track, Playlist, UploadSession, CatalogImport
+from .events import DAY, HOUR, WINDOWS
+from .imports import CatalogImportError, manifest_path
+from .processing import waveform_version
+from .uploads import current_offset
+from . import profiling
 
 CustomUser = get_user_model()
 
-class CustomUserSerializer(serializers.ModelSerializer):
+MAX_AUDIO_SIZE = 50 * 1024 * 1024
+MAX_COVER_SIZE = 5 * 1024 * 1024
+MAX_BATCH_OPERATIONS = 5000
+MAX_HOURLY_DASHBOARD_DAYS = 7
+
+class ProfiledListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with profiling.serializing():
+            return super().data
+
+class ProfiledSerializerMixin:
+    """Time ``.data`` as serialization in the request's profile (see core.profiling)"""
+    @property
+    def data(self):
+        with profiling.serializing():
+            return super().data
+
+class CustomUserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
+        list_serializer_class = ProfiledListSerializer
         fields = ('id', 'email', 'username', 'is_musician', 'password')
         extra_kwargs = {'password': {'write_only': True}}
 
@@ -19,17 +48,21 @@ class CustomUserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class TrackSerializer(serializers.ModelSerializer):
+class TrackSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     musician = CustomUserSerializer(read_only=True)
     audio_url = serializers.SerializerMethodField()
     cover_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    bitrates = serializers.SerializerMethodField()
+    waveform_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Track
+        list_serializer_class = ProfiledListSerializer
         fields = ('id', 'musician', 'title', 'description', 'audio_file', 
-                 'audio_url', 'cover_image', 'cover_url', 'plays', 'likes', 
-                 'created_at', 'genre')
-        read_only_fields = ('plays', 'likes', 'created_at')
+                 'audio_url', 'cover_image', 'cover_url', 'thumbnail_url', 'plays', 'likes', 
+                 'created_at', 'genre', 'duration', 'bitrates', 'waveform_url', 'processing_status')
+        read_only_fields = ('plays', 'likes', 'created_at', 'duration', 'processing_status')
 
     def get_audio_url(self, obj):
         if obj.audio_file:
@@ -41,29 +74,183 @@ class TrackSerializer(serializers.ModelSerializer):
             return self.context['request'].build_absolute_uri(obj.cover_image.url)
         return None
 
-class PlaylistSerializer(serializers.ModelSerializer):
+    def get_thumbnail_url(self, obj):
+        if obj.cover_thumbnail:
+            return self.context['request'].build_absolute_uri(obj.cover_thumbnail.url)
+        return None
+
+    def get_bitrates(self, obj):
+        """Transcoded renditions, available via the stream endpoint's ?bitrate="""
+        return sorted(int(bitrate) for bitrate in obj.renditions)
+
+    def get_waveform_url(self, obj):
+        if obj.waveform:
+            url = reverse('track-waveform', args=[obj.pk], request=self.context['request'])
+            return f'{url}?v={waveform_version(obj.waveform.name)}'
+        return None
+
+class FastTrackSerializer:
+    """
+    Read-only fast path producing the same output as ``TrackSerializer(many=True)``.
+
+    Rows come from ``values()`` (musician columns joined in), so no model
+    instances are built, and URLs are assembled from prefixes computed once
+    per request instead of calling ``build_absolute_uri`` per file.
+    """
+    values_fields = (
+        'id', 'musician_id', 'musician__email', 'musician__username', 'musician__is_musician',
+        'title', 'description', 'audio_file', 'cover_image', 'cover_thumbnail', 'plays', 'likes',
+        'created_at', 'genre', 'duration', 'renditions', 'waveform', 'processing_status',
+    )
+
+    def __init__(self, request):
+        self.request = request
+        self.storage = Track._meta.get_field('audio_file').storage
+        base_url = getattr(self.storage, 'base_url', None)
+        self.media_prefix = request.build_absolute_uri(base_url) if base_url else None
+        self.track_prefix = reverse('track-list', request=request)
+        self.created_at = serializers.DateTimeField()
+
+    def rows(self, queryset, *extra_fields):
+        """``queryset`` as values() rows with every field needed (plus e.g. pagination keys)"""
+        return queryset.values(*dict.fromkeys(self.values_fields + extra_fields))
+
+    def file_url(self, name):
+        if not name:
+            return None
+        if self.media_prefix is not None:
+            return self.media_prefix + filepath_to_uri(name).lstrip('/')
+        return self.request.build_absolute_uri(self.storage.url(name))
+
+    def to_representation(self, row):
+        audio_url = self.file_url(row['audio_file'])
+        cover_url = self.file_url(row['cover_image'])
+        waveform = row['waveform']
+        return {
+            'id': row['id'],
+            'musician': {
+                'id': row['musician_id'],
+                'email': row['musician__email'],
+                'username': row['musician__username'],
+                'is_musician': row['musician__is_musician'],
+            },
+            'title': row['title'],
+            'description': row['description'],
+            'audio_file': audio_url,
+            'audio_url': audio_url,
+            'cover_image': cover_url,
+            'cover_url': cover_url,
+            'thumbnail_url': self.file_url(row['cover_thumbnail']),
+            'plays': row['plays'],
+            'likes': row['likes'],
+            'created_at': self.created_at.to_representation(row['created_at']),
+            'genre': row['genre'],
+            'duration': row['duration'],
+            'bitrates': sorted(int(bitrate) for bitrate in row['renditions']),
+            'waveform_url': (
+                f'{self.track_prefix}{row["id"]}/waveform/?v={waveform_version(waveform)}' if waveform else None
+            ),
+            'processing_status': row['processing_status'],
+        }
+
+    def serialize(self, rows):
+        with profiling.serializing():
+            return [self.to_representation(row) for row in rows]
+
+class PlaylistSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     user = CustomUserSerializer(read_only=True)
     tracks = TrackSerializer(many=True, read_only=True)
 
     class Meta:
         model = Playlist
+        list_serializer_class = ProfiledListSerializer
         fields = ('id', 'user', 'name', 'tracks', 'created_at')
         read_only_fields = ('created_at',)
 
-class TrackCreateSerializer(serializers.ModelSerializer):
+class PlaylistOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'remove', 'move'])
+    track_id = serializers.IntegerField()
+    position = serializers.IntegerField(min_value=0, required=False)
+
+class PlaylistBatchSerializer(serializers.Serializer):
+    operations = serializers.ListField(
+        child=PlaylistOperationSerializer(), allow_empty=False, max_length=MAX_BATCH_OPERATIONS
+    )
+
+class DashboardQuerySerializer(serializers.Serializer):
+    days = serializers.ChoiceField(choices=WINDOWS, default=30)
+    granularity = serializers.ChoiceField(choices=[DAY, HOUR], default=DAY)
+    top = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def validate(self, data):
+        if data['granularity'] == HOUR and data['days'] > MAX_HOURLY_DASHBOARD_DAYS:
+            raise serializers.ValidationError(
+                f"Hourly series are limited to {MAX_HOURLY_DASHBOARD_DAYS} days"
+            )
+        return data
+
+class TrackCreateSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Track
         fields = ('title', 'description', 'audio_file', 'cover_image', 'genre')
 
     def validate_audio_file(self, value):
         # Validate audio file size (max 50MB)
-        if value.size > 50 * 1024 * 1024:
+        if value.size > MAX_AUDIO_SIZE:
             raise serializers.ValidationError("Audio file size must be less than 50MB")
         return value
 
     def validate_cover_image(self, value):
         if value:
             # Validate cover image size (max 5MB)
-            if value.size > 5 * 1024 * 1024:
+            if value.size > MAX_COVER_SIZE:
                 raise serializers.ValidationError("Cover image size must be less than 5MB")
-        return value 
\ No newline at end of file
+        return value 
+
+class CatalogImportSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogImport
+        list_serializer_class = ProfiledListSerializer
+        fields = (
+            'id', 'manifest', 'status', 'next_row', 'imported', 'rejected', 'bytes_copied',
+            'errors', 'seconds', 'rows_per_second', 'created_at', 'updated_at',
+        )
+        read_only_fields = tuple(field for field in fields if field != 'manifest')
+
+    def get_rows_per_second(self, obj):
+        return obj.next_row / obj.seconds if obj.seconds else 0.0
+
+    def validate_manifest(self, value):
+        """Manifests are given relative to CATALOG_IMPORT_ROOT"""
+        try:
+            return manifest_path(value)
+        except CatalogImportError as exc:
+            raise serializers.ValidationError(str(exc))
+
+class UploadSessionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    offset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        list_serializer_class = ProfiledListSerializer
+        fields = ('id', 'filename', 'size', 'checksum', 'offset', 'created_at')
+        read_only_fields = ('created_at',)
+
+    def get_offset(self, obj):
+        return current_offset(obj)
+
+    def validate_filename(self, value):
+        return os.path.basename(value.replace('\\', '/')) or 'upload'
+
+    def validate_size(self, value):
+        if not 0 < value <= MAX_AUDIO_SIZE:
+            raise serializers.ValidationError("Audio file size must be less than 50MB")
+        return value
+
+    def validate_checksum(self, value):
+        value = value.lower()
+        if value and not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("Checksum must be a hex SHA-256 digest")
+        return value
@@ -0,0 +1,129 @@
+import weakref
+
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from . import profiling, trending
+from .charts import chart_engine
+from .counters import counters
+from .models import CustomUser, Playlist, PlaylistTrack, Track, playlist_changed
+from .response_cache import PLAYLISTS, TRACKS, response_cache, user_namespace
+from .search import INDEXED_FIELDS, refresh_search_vectors, track_index
+
+counters.connect(chart_engine.record)
+counters.connect(trending.record)
+
+
+@receiver(connection_created)
+def profile_queries(sender, connection, **kwargs):
+    """Let the profiling middleware see every query, whichever thread runs it"""
+    profiling.install(connection)
+
+
+@receiver(post_save, sender=Track)
+def index_track(sender, instance, update_fields=None, **kwargs):
+    """Keep the search vector (or the fallback index) in sync with the track"""
+    if update_fields and not INDEXED_FIELDS & set(update_fields):
+        return
+    if connections[kwargs['using']].vendor == 'postgresql':
+        refresh_search_vectors(Track.objects.using(kwargs['using']).filter(pk=instance.pk))
+    else:
+        track_index.update_track(instance)
+
+
+@receiver(post_save, sender=CustomUser)
+def reindex_musician_tracks(sender, instance, created, update_fields=None, **kwargs):
+    """Musician usernames are part of their tracks' search documents"""
+    if created or not instance.is_musician:
+        return
+    if update_fields and 'username' not in update_fields:
+        return
+    tracks = Track.objects.using(kwargs['using']).filter(musician=instance)
+    if connections[kwargs['using']].vendor == 'postgresql':
+        refresh_search_vectors(tracks)
+    elif track_index.built:
+        for track in tracks.select_related('musician'):
+            track_index.update_track(track)
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def invalidate_charts(sender, instance, update_fields=None, **kwargs):
+    """Edits can change a track's genre or hide it; rebuild charts on next read"""
+    if update_fields and set(update_fields) <= {'plays', 'likes'}:
+        return
+    chart_engine.invalidate()
+
+
+def invalidate_responses(*namespaces):
+    # Again after commit, so a read racing the transaction cannot re-cache old data.
+    response_cache.invalidate(*namespaces)
+    transaction.on_commit(lambda: response_cache.invalidate(*namespaces))
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def invalidate_track_responses(sender, instance, **kwargs):
+    """Track data is embedded in track and playlist responses"""
+    invalidate_responses(TRACKS)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_responses(sender, instance, created, **kwargs):
+    """Users are embedded as track musicians and playlist owners"""
+    if created:
+        return
+    invalidate_responses(user_namespace(PLAYLISTS, instance.pk), *([TRACKS] if instance.is_musician else []))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, created=False, **kwargs):
+    """Deactivation, role and password changes must apply to the user's next request"""
+    if created:
+        return
+    invalidate_user(instance.pk)
+    # Again after commit, so a lookup racing the transaction cannot cache the old row.
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
+
+
+@receiver(post_save, sender=Playlist)
+@receiver(post_delete, sender=Playlist)
+def invalidate_playlist_responses(sender, instance, **kwargs):
+    invalidate_responses(user_namespace(PLAYLISTS, instance.user_id))
+
+
+# Playlist owners already invalidated during a queryset delete, keyed by the
+# queryset, so deleting many entries costs one lookup per playlist.
+_deleted_entry_owners = weakref.WeakKeyDictionary()
+
+
+@receiver(post_save, sender=PlaylistTrack)
+@receiver(post_delete, sender=PlaylistTrack)
+def invalidate_playlist_track_responses(sender, instance, origin=None, **kwargs):
+    if getattr(origin, 'model', type(origin)) in (Playlist, Track, CustomUser):
+        # A cascade: the playlist, track or user receivers invalidate (playlist
+        # responses depend on TRACKS too).
+        return
+    owners = _deleted_entry_owners.setdefault(origin, {}) if isinstance(origin, QuerySet) else {}
+    if instance.playlist_id in owners:
+        return
+    if PlaylistTrack._meta.get_field('playlist').is_cached(instance):
+        user_id = instance.playlist.user_id
+    else:
+        user_id = (
+            Playlist.objects.using(kwargs['using']).filter(pk=instance.playlist_id)
+            .values_list('user_id', flat=True).first()
+        )
+    owners[instance.playlist_id] = user_id
+    if user_id is not None:
+        invalidate_responses(user_namespace(PLAYLISTS, user_id))
+
+
+@receiver(playlist_changed)
+def invalidate_bulk_playlist_responses(sender, playlist, **kwargs):
+    invalidate_responses(user_namespace(PLAYLISTS, playlist.user_id))
@@ -0,0 +1,228 @@
+"""
+Byte-range file serving for audio.
+
+``stream_file()`` answers ``GET``/``HEAD`` for a stored file with:
+
+* ``ETag``/``Last-Modified`` and the usual conditional request handling
+  (``If-None-Match``, ``If-Modified-Since``, ``If-Match``, ...);
+* single ``Range: bytes=...`` requests as ``206 Partial Content`` (honouring
+  ``If-Range``), and ``416`` for unsatisfiable ranges, so players can seek
+  without downloading the whole file;
+* optional offload to the front-end server with ``X-Accel-Redirect``
+  (nginx) or ``X-Sendfile`` (Apache/lighttpd) via ``MEDIA_SENDFILE``;
+* otherwise a ``FileResponse`` over the open file, which WSGI servers with a
+  ``wsgi.file_wrapper`` (e.g. gunicorn) send with ``sendfile(2)`` from the
+  current offset for ``Content-Length`` bytes, i.e. without copying the
+  audio through Python.
+
+Storages without local paths (e.g. object storage) are redirected to the
+storage URL, which handles ranges itself. ASGI servers have no file
+wrapper; ``async_file_response()`` makes such responses read the file in a
+worker thread chunk by chunk instead of blocking the event loop.
+
+``<audio src>`` cannot send the ``Authorization`` header, so the stream
+URLs handed to players carry ``?expires=&signature=`` instead
+(``signed_stream_params()``): an HMAC of the track and the expiry time,
+valid for ``STREAM_URL_MAX_AGE`` seconds.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.negotiation import BaseContentNegotiation
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+STREAM_SALT = 'core.streaming.stream'
+
+
+def stream_url_max_age():
+    return getattr(settings, 'STREAM_URL_MAX_AGE', 3600)
+
+
+def stream_signature(track_id, expires):
+    return Signer(salt=STREAM_SALT).signature(f'{track_id}:{expires}')
+
+
+def signed_stream_params(track_id):
+    """Query parameters that let anyone holding them stream the track until they expire."""
+    expires = int(time.time()) + stream_url_max_age()
+    return {'expires': expires, 'signature': stream_signature(track_id, expires)}
+
+
+def valid_stream_signature(track_id, params):
+    """Whether ``params`` (a query dict) carry an unexpired signature for the track."""
+    try:
+        expires = int(params.get('expires', ''))
+    except ValueError:
+        return False
+    return expires >= time.time() and constant_time_compare(
+        params.get('signature', ''), stream_signature(track_id, expires)
+    )
+
+
+class StreamNegotiation(BaseContentNegotiation):
+    """
+    Never reject a stream request over its ``Accept`` header: media elements
+    ask for ``audio/*``, which no API renderer offers. Errors still render
+    with the first configured renderer.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class RangeFile:
+    """A read-only view of ``length`` bytes of ``file`` starting at ``start``."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a ``Range`` header into an inclusive ``(start, end)`` pair.
+
+    Returns ``None`` when the header should be ignored (absent, malformed or
+    multiple ranges, which we answer with the full file as RFC 9110 allows)
+    and raises ``ValueError`` when the range cannot be satisfied.
+    """
+    match = _range_re.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError('empty suffix range')
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError('range not satisfiable')
+    return start, end
+
+
+def file_etag(stat):
+    return f'"{stat.st_size:x}-{int(stat.st_mtime * 1000):x}"'
+
+
+def range_applies(request, etag, last_modified):
+    """``If-Range`` lets a client resume only if the file did not change."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('W/'):
+        # Weak validators never match for If-Range.
+        return False
+    if if_range.startswith('"'):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(last_modified) == date
+
+
+def stream_file(request, name, storage=None, content_type=None, cache_control='private, max-age=3600'):
+    storage = storage or default_storage
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return HttpResponseRedirect(storage.url(name))
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return conditional
+
+    size = stat.st_size
+    byte_range = None
+    if 'Range' in request.headers and range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    offload = getattr(settings, 'MEDIA_SENDFILE', None)
+    if offload:
+        # The front-end server re-reads the request's Range header itself.
+        response = HttpResponse(content_type=content_type)
+        location = getattr(settings, 'MEDIA_SENDFILE_ROOT', '/protected-media/') + name
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(location)
+        else:
+            response['X-Sendfile'] = path
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(open(path, 'rb'), start, end - start + 1), content_type=content_type
+        )
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+async def read_chunks(file, chunk_size=FileResponse.block_size):
+    try:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+    finally:
+        file.close()
+
+
+def async_file_response(response):
+    """Serve a ``stream_file()`` response to an ASGI server without blocking the event loop."""
+    if isinstance(response, FileResponse) and response.file_to_stream is not None:
+        response.streaming_content = read_chunks(response.file_to_stream)
+    return response
@@ -1,3 +1,1685 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import wave
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+import numpy as np
+from PIL import Image
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import charts, dedup, events, recommendations, replicas, trending
+from .charts import chart_engine
+from .counters import CounterBuffer
+from .events import play_events
+from .models import (
+    ORDER_GAP, CatalogImport, CustomUser, GenrePlayRollup, MusicianPlayRollup, PlayEvent, Playlist, PlaylistTrack, Track,
+    TrackLike, TrackPlayRollup, TrackPlayWindow,
+)
+from .processing import decode_samples, media_pipeline, peaks
+from .profiling import metrics
+from .replicas import ReplicaRouter
+from .response_cache import response_cache
+from .search import InvertedIndex, search_tracks, track_index
+from .serializers import PlaylistSerializer
+from .streaming import signed_stream_params
+from .views import PlaylistViewSet
+
+
+def make_musician(name='artist'):
+    return CustomUser.objects.create_user(
+        email=f'{name}@example.com', username=name, password='pass', is_musician=True
+    )
+
+
+def make_track(musician, title='Song', genre='Pop', description='', **kwargs):
+    kwargs.setdefault('audio_file', f'tracks/{title}.mp3')
+    return Track.objects.create(
+        musician=musician, title=title, description=description, genre=genre, **kwargs
+    )
+
+
+class TempMediaMixin:
+    """Give each test an empty ``MEDIA_ROOT`` (``self.media``), removed afterwards."""
+
+    def setUp(self):
+        super().setUp()
+        self.media = self.temp_dir()
+        self.override(MEDIA_ROOT=self.media)
+
+    def temp_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        return path
+
+    def override(self, **settings):
+        """``override_settings`` until the end of the test."""
+        override = override_settings(**settings)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        self.track = make_track(self.musician)
+        self.other = make_track(self.musician, title='Other')
+
+    def test_increments_are_buffered_until_flush(self):
+        buffer = CounterBuffer(interval=60)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            for _ in range(5):
+                buffer.increment(self.track.pk, 'plays')
+            buffer.increment(self.track.pk, 'likes', 2)
+            buffer.increment(self.other.pk, 'plays')
+
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.plays, 0)
+        self.assertEqual(buffer.pending(self.track.pk, 'plays'), 5)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(buffer.flush())
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+        self.track.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.track.plays, self.track.likes), (5, 2))
+        self.assertEqual((self.other.plays, self.other.likes), (1, 0))
+        self.assertEqual(buffer.pending(self.track.pk, 'plays'), 0)
+
+    def test_failed_flush_keeps_counts(self):
+        buffer = CounterBuffer(interval=60)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            buffer.increment(self.track.pk, 'plays', 3)
+        with mock.patch.object(buffer, 'write', side_effect=RuntimeError), \
+                self.assertLogs('core.counters', 'ERROR'):
+            self.assertFalse(buffer.flush())
+        self.assertEqual(buffer.pending(self.track.pk, 'plays'), 3)
+
+        buffer.flush()
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.plays, 3)
+
+    def test_zero_interval_writes_through(self):
+        buffer = CounterBuffer(interval=0)
+        buffer.increment(self.track.pk, 'plays')
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.plays, 1)
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaises(ValueError):
+            CounterBuffer(interval=0).increment(self.track.pk, 'downloads')
+
+
+class TrackActionTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        self.track = make_track(self.musician)
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def test_play_and_like_update_counts(self):
+        self.client.post(f'/api/tracks/{self.track.pk}/play/')
+        self.client.post(f'/api/tracks/{self.track.pk}/play/')
+        response = self.client.post(f'/api/tracks/{self.track.pk}/like/')
+        self.assertEqual(response.status_code, 200)
+
+        self.track.refresh_from_db()
+        self.assertEqual((self.track.plays, self.track.likes), (2, 1))
+
+
+class QueryCountTests(TestCase):
+    """Every read endpoint must issue the same number of queries however much it returns."""
+
+    endpoints = [
+        '/api/tracks/',
+        '/api/tracks/?genre=Pop',
+        '/api/tracks/charts/',
+        '/api/tracks/recommendations/',
+        '/api/playlists/',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.listener = CustomUser.objects.create_user(
+            email='listener@example.com', username='listener', password='pass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.listener)
+        self.seed(1)
+
+    def seed(self, count):
+        """Add ``count`` musicians with a track each and a playlist holding every track."""
+        start = Track.objects.count()
+        for n in range(start, start + count):
+            make_track(make_musician(f'artist{n}'), title=f'Song {n}')
+        playlist = Playlist.objects.create(user=self.listener, name=f'Mix {start}')
+        for track in Track.objects.all():
+            playlist.add_track(track)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_results(self):
+        small = {url: self.count_queries(url) for url in self.endpoints}
+        self.seed(12)
+        for url in self.endpoints:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), small[url])
+
+    def test_playlist_detail_query_count(self):
+        playlist = Playlist.objects.filter(user=self.listener).first()
+        url = f'/api/playlists/{playlist.pk}/'
+        before = self.count_queries(url)
+        self.seed(8)
+        for track in Track.objects.exclude(playlist=playlist):
+            playlist.add_track(track)
+        self.assertEqual(self.count_queries(url), before)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        # Ties on plays force the created_at/id tiebreakers to do the work.
+        self.tracks = [make_track(self.musician, title=f'Song {n}', plays=n % 2) for n in range(7)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def expected_ids(self):
+        return list(
+            Track.objects.order_by('-plays', '-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def test_walks_catalog_without_gaps_or_repeats(self):
+        seen, url = [], '/api/tracks/?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            seen.extend(track['id'] for track in data['results'])
+            url = data['next']
+        self.assertEqual(seen, self.expected_ids())
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get('/api/tracks/?page_size=3').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNotNone(back['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/tracks/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_playlists_are_paginated(self):
+        for n in range(3):
+            Playlist.objects.create(user=self.musician, name=f'Mix {n}')
+        data = self.client.get('/api/playlists/?page_size=2').json()
+        self.assertEqual(len(data['results']), 2)
+        rest = self.client.get(data['next']).json()
+        self.assertEqual(len(rest['results']), 1)
+        self.assertIsNone(rest['next'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        track_index.reset()
+        self.musician = make_musician('nightdriver')
+        self.neon = make_track(self.musician, title='Neon Lights', genre='Electronic')
+        self.blue = make_track(
+            make_musician('crooner'), title='Blue Moon', genre='Jazz',
+            description='A late night neon lit ballad',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def search(self, text):
+        data = self.client.get('/api/tracks/', {'search': text}).json()
+        return [track['id'] for track in data['results']]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('neon'), [self.neon.pk, self.blue.pk])
+
+    def test_prefix_and_typo_tolerance(self):
+        self.assertEqual(self.search('lig'), [self.neon.pk])
+        self.assertEqual(self.search('ballda'), [self.blue.pk])
+
+    def test_matches_musician_and_genre(self):
+        self.assertEqual(self.search('nightdriver'), [self.neon.pk])
+        self.assertEqual(self.search('jazz moon'), [self.blue.pk])
+
+    def test_index_follows_saves(self):
+        self.assertEqual(self.search('neon'), [self.neon.pk, self.blue.pk])
+        self.neon.title = 'Pale Lights'
+        self.neon.save()
+        self.assertEqual(self.search('neon'), [self.blue.pk])
+        self.assertEqual(self.search('pale'), [self.neon.pk])
+
+    def test_search_results_paginate(self):
+        extra = [make_track(self.musician, title=f'Neon {n}') for n in range(4)]
+        seen, url = [], '/api/tracks/?search=neon&page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(track['id'] for track in data['results'])
+            url = data['next']
+        self.assertCountEqual(seen, [self.neon.pk, self.blue.pk] + [t.pk for t in extra])
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class InvertedIndexTests(TestCase):
+    def test_terms_are_anded(self):
+        index = InvertedIndex()
+        index.add(1, {'title': 'red hot'})
+        index.add(2, {'title': 'red cold'})
+        self.assertEqual([doc for doc, _ in index.search(['red', 'hot'])], [1])
+        index.remove(1)
+        self.assertEqual(index.search(['hot']), [])
+
+
+class ChartsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.musician = make_musician()
+        self.pop = make_track(self.musician, title='Pop Hit', plays=5)
+        self.rock = make_track(self.musician, title='Rock Hit', genre='Rock', plays=3, likes=9)
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def ids(self, tracks):
+        return [track['id'] for track in tracks]
+
+    def test_charts_by_plays_likes_and_genre(self):
+        data = self.client.get('/api/tracks/charts/').json()
+        self.assertEqual(self.ids(data['by_plays']), [self.pop.pk, self.rock.pk])
+        self.assertEqual(self.ids(data['by_likes']), [self.rock.pk, self.pop.pk])
+
+        rock = self.client.get('/api/tracks/charts/?genre=Rock').json()
+        self.assertEqual(self.ids(rock['by_plays']), [self.rock.pk])
+        self.assertEqual(
+            self.client.get('/api/tracks/charts/?genre=Polka').status_code, 400
+        )
+
+    def test_plays_update_charts_incrementally(self):
+        self.client.get('/api/tracks/charts/')
+        for _ in range(3):
+            self.client.post(f'/api/tracks/{self.rock.pk}/play/')
+        data = self.client.get('/api/tracks/charts/').json()
+        self.assertEqual(self.ids(data['by_plays']), [self.rock.pk, self.pop.pk])
+        self.assertEqual(self.ids(data['today']), [self.rock.pk])
+        self.assertEqual(self.ids(data['week']), [self.rock.pk])
+
+    def test_served_from_cache_with_etag(self):
+        first = self.client.get('/api/tracks/charts/')
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/tracks/charts/')
+        self.assertEqual(cached.json(), first.json())
+
+        not_modified = self.client.get('/api/tracks/charts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.client.post(f'/api/tracks/{self.pop.pk}/play/')
+        changed = self.client.get('/api/tracks/charts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_etag_only_changes_with_the_rankings(self):
+        self.client.post(f'/api/tracks/{self.pop.pk}/play/')
+        etag = self.client.get('/api/tracks/charts/')['ETag']
+        self.client.post(f'/api/tracks/{self.pop.pk}/play/')
+        self.assertEqual(self.client.get('/api/tracks/charts/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for _ in range(3):
+            self.client.post(f'/api/tracks/{self.rock.pk}/play/')
+        self.assertEqual(self.client.get('/api/tracks/charts/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(CHARTS_LOCK_WAIT=0)
+    def test_updates_are_serialized_across_workers(self):
+        self.client.get('/api/tracks/charts/')
+        # Another worker sharing the cache is in the middle of an update.
+        cache.add(charts.LOCK_KEY, 'other worker', charts.LOCK_TIMEOUT)
+        for _ in range(3):
+            self.client.post(f'/api/tracks/{self.rock.pk}/play/')
+        # The flush could not merge its deltas, so it dropped the state...
+        self.assertIsNone(cache.get(charts.STATE_KEY))
+        # ...and reads rebuild it without storing it over the other update.
+        data = self.client.get('/api/tracks/charts/').json()
+        self.assertEqual(self.ids(data['by_plays']), [self.rock.pk, self.pop.pk])
+        self.assertIsNone(cache.get(charts.STATE_KEY))
+        self.assertEqual(cache.get(charts.LOCK_KEY), 'other worker')
+
+        cache.delete(charts.LOCK_KEY)
+        self.client.get('/api/tracks/charts/')
+        self.assertIsNotNone(cache.get(charts.STATE_KEY))
+        self.assertIsNone(cache.get(charts.LOCK_KEY))
+
+    def test_windows_are_rebuilt_from_rollups_and_events(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        TrackPlayRollup.objects.bulk_create([
+            TrackPlayRollup(track=self.rock, granularity='hour', bucket=hour - timedelta(days=3), plays=4),
+            TrackPlayRollup(track=self.pop, granularity='hour', bucket=hour - timedelta(days=30), plays=50),
+            # The latest rolled-up hour is counted from the events instead.
+            TrackPlayRollup(track=self.pop, granularity='hour', bucket=hour, plays=1),
+        ])
+        play_events.record(self.pop)
+        play_events.record(self.pop)
+        chart_engine.invalidate()
+        data = self.client.get('/api/tracks/charts/').json()
+        self.assertEqual(self.ids(data['today']), [self.pop.pk])
+        self.assertEqual(self.ids(data['week']), [self.rock.pk, self.pop.pk])
+        self.assertEqual(chart_engine.state()['lists']['all']['week'], [(self.rock.pk, 4), (self.pop.pk, 2)])
+
+    def test_deactivated_tracks_drop_out(self):
+        self.client.get('/api/tracks/charts/')
+        self.pop.is_active = False
+        self.pop.save()
+        data = self.client.get('/api/tracks/charts/').json()
+        self.assertEqual(self.ids(data['by_plays']), [self.rock.pk])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.musician = make_musician()
+        self.a, self.b, self.c, self.d = [
+            make_track(self.musician, title=name, plays=plays)
+            for name, plays in (('A', 1), ('B', 2), ('C', 3), ('D', 50))
+        ]
+        self.listener = CustomUser.objects.create_user(
+            email='listener@example.com', username='listener', password='pass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.listener)
+
+    def test_compute_scores_co_occurring_unseen_tracks(self):
+        rows = [
+            (1, 10, 1), (1, 10, 2),           # user 10: tracks 1, 2
+            (2, 20, 1), (2, 20, 3),           # user 20: 1 and 3 together
+            (3, 30, 2), (3, 30, 3), (3, 30, 4),
+        ]
+        result = recommendations.compute(rows, eligible_ids=[1, 2, 3], size=5)
+        self.assertEqual(result[10], [3])
+        self.assertEqual(result[20], [2])
+        self.assertNotIn(4, sum(result.values(), []))
+
+    def test_endpoint_serves_stored_recommendations(self):
+        mine = Playlist.objects.create(user=self.listener, name='Mine')
+        mine.add_track(self.a)
+        other = Playlist.objects.create(user=self.musician, name='Theirs')
+        other.add_track(self.a)
+        other.add_track(self.c)
+        recommendations.build()
+        chart_engine.rebuild()
+
+        # One store lookup plus one query for the tracks; padding comes from the charts.
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/tracks/recommendations/').json()
+        ids = [track['id'] for track in data]
+        self.assertEqual(ids[0], self.c.pk)
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_cold_start_uses_charts_without_duplicates(self):
+        playlist = Playlist.objects.create(user=self.listener, name='Mine')
+        playlist.add_track(self.d)
+        data = self.client.get('/api/tracks/recommendations/').json()
+        ids = [track['id'] for track in data]
+        self.assertEqual(ids[0], self.d.pk)
+        self.assertEqual(len(ids), len(set(ids)))
+
+
+class StreamTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        os.makedirs(os.path.join(self.media, 'tracks'))
+        self.content = bytes(range(256)) * 40
+        with open(os.path.join(self.media, 'tracks', 'song.mp3'), 'wb') as f:
+            f.write(self.content)
+        self.musician = make_musician()
+        self.track = make_track(self.musician, title='song')
+        self.url = f'/api/tracks/{self.track.pk}/stream/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_file(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='audio/*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        self.assertEqual(self.body(response), self.content)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(self.body(response), self.content[100:200])
+
+        tail = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.body(tail), self.content[-10:])
+        open_ended = self.client.get(self.url, HTTP_RANGE='bytes=10000-')
+        self.assertEqual(self.body(open_ended), self.content[10000:])
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        fresh = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(fresh.status_code, 206)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_offload_to_nginx(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/tracks/song.mp3')
+        self.assertEqual(response.content, b'')
+
+    def test_signed_url_needs_no_jwt(self):
+        stream_url = self.client.post(f'/api/tracks/{self.track.pk}/play/').data['stream_url']
+        player = APIClient()
+        self.assertEqual(player.get(self.url).status_code, 401)
+        response = player.get(stream_url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[:10])
+
+        other = make_track(self.musician, title='other')
+        query = stream_url.split('?')[1]
+        self.assertEqual(player.get(f'/api/tracks/{other.pk}/stream/?{query}').status_code, 401)
+        params = signed_stream_params(self.track.pk)
+        params['signature'] = params['signature'][:-1] + ('A' if params['signature'][-1] != 'A' else 'B')
+        self.assertEqual(player.get(self.url, params).status_code, 401)
+        with override_settings(STREAM_URL_MAX_AGE=-1):
+            expired = signed_stream_params(self.track.pk)
+        self.assertEqual(player.get(self.url, expired).status_code, 401)
+
+
+def wav_bytes(seconds=1.0, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(rate)
+        audio.writeframes(b'\x00\x01' * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def png_bytes(size=(640, 480)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_WORKERS=0)
+class MediaPipelineTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.musician = make_musician()
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def upload(self, audio):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tracks/', {
+                'title': 'Upload', 'description': 'd', 'genre': 'Pop',
+                'audio_file': SimpleUploadedFile('upload.wav', audio, 'audio/wav'),
+                'cover_image': SimpleUploadedFile('cover.png', png_bytes(), 'image/png'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Track.objects.get(title='Upload')
+
+    def test_upload_is_processed_after_commit(self):
+        track = self.upload(wav_bytes(seconds=1.5))
+        self.assertEqual(track.processing_status, 'ready')
+        self.assertAlmostEqual(track.duration, 1.5)
+        with Image.open(track.cover_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (300, 300))
+
+        data = self.client.get(f'/api/tracks/{track.pk}/').data
+        self.assertEqual(data['processing_status'], 'ready')
+        self.assertTrue(data['thumbnail_url'].endswith('.jpg'))
+
+    def test_broken_upload_is_marked_failed(self):
+        with self.assertLogs('core.processing', 'ERROR'):
+            track = self.upload(b'RIFF not really a wave file')
+        self.assertEqual(track.processing_status, 'failed')
+
+    def test_stream_rendition(self):
+        track = make_track(self.musician, renditions={'128': 'tracks/renditions/r_128k.mp3'})
+        os.makedirs(os.path.join(self.media, 'tracks', 'renditions'))
+        with open(os.path.join(self.media, 'tracks', 'renditions', 'r_128k.mp3'), 'wb') as f:
+            f.write(b'128k')
+        response = self.client.get(f'/api/tracks/{track.pk}/stream/', {'bitrate': '128'})
+        self.assertEqual(b''.join(response.streaming_content), b'128k')
+        self.assertEqual(self.client.get(f'/api/tracks/{track.pk}/stream/', {'bitrate': '320'}).status_code, 404)
+
+
+@override_settings(MEDIA_WORKERS=0, CHUNKED_UPLOAD_MAX_CHUNK=4096)
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.override(CHUNKED_UPLOAD_DIR=os.path.join(self.media, 'staging'))
+        self.musician = make_musician()
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+        self.audio = wav_bytes(seconds=1)
+
+    def start(self, **extra):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'long.wav', 'size': len(self.audio),
+            'checksum': hashlib.sha256(self.audio).hexdigest(), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return f'/api/uploads/{response.data["id"]}/'
+
+    def send(self, url, offset, chunk, **headers):
+        return self.client.generic(
+            'PATCH', url, chunk, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **headers
+        )
+
+    def test_resumable_upload_creates_track(self):
+        url = self.start()
+        self.assertEqual(self.send(url, 0, self.audio[:4000]).data['offset'], 4000)
+        # A retried chunk at a stale offset is rejected with the offset to resume from.
+        stale = self.send(url, 0, self.audio[:4000])
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale['Upload-Offset'], '4000')
+        self.assertEqual(self.client.get(url).data['offset'], 4000)
+
+        for offset in range(4000, len(self.audio), 4000):
+            chunk = self.audio[offset:offset + 4000]
+            response = self.send(
+                url, offset, chunk, HTTP_UPLOAD_CHECKSUM=f'sha256 {hashlib.sha256(chunk).hexdigest()}'
+            )
+            self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{url}complete/', {
+                'title': 'Chunked', 'description': 'd', 'genre': 'Rock',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        track = Track.objects.get(pk=response.data['id'])
+        with track.audio_file.open('rb') as f:
+            self.assertEqual(f.read(), self.audio)
+        self.assertEqual(track.processing_status, 'ready')
+        self.assertFalse(os.listdir(os.path.join(self.media, 'staging')))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_bad_chunks_are_rejected(self):
+        url = self.start()
+        mismatch = self.send(url, 0, self.audio[:100], HTTP_UPLOAD_CHECKSUM='sha256 ' + '0' * 64)
+        self.assertEqual(mismatch.status_code, 400)
+        self.assertEqual(self.client.get(url).data['offset'], 0)
+        self.assertEqual(self.send(url, 0, self.audio[:5000]).status_code, 413)
+
+        incomplete = self.client.post(f'{url}complete/', {'title': 'x'}, format='json')
+        self.assertEqual(incomplete.status_code, 409)
+
+    def test_whole_file_checksum_and_validation(self):
+        url = self.start(checksum='f' * 64)
+        for offset in range(0, len(self.audio), 4000):
+            self.send(url, offset, self.audio[offset:offset + 4000])
+        response = self.client.post(f'{url}complete/', {'title': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).data['offset'], 0)
+
+        too_large = self.client.post('/api/uploads/', {'filename': 'a.wav', 'size': 51 * 1024 * 1024}, format='json')
+        self.assertEqual(too_large.status_code, 400)
+
+
+class WaveformTests(TempMediaMixin, TestCase):
+    def test_peaks_are_interleaved_int8_pairs(self):
+        samples = np.concatenate([np.full(100, 0.5), np.full(100, -1.0), np.zeros(100)])
+        data = peaks(samples, 3)
+        self.assertEqual(data.dtype, np.int8)
+        self.assertEqual(data.tolist(), [64, 64, -127, -127, 0, 0])
+        # Never more points than samples.
+        self.assertEqual(len(peaks(np.array([0.1, -0.1]), 1000)), 4)
+
+    def test_stereo_wav_decoding(self):
+        path = os.path.join(self.media, 'stereo.wav')
+        frames = np.array([[0, 16384], [-32768, 0]] * 10, dtype='<i2')
+        with wave.open(path, 'wb') as audio:
+            audio.setnchannels(2)
+            audio.setsampwidth(2)
+            audio.setframerate(8000)
+            audio.writeframes(frames.tobytes())
+        samples = decode_samples({'audio_path': path, 'ffmpeg': None})
+        self.assertEqual(samples[:2].tolist(), [0.5, -1.0])
+
+    @override_settings(MEDIA_WORKERS=0, WAVEFORM_POINTS=50)
+    def test_waveform_endpoint(self):
+        musician = make_musician()
+        track = make_track(musician, audio_file=SimpleUploadedFile('w.wav', wav_bytes(seconds=1)))
+        client = APIClient()
+        client.force_authenticate(musician)
+        self.assertEqual(client.get(f'/api/tracks/{track.pk}/waveform/').status_code, 404)
+
+        media_pipeline.submit(track.pk)
+        url = client.get(f'/api/tracks/{track.pk}/').data['waveform_url']
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)), 100)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        unversioned = client.get(f'/api/tracks/{track.pk}/waveform/')
+        self.assertIn('no-cache', unversioned['Cache-Control'])
+
+    def test_missing_waveforms_are_backfilled(self):
+        musician = make_musician()
+        legacy = make_track(musician, title='legacy', processing_status='ready')
+        Track.objects.filter(pk=legacy.pk).update(waveform=None)
+        empty = make_track(musician, title='empty', processing_status='ready')
+        make_track(musician, title='done', processing_status='ready', waveform='tracks/done.peaks')
+        with mock.patch.object(media_pipeline, 'submit') as submit, mock.patch.object(media_pipeline, 'shutdown'):
+            call_command('process_media', missing_waveforms=True, stdout=io.StringIO())
+        self.assertEqual([call.args[0] for call in submit.call_args_list], [legacy.pk, empty.pk])
+
+
+class PlaylistOrderTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        self.tracks = [make_track(self.musician, title=f't{n}') for n in range(6)]
+        self.ids = [track.pk for track in self.tracks]
+        self.playlist = Playlist.objects.create(user=self.musician, name='Mix')
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+        self.url = f'/api/playlists/{self.playlist.pk}/'
+
+    def order(self):
+        return list(
+            PlaylistTrack.objects.filter(playlist=self.playlist).order_by('order').values_list('track_id', flat=True)
+        )
+
+    def test_bulk_add_and_remove(self):
+        response = self.client.post(f'{self.url}add_tracks/', {'track_ids': self.ids[:4]}, format='json')
+        self.assertEqual(response.data['added'], self.ids[:4])
+        response = self.client.post(f'{self.url}add_tracks/', {'track_ids': self.ids[2:]}, format='json')
+        self.assertEqual(response.data['added'], self.ids[4:])
+        self.assertEqual(self.order(), self.ids)
+        bad = self.client.post(f'{self.url}add_tracks/', {'track_ids': [self.ids[0], 999999]}, format='json')
+        self.assertEqual(bad.data['track_ids'], [999999])
+
+        response = self.client.post(f'{self.url}remove_tracks/', {'track_ids': self.ids[::2]}, format='json')
+        self.assertEqual(response.data['removed'], 3)
+        self.assertEqual(self.order(), self.ids[1::2])
+        # A single add after removals still goes to the end.
+        self.client.post(f'{self.url}add_track/', {'track_id': self.ids[0]}, format='json')
+        self.assertEqual(self.order(), self.ids[1::2] + [self.ids[0]])
+
+    def test_reorder_is_one_update(self):
+        self.playlist.add_tracks(self.ids)
+        new_order = self.ids[::-1]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'{self.url}reorder_tracks/', {'track_ids': new_order}, format='json')
+        self.assertEqual(response.status_code, 200)
+        updates = [q for q in queries.captured_queries if 'UPDATE "core_playlisttrack"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.order(), new_order)
+        self.assertEqual(
+            [track['id'] for track in self.client.get(self.url).data['tracks']], new_order
+        )
+
+    def test_single_move_updates_one_row(self):
+        self.playlist.add_tracks(self.ids)
+        url = f'{self.url}reorder_tracks/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'track_id': self.ids[5], 'position': 0}, format='json')
+        self.assertEqual(response.status_code, 200)
+        updates = [q['sql'] for q in queries.captured_queries if 'UPDATE "core_playlisttrack"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('VALUES', updates[0])
+        self.assertEqual(self.order(), [self.ids[5]] + self.ids[:5])
+
+        missing = self.client.post(url, {'track_id': 999999, 'position': 0}, format='json')
+        self.assertEqual(missing.status_code, 400)
+        no_position = self.client.post(url, {'track_id': self.ids[0]}, format='json')
+        self.assertEqual(no_position.status_code, 400)
+
+    def test_legacy_track_orders(self):
+        self.playlist.add_tracks(self.ids)
+        url = f'{self.url}reorder_tracks/'
+        # A partial list sets the listed orders against the others' positions.
+        self.client.post(url, {'track_orders': [{'track_id': self.ids[0], 'order': 99}]}, format='json')
+        self.assertEqual(self.order(), self.ids[1:] + self.ids[:1])
+        self.client.post(url, {'track_orders': [{'track_id': self.ids[0], 'order': 2}]}, format='json')
+        self.assertEqual(self.order(), self.ids[1:3] + self.ids[:1] + self.ids[3:])
+
+        full = [{'track_id': track_id, 'order': n} for n, track_id in enumerate(self.ids[::-1])]
+        self.client.post(url, {'track_orders': full}, format='json')
+        self.assertEqual(self.order(), self.ids[::-1])
+        bad = self.client.post(url, {'track_orders': [{'track_id': self.ids[0]}]}, format='json')
+        self.assertEqual(bad.status_code, 400)
+
+    def test_move_uses_gaps_then_renumbers(self):
+        self.playlist.add_tracks(self.ids)
+        self.playlist.move_track(self.ids[5], 0)
+        self.assertEqual(self.order(), [self.ids[5]] + self.ids[:5])
+        self.playlist.move_track(self.ids[5], 99)
+        self.assertEqual(self.order(), self.ids)
+        # Bisecting the same gap over and over eventually forces a renumber.
+        for n in range(12):
+            self.playlist.move_track(self.ids[n % 2 + 4], 1)
+        self.assertEqual(self.order()[:3], [self.ids[0], self.ids[5], self.ids[4]])
+        self.assertEqual(len(set(PlaylistTrack.objects.values_list('order', flat=True))), 6)
+        with self.assertRaises(ValueError):
+            self.playlist.move_track(999999, 0)
+
+    def test_batch_operations(self):
+        self.playlist.add_tracks(self.ids[:3])
+        inactive = make_track(self.musician, title='hidden', is_active=False)
+        operations = [
+            {'op': 'add', 'track_id': self.ids[3]},
+            {'op': 'add', 'track_id': self.ids[0]},
+            {'op': 'add', 'track_id': inactive.pk},
+            {'op': 'remove', 'track_id': self.ids[1]},
+            {'op': 'remove', 'track_id': self.ids[5]},
+            {'op': 'add', 'track_id': self.ids[4], 'position': 0},
+            {'op': 'move', 'track_id': self.ids[3], 'position': 1},
+        ]
+        response = self.client.post(f'{self.url}batch/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['added', 'error', 'error', 'removed', 'error', 'added', 'moved'],
+        )
+        self.assertEqual(response.data['applied'], 4)
+        self.assertEqual(self.order(), [self.ids[4], self.ids[3], self.ids[0], self.ids[2]])
+
+        invalid = self.client.post(f'{self.url}batch/', {'operations': [{'op': 'copy', 'track_id': 1}]}, format='json')
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_batch_moves_only_rewrite_the_placed_rows(self):
+        self.playlist.add_tracks(self.ids[:5])
+        orders = lambda: dict(PlaylistTrack.objects.filter(playlist=self.playlist).values_list('track_id', 'order'))
+        before = orders()
+        operations = [
+            {'op': 'move', 'track_id': self.ids[4], 'position': 0},
+            {'op': 'add', 'track_id': self.ids[5], 'position': 1},
+        ]
+        self.client.post(f'{self.url}batch/', {'operations': operations}, format='json')
+        self.assertEqual(self.order(), [self.ids[4], self.ids[5]] + self.ids[:4])
+        after = orders()
+        self.assertEqual([track_id for track_id in before if before[track_id] != after[track_id]], [self.ids[4]])
+
+        # Once a gap is used up the batch falls back to renumbering.
+        operations = [{'op': 'move', 'track_id': self.ids[n % 2 + 2], 'position': 1} for n in range(12)]
+        self.client.post(f'{self.url}batch/', {'operations': operations}, format='json')
+        self.assertEqual(self.order()[:3], [self.ids[4], self.ids[3], self.ids[2]])
+        self.assertEqual(sorted(orders().values()), [ORDER_GAP * n for n in range(1, 7)])
+
+    def test_batch_query_count_is_constant(self):
+        def run(track_ids):
+            operations = [{'op': 'add', 'track_id': track_id} for track_id in track_ids]
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(f'{self.url}batch/', {'operations': operations}, format='json')
+            return len(queries)
+
+        extra = [make_track(self.musician, title=f'x{n}').pk for n in range(30)]
+        self.assertEqual(run(self.ids[:2]), run(self.ids[2:] + extra))
+        # Appends keep the existing rows' orders untouched.
+        self.assertEqual(self.order(), self.ids + extra)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        response_cache.reset_stats()
+        self.musician = make_musician()
+        self.track = make_track(self.musician, title='Cached')
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def test_track_reads_are_cached_until_the_track_changes(self):
+        url = f'/api/tracks/{self.track.pk}/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/tracks/', {'genre': 'Pop'})['X-Cache'], 'MISS')
+
+        self.track.title = 'Renamed'
+        self.track.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['title'], 'Renamed')
+        self.assertEqual(response_cache.stats()['tracks']['hits'], 1)
+
+    def test_playlists_are_per_user_and_follow_bulk_changes(self):
+        playlist = Playlist.objects.create(user=self.musician, name='Mine')
+        url = f'/api/playlists/{playlist.pk}/'
+        self.assertEqual(self.client.get(url).data['tracks'], [])
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        other = APIClient()
+        other.force_authenticate(make_musician('other'))
+        self.assertEqual(other.get(url).status_code, 404)
+
+        playlist.add_tracks([self.track.pk])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([track['id'] for track in response.data['tracks']], [self.track.pk])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lru-test',
+            'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 4},
+        },
+    })
+    def test_lru_eviction(self):
+        # Three entries plus the generation key fill the cache.
+        for n in range(3):
+            self.client.get('/api/tracks/', {'page': n})
+        self.assertEqual(self.client.get('/api/tracks/', {'page': 0})['X-Cache'], 'HIT')
+        self.client.get('/api/tracks/', {'page': 3})  # evicts page 1, the least recently used
+        self.assertEqual(self.client.get('/api/tracks/', {'page': 0})['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/tracks/', {'page': 1})['X-Cache'], 'MISS')
+
+    def test_deletes_invalidate_playlists_without_a_query_per_entry(self):
+        tracks = Track.objects.bulk_create(
+            Track(musician=self.musician, title=f't{n}', description='', genre='Pop', audio_file=f'tracks/t{n}.mp3')
+            for n in range(200)
+        )
+        playlist = Playlist.objects.create(user=self.musician, name='Big')
+        playlist.add_tracks([track.pk for track in tracks])
+        url = f'/api/playlists/{playlist.pk}/'
+        self.client.get(url)
+        # Savepoint, touch, select, delete, one owner lookup, release.
+        with self.assertNumQueries(6):
+            playlist.remove_tracks([track.pk for track in tracks[:100]])
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(3):
+            playlist.delete()
+
+        playlists = [Playlist.objects.create(user=self.musician, name=f'p{n}') for n in range(20)]
+        for other in playlists:
+            other.add_tracks([self.track.pk])
+        url = f'/api/playlists/{playlists[0].pk}/'
+        self.client.get(url)
+        # The entries, then one DELETE per related table and the track.
+        with self.assertNumQueries(6):
+            self.track.delete()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, 403)
+        admin = APIClient()
+        admin.force_authenticate(CustomUser.objects.create_superuser(email='admin@example.com', password='x'))
+        self.client.get('/api/tracks/')
+        self.assertEqual(admin.get('/api/cache/stats/').data['tracks']['misses'], 1)
+
+
+class FastTrackSerializerTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        self.musician = make_musician()
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def test_matches_track_serializer(self):
+        make_track(self.musician, title='plain')
+        make_track(
+            self.musician, title='processed', description='ünïcode & spaces', plays=7, likes=2,
+            cover_image='covers/a b.png', cover_thumbnail='covers/thumbs/1_a.jpg',
+            renditions={'128': 'tracks/renditions/x_128k.mp3', '64': 'tracks/renditions/x_64k.mp3'},
+            waveform='tracks/processed.0123abcd.peaks', duration=12.5, processing_status='ready',
+        )
+        listed = self.client.get('/api/tracks/').json()['results']
+        self.assertEqual(len(listed), 2)
+        for row in listed:
+            self.assertEqual(row, self.client.get(f'/api/tracks/{row["id"]}/').json())
+        self.assertEqual(listed[0]['bitrates'], [64, 128])
+
+    def test_pagination_and_search_over_rows(self):
+        for n in range(5):
+            make_track(self.musician, title=f'Night {n}', plays=n)
+        page = self.client.get('/api/tracks/', {'page_size': 2}).json()
+        self.assertEqual([row['title'] for row in page['results']], ['Night 4', 'Night 3'])
+        rest = self.client.get(page['next']).json()
+        self.assertEqual([row['title'] for row in rest['results']], ['Night 2', 'Night 1'])
+
+        found = self.client.get('/api/tracks/', {'search': 'night', 'page_size': 3}).json()
+        self.assertEqual(len(found['results']), 3)
+        self.assertEqual(len(self.client.get(found['next']).json()['results']), 2)
+
+
+class PlayEventTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        self.listener = CustomUser.objects.create_user(email='l@example.com', username='l', password='x')
+        self.track = make_track(self.musician, genre='Jazz')
+
+    def test_plays_are_logged(self):
+        client = APIClient()
+        client.force_authenticate(self.listener)
+        client.post(f'/api/tracks/{self.track.pk}/play/')
+        event = PlayEvent.objects.get()
+        self.assertEqual(
+            (event.track_id, event.musician_id, event.genre, event.user_id),
+            (self.track.pk, self.musician.pk, 'Jazz', self.listener.pk),
+        )
+
+    def test_rollups_are_incremental(self):
+        day = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        other = make_track(self.musician, title='Other', genre='Rock')
+        for minutes, track, user in [(5, self.track, self.listener), (20, self.track, self.listener),
+                                     (70, self.track, None), (75, other, self.listener)]:
+            play_events.record(track, user, played_at=day + timedelta(minutes=minutes))
+        events.rollup()
+
+        hourly = dict(
+            TrackPlayRollup.objects.filter(track=self.track, granularity='hour')
+            .values_list('bucket', 'plays')
+        )
+        self.assertEqual(hourly, {day: 2, day + timedelta(hours=1): 1})
+        daily = MusicianPlayRollup.objects.get(musician=self.musician, granularity='day')
+        self.assertEqual((daily.plays, daily.listeners), (4, 1))
+        self.assertEqual(
+            dict(GenrePlayRollup.objects.filter(granularity='day').values_list('genre', 'plays')),
+            {'Jazz': 3, 'Rock': 1},
+        )
+
+        # A late event for the last hour and a new one are folded in without duplicates.
+        play_events.record(other, None, played_at=day + timedelta(minutes=80))
+        play_events.record(self.track, None, played_at=day + timedelta(hours=3))
+        events.rollup()
+        self.assertEqual(
+            TrackPlayRollup.objects.get(track=other, granularity='hour').plays, 2
+        )
+        self.assertEqual(TrackPlayRollup.objects.filter(track=self.track, granularity='hour').count(), 3)
+        self.assertEqual(MusicianPlayRollup.objects.get(musician=self.musician, granularity='day').plays, 6)
+
+    def test_purge_keeps_recent_events(self):
+        play_events.record(self.track, None, played_at=timezone.now() - timedelta(days=100))
+        play_events.record(self.track, None)
+        events.purge_events(retention_days=90)
+        self.assertEqual(PlayEvent.objects.count(), 1)
+
+
+class MusicianDashboardTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        self.hit = make_track(self.musician, title='Hit', plays=40)
+        self.other = make_track(self.musician, title='Other', plays=3)
+        listener = CustomUser.objects.create_user(email='l@example.com', username='l', password='x')
+        now = timezone.now()
+        for played_at, track, user in [(now, self.hit, listener), (now, self.hit, None),
+                                       (now - timedelta(days=1), self.hit, listener),
+                                       (now - timedelta(days=1), self.other, listener),
+                                       (now - timedelta(days=20), self.other, None)]:
+            play_events.record(track, user, played_at=played_at)
+        events.rollup()
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+        self.url = f'/api/musicians/{self.musician.pk}/dashboard/'
+
+    def test_dashboard_reads_rollups(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 3)
+        data = response.data
+        self.assertEqual(
+            data['totals'], {'tracks': 2, 'plays': 43, 'likes': 0, 'period_plays': 4}
+        )
+        self.assertEqual(len(data['series']), 7)
+        self.assertEqual(
+            [(point['plays'], point['listeners']) for point in data['series'][-2:]], [(2, 1), (2, 1)]
+        )
+        self.assertEqual(
+            [(row['title'], row['period_plays']) for row in data['top_tracks']], [('Hit', 3), ('Other', 1)]
+        )
+
+        data = self.client.get(self.url, {'days': 30}).data
+        self.assertEqual(data['totals']['period_plays'], 5)
+        self.assertEqual(
+            [(row['title'], row['period_plays']) for row in data['top_tracks']], [('Hit', 3), ('Other', 2)]
+        )
+
+    def test_hourly_series(self):
+        response = self.client.get(self.url, {'days': 7, 'granularity': 'hour'})
+        self.assertEqual(len(response.data['series']), 7 * 24)
+        self.assertEqual(response.data['series'][-1]['plays'], 2)
+        self.assertEqual(self.client.get(self.url, {'days': 30, 'granularity': 'hour'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'days': 12}).status_code, 400)
+
+    def test_access(self):
+        listener = CustomUser.objects.get(username='l')
+        self.client.force_authenticate(listener)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(f'/api/musicians/{listener.pk}/dashboard/').status_code, 404)
+
+
+class QueryPlanTests(TestCase):
+    """Endpoint queries must be served by indexes, not full table scans, on a large catalog."""
+
+    tables = (
+        'core_track', 'core_playlist', 'core_playlisttrack', 'core_customuser',
+        'core_musicianplayrollup', 'core_trackplaywindow',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        musicians = CustomUser.objects.bulk_create(
+            CustomUser(email=f'm{n}@example.com', username=f'm{n}', is_musician=True) for n in range(100)
+        )
+        genres = [genre for genre, _ in Track.GENRE_CHOICES]
+        Track.objects.bulk_create(
+            Track(musician=musicians[n % 100], title=f'Song {n}', description='', genre=genres[n % len(genres)],
+                  audio_file='tracks/song.mp3', plays=n * 7 % 1000, likes=n % 50, trending=n * 13 % 997,
+                  is_active=n % 20 != 7)
+            for n in range(5000)
+        )
+        cls.musician = musicians[0]
+        cls.playlist = Playlist.objects.create(user=cls.musician, name='Mix')
+        cls.playlist.add_tracks(list(Track.objects.values_list('id', flat=True)[:200]))
+        for n in range(1, 100):
+            Playlist.objects.create(user=musicians[n], name='Other')
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        MusicianPlayRollup.objects.bulk_create(
+            MusicianPlayRollup(musician=musician, granularity='day', bucket=today - timedelta(days=day), plays=1)
+            for musician in musicians for day in range(90)
+        )
+        TrackPlayWindow.objects.bulk_create(
+            TrackPlayWindow(track_id=track_id, musician_id=musician_id, days=days, plays=1)
+            for track_id, musician_id in Track.objects.values_list('id', 'musician_id')
+            for days in events.WINDOWS
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def urls(self):
+        """Each endpoint with the indexes its queries must use (besides primary keys)."""
+        track = Track.objects.filter(musician=self.musician, is_active=True).first()
+        chart_indexes = (
+            'track_active_plays_idx', 'track_active_likes_idx', 'track_active_genre_plays_idx',
+            'track_active_genre_likes_idx', 'trackrollup_bucket_idx',
+        )
+        return {
+            '/api/tracks/': ('track_active_plays_idx',),
+            '/api/tracks/?genre=Jazz': ('track_active_genre_plays_idx',),
+            f'/api/tracks/?musician={self.musician.pk}': ('track_active_musician_idx',),
+            f'/api/tracks/?genre=Rock&musician={self.musician.pk}': ('track_active_musician_idx',),
+            '/api/tracks/?sort=trending': ('track_active_trending_idx',),
+            '/api/tracks/?sort=trending&genre=Jazz': ('track_active_genre_trend_idx',),
+            self.client.get('/api/tracks/').data['next']: ('track_active_plays_idx',),
+            self.client.get('/api/tracks/?sort=trending').data['next']: ('track_active_trending_idx',),
+            f'/api/tracks/{track.pk}/': (),
+            '/api/tracks/charts/': chart_indexes,
+            '/api/tracks/charts/?genre=Jazz': chart_indexes,
+            '/api/tracks/recommendations/': (),
+            '/api/playlists/': ('playlist_user_updated_idx', 'playlisttrack_order_idx'),
+            f'/api/playlists/{self.playlist.pk}/': ('playlisttrack_order_idx',),
+            f'/api/musicians/{self.musician.pk}/dashboard/': ('trackwindow_top_idx',),
+        }
+
+    def selects(self, url):
+        cache.clear()  # chart state too, so chart URLs run their rebuild queries
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('SELECT')]
+
+    @skipUnless(connection.vendor == 'sqlite', 'index names in EXPLAIN QUERY PLAN are checked on SQLite')
+    def test_endpoints_use_their_indexes(self):
+        for url, indexes in self.urls().items():
+            with self.subTest(url=url):
+                details = []
+                for sql in self.selects(url):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                        details.extend(row[-1] for row in cursor.fetchall())
+                used = {detail.split(' INDEX ')[1].split()[0] for detail in details if ' INDEX ' in detail}
+                self.assertEqual(set(indexes) - used, set(), details)
+                # Large tables are never read without an index.
+                bare = [detail for detail in details if detail.startswith('SCAN ') and ' USING ' not in detail]
+                self.assertEqual([detail for detail in bare if detail.split()[1] in self.tables], [], details)
+
+    @skipUnless(connection.vendor == 'postgresql', 'plans are read from EXPLAIN (FORMAT JSON)')
+    def test_no_sequential_scans(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                for sql in self.selects(url):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                        nodes, scans = [cursor.fetchone()[0][0]['Plan']], []
+                    while nodes:
+                        node = nodes.pop()
+                        nodes.extend(node.get('Plans', []))
+                        if node['Node Type'] == 'Seq Scan':
+                            scans.append(node['Relation Name'])
+                    self.assertEqual([table for table in scans if table in self.tables], [], sql)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class AsyncViewTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches['responses'].clear()
+        os.makedirs(os.path.join(self.media, 'tracks'))
+        self.content = bytes(range(256)) * 40
+        with open(os.path.join(self.media, 'tracks', 'song.mp3'), 'wb') as f:
+            f.write(self.content)
+
+        self.musician = make_musician()
+        self.tracks = [
+            make_track(self.musician, title=f'Song {n}', genre='Jazz' if n % 2 else 'Pop', plays=n)
+            for n in range(5)
+        ]
+        self.track = make_track(self.musician, title='song')
+        self.playlist = Playlist.objects.create(user=self.musician, name='Mix')
+        self.playlist.add_tracks([self.tracks[3].pk, self.tracks[0].pk])
+        self.auth = f'Bearer {AccessToken.for_user(self.musician)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+
+    def assertSameAsSync(self, path, params=None):
+        sync = self.client.get(f'/api/{path}', params)
+        response = self.client.get(f'/api/async/{path}', params)
+        self.assertEqual(response.status_code, sync.status_code, path)
+        self.assertEqual(response.json(), sync.json(), path)
+        return response.json()
+
+    def test_read_endpoints_match_sync_views(self):
+        self.assertSameAsSync('tracks/', {'genre': 'Jazz'})
+        self.assertSameAsSync('tracks/charts/')
+        self.assertSameAsSync('tracks/recommendations/')
+        self.assertSameAsSync(f'playlists/{self.playlist.pk}/')
+        self.assertEqual(
+            self.client.get(f'/api/async/playlists/{self.playlist.pk}/')['X-Cache'], 'HIT'
+        )
+
+    def test_track_list_pages(self):
+        page = self.client.get('/api/async/tracks/', {'page_size': 2}).json()
+        self.assertEqual([row['title'] for row in page['results']], ['Song 4', 'Song 3'])
+        self.assertIn('/api/async/tracks/', page['next'])
+        rest = self.client.get(page['next']).json()
+        self.assertEqual([row['title'] for row in rest['results']], ['Song 2', 'Song 1'])
+
+    def test_authentication_and_ownership(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/api/async/tracks/').status_code, 401)
+        anonymous.credentials(HTTP_AUTHORIZATION='Bearer nonsense')
+        self.assertEqual(anonymous.get('/api/async/tracks/').status_code, 401)
+        other = CustomUser.objects.create_user(email='o@example.com', username='o', password='x')
+        anonymous.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.assertEqual(anonymous.get(f'/api/async/playlists/{self.playlist.pk}/').status_code, 404)
+        self.assertEqual(self.client.post('/api/async/tracks/').status_code, 405)
+
+    async def test_stream_ranges(self):
+        client = AsyncClient()
+        url = f'/api/async/tracks/{self.track.pk}/stream/'
+        response = await client.get(url, headers={'Authorization': self.auth, 'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content[100:200])
+        response = await client.get(url, headers={'Authorization': self.auth})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+        response = await client.get(url, {'bitrate': '128'}, headers={'Authorization': self.auth})
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual((await client.get(url)).status_code, 401)
+        response = await client.get(url, signed_stream_params(self.track.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.musician = make_musician()
+        self.track = make_track(self.musician)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.musician)}')
+
+    def count_queries(self, method, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 300, url)
+        return len(ctx.captured_queries)
+
+    def test_user_lookup_is_cached(self):
+        for method, url in [('post', f'/api/tracks/{self.track.pk}/play/'), ('get', '/api/playlists/')]:
+            with self.subTest(url=url):
+                cache.clear()
+                first = self.count_queries(method, url)
+                self.assertEqual(self.count_queries(method, url), first - 1)
+
+    def test_deactivation_and_role_changes_apply_at_once(self):
+        self.assertEqual(self.client.get('/api/playlists/').status_code, 200)
+        self.musician.is_musician = False
+        self.musician.save()
+        response = self.client.post('/api/uploads/', {'filename': 'a.wav', 'size': 1024}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.musician.is_active = False
+        self.musician.save()
+        self.assertEqual(self.client.get('/api/playlists/').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/tracks/').status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.musician)}')
+            self.assertEqual(self.client.get('/api/playlists/').status_code, 200)
+            self.assertEqual(self.client.get('/api/async/tracks/').status_code, 200)
+            self.musician.set_password('new password')
+            self.musician.save()
+            self.assertEqual(self.client.get('/api/playlists/').status_code, 401)
+            self.assertEqual(self.client.get('/api/async/tracks/').status_code, 401)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.musician = make_musician()
+        make_track(self.musician)
+        self.auth = f'Bearer {AccessToken.for_user(self.musician)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+
+    def series(self, name, endpoint, method='GET'):
+        bucket_counts = metrics.histograms[name].series[(endpoint, method)]
+        return bucket_counts[-2], bucket_counts[-1]  # sum, count
+
+    def test_requests_are_profiled(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/playlists/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertEqual(self.series('queries', 'playlist-list'), (len(ctx.captured_queries), 1))
+        self.assertGreater(self.series('auth', 'playlist-list')[0], 0)
+        self.assertEqual(self.series('size', 'playlist-list')[0], len(response.content))
+        self.client.get('/api/tracks/999/')
+        self.assertEqual(metrics.requests[('track-detail', 'GET', '404')], 1)
+
+    def test_serialization_is_measured_apart_from_view_code(self):
+        Playlist.objects.create(user=self.musician, name='Mine')
+
+        def slow(original):
+            def wrapper(*args, **kwargs):
+                time.sleep(0.05)
+                return original(*args, **kwargs)
+            return wrapper
+
+        with mock.patch.object(PlaylistSerializer, 'to_representation', slow(PlaylistSerializer.to_representation)):
+            response = self.client.get('/api/playlists/')
+        self.assertIn('serialization;dur=', response['Server-Timing'])
+        self.assertGreaterEqual(self.series('serialization', 'playlist-list')[0], 0.05)
+        self.assertLess(self.series('other', 'playlist-list')[0], 0.05)
+
+        metrics.reset()
+        with mock.patch.object(PlaylistViewSet, 'get_queryset', slow(PlaylistViewSet.get_queryset)):
+            self.client.get('/api/playlists/')
+        self.assertLess(self.series('serialization', 'playlist-list')[0], 0.05)
+        self.assertGreaterEqual(self.series('other', 'playlist-list')[0], 0.05)
+
+    async def test_async_views_are_profiled(self):
+        response = await AsyncClient().get('/api/async/tracks/', headers={'Authorization': self.auth})
+        self.assertEqual(response.status_code, 200)
+        queries, count = self.series('queries', 'async-track-list')
+        self.assertEqual(count, 1)
+        self.assertGreater(queries, 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/playlists/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.musician.is_staff = True
+        self.musician.save()
+        text = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('vibetunes_requests_total{endpoint="playlist-list",method="GET",status="200"} 1', text)
+        self.assertIn('vibetunes_request_queries_bucket{endpoint="playlist-list",method="GET",le="+Inf"} 1', text)
+
+        scraper = APIClient()
+        with override_settings(METRICS_TOKEN='secret'):
+            scraper.credentials(HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(scraper.get('/api/metrics/').status_code, 200)
+            scraper.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(scraper.get('/api/metrics/').status_code, 401)
+
+    @override_settings(PROFILING_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.assertLogs('core.profiling', 'WARNING') as logs:
+            self.client.get('/api/playlists/')
+        self.assertIn('GET /api/playlists/ (playlist-list) -> 200', logs.output[0])
+        self.assertIn('FROM "core_playlist"', logs.output[0])
+        with override_settings(PROFILING_SLOW_SAMPLE_RATE=0), self.assertNoLogs('core.profiling'):
+            self.client.get('/api/playlists/')
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs a second database (see vibetunes.test_settings)')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not TestCase: reads inside its per-test transaction stay on the primary.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        # Nothing replicates between the test databases, so each gets its own catalog.
+        make_track(make_musician('primary'), title='On primary')
+        replica_musician = CustomUser.objects.db_manager('replica').create_user(
+            email='r@example.com', username='replica', password='x', is_musician=True
+        )
+        Track.objects.using('replica').create(
+            musician=replica_musician, title='On replica', description='', genre='Pop', audio_file='tracks/r.mp3'
+        )
+        self.listener = CustomUser.objects.create_user(email='l@example.com', username='l', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.listener)
+
+    def titles(self, url='/api/tracks/'):
+        return [row['title'] for row in self.client.get(url).json()['results']]
+
+    def test_read_actions_use_replica(self):
+        self.assertEqual(self.titles(), ['On replica'])
+        track = Track.objects.get(title='On primary')
+        # Views and actions that did not opt in read from the primary.
+        self.assertEqual(
+            self.client.get(f'/api/musicians/{track.musician_id}/dashboard/').status_code, 403
+        )
+
+    def test_writes_pin_user_to_primary(self):
+        response = self.client.post('/api/playlists/', {'name': 'Mine'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Playlist.objects.using('replica').count(), 0)
+        self.assertEqual(self.titles(), ['On primary'])
+        playlists = self.client.get('/api/playlists/').json()['results']
+        self.assertEqual([row['name'] for row in playlists], ['Mine'])
+        # Other users still read from the replica.
+        other = APIClient()
+        other.force_authenticate(CustomUser.objects.create_user(email='o@example.com', username='o', password='x'))
+        self.assertEqual([row['title'] for row in other.get('/api/tracks/').json()['results']], ['On replica'])
+        # Once the pin expires the user is back on the replica.
+        cache.clear()
+        self.assertEqual(self.titles(), ['On replica'])
+
+    def test_transactions_and_background_work_use_primary(self):
+        router = ReplicaRouter()
+        token = replicas.begin(self.listener, read_only=True)
+        try:
+            self.assertEqual(router.db_for_read(Track), 'replica')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Track), 'default')
+        finally:
+            replicas.end(token)
+        self.assertEqual(router.db_for_read(Track), 'default')
+
+
+@override_settings(MEDIA_WORKERS=0, CATALOG_IMPORT_WORKERS=2, CATALOG_IMPORT_BATCH_SIZE=2)
+class CatalogImportTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = self.temp_dir()
+        self.override(CATALOG_IMPORT_ROOT=self.root)
+        self.musician = make_musician()
+        os.makedirs(os.path.join(self.root, 'label', 'audio'))
+        for n in range(4):
+            with open(os.path.join(self.root, 'label', 'audio', f'{n}.wav'), 'wb') as f:
+                f.write(wav_bytes(seconds=0.5))
+        with open(os.path.join(self.root, 'label', 'cover.png'), 'wb') as f:
+            f.write(png_bytes())
+        rows = [
+            {'title': 'Zero', 'description': 'd', 'genre': 'Pop', 'audio': 'audio/0.wav', 'cover': 'cover.png'},
+            {'title': 'One', 'description': 'd', 'genre': 'Polka', 'audio': 'audio/1.wav'},
+            {'title': 'Two', 'description': 'd', 'genre': 'Rock', 'audio': 'audio/missing.wav'},
+            {'title': 'Three', 'description': 'd', 'genre': 'Jazz', 'audio': '../../etc/passwd'},
+            {'title': 'Four', 'description': 'd', 'genre': 'Rock', 'audio': 'audio/3.wav'},
+        ]
+        self.manifest = os.path.join(self.root, 'label', 'catalog.jsonl')
+        with open(self.manifest, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+            f.write('not json\n')
+
+    def test_import_command(self):
+        out = io.StringIO()
+        call_command('import_catalog', self.manifest, user=self.musician.email, stdout=out)
+        catalog_import = CatalogImport.objects.get()
+        self.assertEqual(catalog_import.status, 'done')
+        self.assertEqual((catalog_import.next_row, catalog_import.imported, catalog_import.rejected), (6, 2, 4))
+        self.assertEqual([error['row'] for error in catalog_import.errors], [1, 2, 3, 5])
+        self.assertIn('outside of', catalog_import.errors[2]['error'])
+        self.assertIn('rows/s', out.getvalue())
+
+        zero, four = Track.objects.order_by('pk')
+        self.assertEqual((zero.musician, zero.title, four.title), (self.musician, 'Zero', 'Four'))
+        self.assertTrue(zero.audio_file.name.startswith(f'tracks/imports/{catalog_import.pk}/0-'))
+        self.assertTrue(os.path.exists(zero.cover_image.path))
+        self.assertEqual(zero.processing_status, 'ready')
+        self.assertEqual([track.title for track in search_tracks(Track.objects.all(), 'four')], ['Four'])
+
+    def test_failed_import_resumes_without_duplicates(self):
+        bulk_create = Track.objects.bulk_create
+        calls = []
+
+        def failing(tracks, *args, **kwargs):
+            calls.append(len(tracks))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return bulk_create(tracks, *args, **kwargs)
+
+        with mock.patch.object(Track.objects, 'bulk_create', failing), self.assertLogs('core.imports', 'ERROR'):
+            with self.assertRaisesMessage(CommandError, '--resume'):
+                call_command('import_catalog', self.manifest, user=self.musician.email,
+                             no_processing=True, stdout=io.StringIO())
+        catalog_import = CatalogImport.objects.get()
+        self.assertEqual((catalog_import.status, catalog_import.next_row), ('failed', 2))
+        self.assertEqual(Track.objects.count(), 1)
+
+        call_command('import_catalog', resume=catalog_import.pk, no_processing=True, stdout=io.StringIO())
+        catalog_import.refresh_from_db()
+        self.assertEqual((catalog_import.status, catalog_import.imported, catalog_import.rejected), ('done', 2, 4))
+        self.assertEqual(sorted(Track.objects.values_list('title', flat=True)), ['Four', 'Zero'])
+        with self.assertRaisesMessage(CommandError, 'The import is done'):
+            call_command('import_catalog', resume=catalog_import.pk, stdout=io.StringIO())
+
+    @override_settings(CATALOG_IMPORT_WORKERS=0)
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.musician)
+        response = client.post('/api/imports/', {'manifest': 'label/catalog.jsonl'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['status'], response.data['imported']), ('done', 2))
+        self.assertEqual(client.get(f'/api/imports/{response.data["id"]}/').data['rejected'], 4)
+        self.assertEqual(client.post(f'/api/imports/{response.data["id"]}/resume/').status_code, 409)
+
+        for manifest in ('../outside.jsonl', 'label/audio/0.wav', 'label/missing.csv'):
+            with self.subTest(manifest=manifest):
+                response = client.post('/api/imports/', {'manifest': manifest}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+        listener = CustomUser.objects.create_user(email='l@example.com', username='l', password='pass')
+        client.force_authenticate(listener)
+        self.assertEqual(client.post('/api/imports/', {'manifest': 'label/catalog.jsonl'}, format='json').status_code, 403)
+        self.assertEqual(client.get('/api/imports/').data['results'], [])
+
+
+@override_settings(TRENDING_HALF_LIFE=24 * 3600)
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.musician = make_musician()
+        self.old_hit = make_track(self.musician, title='Old hit')
+        self.new_hit = make_track(self.musician, title='New hit')
+        self.unplayed = make_track(self.musician, title='Unplayed')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.musician)}')
+        self.now = timezone.now()
+
+    def record(self, track, days_ago, plays=0, likes=0):
+        with mock.patch('core.trending.timezone.now', return_value=self.now - timedelta(days=days_ago)):
+            trending.record({track.pk: {'plays': plays, 'likes': likes}})
+        track.refresh_from_db()
+        return track.trending
+
+    def test_scores_decay(self):
+        self.record(self.old_hit, days_ago=3, plays=10)
+        score = self.record(self.new_hit, days_ago=0, plays=3)
+        self.assertGreater(score, self.old_hit.trending)
+        # Ten plays three half-lives ago weigh 10 / 8 of a play now.
+        self.assertAlmostEqual(
+            self.record(self.old_hit, days_ago=0, plays=2),
+            trending.score(10 / 8 + 2, self.now),
+        )
+        self.assertAlmostEqual(self.record(self.old_hit, days_ago=0, likes=1), trending.score(10 / 8 + 5, self.now))
+        # Unlikes and events far older than the score leave it as it is.
+        self.assertAlmostEqual(self.record(self.old_hit, days_ago=0, likes=-1), trending.score(10 / 8 + 5, self.now))
+        self.assertAlmostEqual(self.record(self.old_hit, days_ago=1000, plays=1), trending.score(10 / 8 + 5, self.now))
+
+    def test_sort_by_trending(self):
+        Track.objects.filter(pk=self.old_hit.pk).update(plays=100)
+        self.record(self.old_hit, days_ago=7, plays=100)
+        for _ in range(2):
+            self.client.post(f'/api/tracks/{self.new_hit.pk}/play/')
+
+        titles = lambda data: [track['title'] for track in data['results']]
+        self.assertEqual(titles(self.client.get('/api/tracks/').data), ['Old hit', 'New hit', 'Unplayed'])
+        self.assertEqual(
+            titles(self.client.get('/api/tracks/', {'sort': 'trending'}).data), ['New hit', 'Old hit', 'Unplayed']
+        )
+        self.assertEqual(titles(self.client.get('/api/async/tracks/', {'sort': 'trending'}).json()),
+                         ['New hit', 'Old hit', 'Unplayed'])
+        page = self.client.get('/api/tracks/', {'sort': 'trending', 'page_size': 1}).data
+        self.assertEqual(titles(self.client.get(page['next']).data), ['Old hit'])
+
+        self.assertEqual(self.client.get('/api/tracks/', {'sort': 'random'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/async/tracks/', {'sort': 'random'}).status_code, 400)
+
+
+class BloomFilterTests(TestCase):
+    def test_membership_and_error_rate(self):
+        bloom = dedup.BloomFilter(10000, 0.01)
+        false_positives = sum(bloom.add(f'key {n}') for n in range(10000))
+        self.assertLess(false_positives, 100)
+        self.assertEqual(bloom.count, 10000 - false_positives)
+        self.assertTrue(all(bloom.add(f'key {n}') for n in range(10000)))
+        false_positives = sum(f'other {n}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_recent_events_rotate(self):
+        events = dedup.RecentEvents(window=10, capacity=100, error_rate=0.01)
+        with mock.patch('core.dedup.time.monotonic') as monotonic:
+            for now, seen in [(0, False), (5, True), (15, True), (25, False), (26, True), (100, False)]:
+                monotonic.return_value = now
+                self.assertEqual(events.seen('user:track'), seen, now)
+            # A full window rotates early instead of losing accuracy.
+            for n in range(100):
+                events.seen(f'filler {n}')
+            self.assertTrue(events.seen('user:track'))
+            self.assertLess(events._current.count, 100)
+            self.assertIsNotNone(events._previous)
+
+    def test_recent_states_rotate(self):
+        with mock.patch('core.dedup.time.monotonic') as monotonic:
+            monotonic.return_value = 0
+            states = dedup.RecentStates(window=10, capacity=100)
+            states.set('user:track', True)
+            for now, state in [(5, True), (15, True), (25, None)]:
+                monotonic.return_value = now
+                self.assertEqual(states.get('user:track'), state, now)
+            states.set('user:track', True)
+            states.set('user:track', False)
+            self.assertIs(states.get('user:track'), False)
+
+
+@override_settings(PLAY_DEDUP_WINDOW=300, LIKE_DEDUP_WINDOW=300)
+class DedupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        dedup.recent_plays.clear()
+        dedup.recent_likes.clear()
+        self.musician = make_musician()
+        self.track = make_track(self.musician)
+        self.client = APIClient()
+        self.client.force_authenticate(self.musician)
+
+    def like(self, method='post'):
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(f'/api/tracks/{self.track.pk}/like/')
+        self.assertEqual(response.status_code, 200)
+        self.track.refresh_from_db()
+        touched = any('core_tracklike' in query['sql'] for query in ctx.captured_queries)
+        return response.data['status'], self.track.likes, touched
+
+    def test_repeated_plays_count_once(self):
+        url = f'/api/tracks/{self.track.pk}/play/'
+        self.assertTrue(self.client.post(url).data['counted'])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['counted'])
+        self.assertIn('stream_url', response.data)
+        self.assertFalse([query for query in ctx.captured_queries if not query['sql'].startswith('SELECT')])
+
+        listener = CustomUser.objects.create_user(email='l@example.com', username='l', password='pass')
+        self.client.force_authenticate(listener)
+        self.assertTrue(self.client.post(url).data['counted'])
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.plays, 2)
+        self.assertEqual(PlayEvent.objects.count(), 2)
+
+    def test_repeated_likes_skip_the_database(self):
+        self.assertEqual(self.like(), ('track liked', 1, True))
+        self.assertEqual(self.like(), ('track already liked', 1, False))
+        self.assertEqual(self.like('delete'), ('track unliked', 0, True))
+        self.assertEqual(self.like('delete'), ('track not liked', 0, False))
+        # A like after an unlike is not a repeat.
+        self.assertEqual(self.like(), ('track liked', 1, True))
+        self.assertEqual(TrackLike.objects.filter(user=self.musician, track=self.track).count(), 1)
+
+        # Each change is one statement, with no SELECT first.
+        statements = []
+        for method in ('delete', 'post'):
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                getattr(self.client, method)(f'/api/tracks/{self.track.pk}/like/')
+            statements += [query['sql'].split()[0] for query in ctx.captured_queries if 'core_tracklike' in query['sql']]
+        self.assertEqual(statements, ['DELETE', 'INSERT'])
+
+    def test_database_decides_once_the_window_ends(self):
+        self.like()
+        TrackLike.objects.filter(user=self.musician, track=self.track).delete()
+        # Within the window the remembered state answers.
+        self.assertEqual(self.like(), ('track already liked', 1, False))
+        dedup.recent_likes.clear()
+        self.assertEqual(self.like()[0], 'track liked')
+        TrackLike.objects.filter(user=self.musician, track=self.track).delete()
+        dedup.recent_likes.clear()
+        self.assertEqual(self.like('delete')[0], 'track not liked')
+        self.assertFalse(TrackLike.objects.exists())
+
+    @override_settings(LIKE_DEDUP_WINDOW=0)
+    def test_zero_window_sends_every_like_to_the_database(self):
+        self.assertEqual(self.like(), ('track liked', 1, True))
+        self.assertEqual(self.like(), ('track already liked', 1, True))
+        self.assertEqual(self.like('delete'), ('track unliked', 0, True))
@@ -0,0 +1,81 @@
+"""
+Trending scores.
+
+``Track.trending`` ranks tracks by recent activity: every play and like
+counts with a weight that halves every ``TRENDING_HALF_LIFE`` seconds.
+Decaying the scores as time passes would rewrite the whole catalog, so
+instead the weights grow with the event time, relative to a fixed epoch:
+
+    trending = log(sum(weight * 2 ** ((time - EPOCH) / half_life)))
+
+At any moment every score would be decayed by the same factor, so ordering
+by the stored column is ordering by the decayed score, and idle tracks are
+never written. Adding an event is ``logaddexp(trending, log(weight) +
+(time - EPOCH) * ln 2 / half_life)``; the logarithm keeps the growing
+exponent well inside the float range.
+
+Scores are updated from the deltas of each counter flush (see
+``core.counters``) in the flush thread, with the same ``F()`` arithmetic
+that lets workers interleave their flushes. Tracks without events score 0,
+below every track played since the epoch, and rank newest first among
+themselves. A new half-life applies to new events only.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Abs, Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from .counters import FLUSH_BATCH_SIZE
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+# exp(-x) below this is lost next to 1 in a double; PostgreSQL also raises
+# on the underflow of exp() of large negative numbers.
+MAX_GAP = 40.0
+
+
+def half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 24 * 3600)
+
+
+def weights():
+    return {
+        'plays': getattr(settings, 'TRENDING_PLAY_WEIGHT', 1.0),
+        'likes': getattr(settings, 'TRENDING_LIKE_WEIGHT', 3.0),
+    }
+
+
+def score(weight, at):
+    """The log-space contribution of ``weight`` at the time ``at``."""
+    return math.log(weight) + (at - EPOCH).total_seconds() * math.log(2) / half_life()
+
+
+def logaddexp(field, added):
+    """SQL for ``log(exp(field) + exp(added))``, computed without overflow."""
+    return Greatest(F(field), added) + Ln(Value(1.0) + Exp(-Least(Abs(F(field) - added), Value(MAX_GAP))))
+
+
+def record(deltas):
+    """Add counter deltas (``{track_id: {'plays': n, 'likes': m}}``) to the scores."""
+    Track = apps.get_model('core', 'Track')
+    now = timezone.now()
+    factors = weights()
+    # A flush has one timestamp, so tracks with the same counts get the same
+    # increment: one UPDATE per distinct increment instead of a CASE per track.
+    groups = {}
+    for track_id, counts in deltas.items():
+        # Unlikes lower the like count but take nothing back from the score.
+        weight = sum(max(counts.get(name, 0), 0) * factor for name, factor in factors.items())
+        if weight > 0:
+            groups.setdefault(score(weight, now), []).append(track_id)
+    with transaction.atomic():
+        for added, track_ids in groups.items():
+            track_ids.sort()
+            for start in range(0, len(track_ids), FLUSH_BATCH_SIZE):
+                Track.objects.filter(pk__in=track_ids[start:start + FLUSH_BATCH_SIZE]).update(
+                    trending=logaddexp('trending', Value(added))
+                )
@@ -0,0 +1,139 @@
+"""
+Resumable chunked uploads of track audio.
+
+A musician opens an ``UploadSession`` with the final size (and optionally
+the SHA-256) of the file, then sends the bytes in order as raw ``PATCH``
+bodies carrying ``Upload-Offset`` (and optionally ``Upload-Checksum:
+sha256 <hex>`` for the chunk). Chunks are copied from the request stream
+to a staging file in ``CHUNKED_UPLOAD_DIR`` in small pieces, so a worker
+never holds more than ``READ_SIZE`` bytes of a chunk in memory. The staged
+file itself is the source of truth for the offset: after a dropped
+connection the client asks for the session and resumes from ``offset``.
+
+Completing the session checks the size and whole-file checksum and creates
+the ``Track`` through ``TrackCreateSerializer``; on local storage the
+staged file is moved into place rather than copied.
+"""
+import errno
+import fcntl
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or completion request that cannot be applied to the session."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class StagedFile(File):
+    """A staged upload that local storages can move into place (like TemporaryUploadedFile)."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def staging_dir():
+    return str(getattr(settings, 'CHUNKED_UPLOAD_DIR', None)
+               or os.path.join(tempfile.gettempdir(), 'vibetunes-uploads'))
+
+
+def staging_path(session):
+    return os.path.join(staging_dir(), f'{session.pk}.part')
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK', 8 * 1024 * 1024)
+
+
+def current_offset(session):
+    try:
+        return os.path.getsize(staging_path(session))
+    except FileNotFoundError:
+        return 0
+
+
+def parse_checksum(header):
+    """``Upload-Checksum: sha256 <hex>`` -> hex digest (or None without a header)."""
+    if not header:
+        return None
+    algorithm, _, digest = header.strip().partition(' ')
+    if algorithm.lower() != 'sha256' or not digest:
+        raise UploadError('Only "sha256 <hex digest>" checksums are supported')
+    return digest.strip().lower()
+
+
+def append(session, stream, offset, length, checksum=None):
+    """Append ``length`` bytes from ``stream`` at ``offset``; returns the new offset."""
+    if length > max_chunk_size():
+        raise UploadError(f'Chunks must not exceed {max_chunk_size()} bytes', status=413)
+    os.makedirs(staging_dir(), exist_ok=True)
+    with open(staging_path(session), 'ab') as staged:
+        try:
+            fcntl.flock(staged, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            raise UploadError('Another chunk is being written to this upload', status=409)
+        size = staged.seek(0, os.SEEK_END)
+        if offset != size:
+            raise UploadError('Upload-Offset does not match the uploaded size', status=409, offset=size)
+        if size + length > session.size:
+            raise UploadError('Chunk extends past the declared upload size', status=413, offset=size)
+
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                staged.write(data)
+                digest.update(data)
+                written += len(data)
+            if written != length:
+                raise UploadError('Chunk ended before Content-Length bytes were received', offset=size)
+            if checksum and digest.hexdigest() != checksum:
+                raise UploadError('Chunk checksum mismatch', offset=size)
+        except BaseException:
+            # Drop the partial chunk so the client can resend it from ``size``.
+            staged.flush()
+            staged.truncate(size)
+            raise
+        staged.flush()
+        os.fsync(staged.fileno())
+        return size + written
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as staged:
+        for block in iter(lambda: staged.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify(session):
+    """Check that the staged file is complete and matches the declared checksum."""
+    offset = current_offset(session)
+    if offset != session.size:
+        raise UploadError('Upload is incomplete', status=409, offset=offset)
+    if session.checksum and file_checksum(staging_path(session)) != session.checksum:
+        discard(session)
+        raise UploadError('File checksum mismatch, the upload must be restarted', offset=0)
+
+
+def discard(session):
+    try:
+        os.remove(staging_path(session))
+    except FileNotFoundError:
+        pass
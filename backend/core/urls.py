@@ -4,14 +4,17 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from . import async_views
 from .views import (
-    TrackViewSet, PlaylistViewSet,
-    UserRegistrationView, UserProfileView
+    TrackViewSet, PlaylistViewSet, UploadViewSet, CatalogImportViewSet,
+    UserRegistrationView, UserProfileView, ResponseCacheStatsView, MusicianDashboardView, MetricsView
 )
 
 router = DefaultRouter()
 router.register(r'tracks', TrackViewSet, basename='track')
 router.register(r'playlists', PlaylistViewSet, basename='playlist')
+router.register(r'uploads', UploadViewSet, basename='upload')
+router.register(r'imports', CatalogImportViewSet, basename='import')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -19,4 +22,13 @@ urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('users/me/', UserProfileView.as_view(), name='user-profile'),
+    path('musicians/<int:pk>/dashboard/', MusicianDashboardView.as_view(), name='musician-dashboard'),
+    # Async variants of the hot read paths, for ASGI deployments
+    path('async/tracks/', async_views.track_list, name='async-track-list'),
+    path('async/tracks/charts/', async_views.track_charts, name='async-track-charts'),
+    path('async/tracks/recommendations/', async_views.track_recommendations, name='async-track-recommendations'),
+    path('async/tracks/<int:pk>/stream/', async_views.track_stream, name='async-track-stream'),
+    path('async/playlists/<int:pk>/', async_views.playlist_detail, name='async-playlist-detail'),
+    path('cache/stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ] 
\ No newline at end of file
@@ -1,19 +1,37 @@
+from django.http import HttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q
+from django.db import transaction
+from django.db.models import Count, Prefetch
 from django.contrib.auth import get_user_model
-from .models import Track, Playlist, PlaylistTrack
+from .analytics import musician_dashboard
+from .authentication import CachedJWTAuthentication, MetricsTokenAuthentication
+from .charts import chart_engine
+from .models import Track, Playlist, PlaylistTrack, UploadSession, CatalogImport
+from . import imports
+from .processing import media_pipeline, waveform_version
+from .profiling import metrics
+from .response_cache import PLAYLISTS, TRACKS, CachedResponseMixin, response_cache, user_namespace
+from .recommendations import recommendation_size, recommended_ids
+from .replicas import ReplicaReadMixin
+from .search import search_tracks
+from .streaming import StreamNegotiation, signed_stream_params, stream_file, valid_stream_signature
 from .serializers import (
-    TrackSerializer, TrackCreateSerializer,
-    PlaylistSerializer, CustomUserSerializer
+    TrackSerializer, TrackCreateSerializer, FastTrackSerializer,
+    PlaylistSerializer, PlaylistBatchSerializer, CustomUserSerializer, UploadSessionSerializer,
+    DashboardQuerySerializer, CatalogImportSerializer
 )
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .uploads import StagedFile, UploadError, append, discard, parse_checksum, staging_path, verify
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.permissions import BasePermission, IsAuthenticated, IsAdminUser
 from django.utils import timezone
+from django.utils.http import parse_etags, urlencode
 
 CustomUser = get_user_model()
 
@@ -39,11 +57,61 @@ class UserProfileView(APIView):
         serializer = CustomUserSerializer(request.user)
         return Response(serializer.data)
 
-class TrackViewSet(viewsets.ModelViewSet):
+class ResponseCacheStatsView(APIView):
+    """Hit/miss counts of the response cache in this process"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache.stats())
+
+class HasMetricsToken(BasePermission):
+    def has_permission(self, request, view):
+        return request.auth == 'metrics'
+
+class HasStreamSignature(BasePermission):
+    """A signed stream URL from ``play``, for players that cannot send the JWT"""
+    def has_permission(self, request, view):
+        return valid_stream_signature(view.kwargs.get('pk'), request.query_params)
+
+class MetricsView(APIView):
+    """Request metrics of this process in the Prometheus text format"""
+    authentication_classes = [MetricsTokenAuthentication, CachedJWTAuthentication]
+    permission_classes = [HasMetricsToken | IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class MusicianDashboardView(APIView):
+    """Catalog totals, play series and top tracks of a musician, from the play rollups"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        if request.user.pk != pk and not request.user.is_staff:
+            raise PermissionDenied('You can only view your own dashboard')
+        musician = request.user if request.user.pk == pk else get_object_or_404(CustomUser, pk=pk)
+        if not musician.is_musician:
+            return Response(
+                {'error': 'Dashboards are only available for musicians'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        query = DashboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(musician_dashboard(pk, **query.validated_data))
+
+# ?sort= orderings of the catalog, each served by a partial index on Track
+TRACK_SORTS = {
+    'plays': ('-plays', '-created_at', '-id'),
+    'trending': ('-trending', '-created_at', '-id'),
+}
+
+class TrackViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = TRACKS
+    replica_actions = ('list', 'retrieve', 'charts', 'recommendations')
     queryset = Track.objects.filter(is_active=True)
     serializer_class = TrackSerializer
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [IsAuthenticated]
+    keyset_ordering = TRACK_SORTS['plays']
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -51,7 +119,7 @@ class TrackViewSet(viewsets.ModelViewSet):
         return TrackSerializer
 
     def get_queryset(self):
-        queryset = Track.objects.filter(is_active=True)
+        queryset = Track.objects.filter(is_active=True).select_related('musician')
         
         # Filter by genre
         genre = self.request.query_params.get('genre', None)
@@ -63,15 +131,36 @@ class TrackViewSet(viewsets.ModelViewSet):
         if musician_id:
             queryset = queryset.filter(musician_id=musician_id)
         
-        # Search by title or description
+        # All-time plays, or recent activity (see core.trending)
+        self.keyset_ordering = TRACK_SORTS.get(self.request.query_params.get('sort'), TRACK_SORTS['plays'])
+        
+        # Ranked search over title, description, musician and genre
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search)
-            )
+            self.keyset_ordering = ('-search_rank', '-id')
+            queryset = search_tracks(queryset, search)
         
-        return queryset.order_by('-plays', '-created_at')
+        return queryset.order_by(*self.keyset_ordering)
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('sort', 'plays') not in TRACK_SORTS:
+            return Response(
+                {'error': f'Unknown sort, choose from: {", ".join(TRACK_SORTS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.cached(self.list_rows, request, *args, **kwargs)
+
+    def list_rows(self, request, *args, **kwargs):
+        """Page over values() rows and render them with the fast serializer"""
+        serializer = FastTrackSerializer(request)
+        queryset = serializer.rows(
+            self.filter_queryset(self.get_queryset()),
+            *(field.lstrip('-') for field in self.keyset_ordering)
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(queryset))
 
     def perform_create(self, serializer):
         if not self.request.user.is_musician:
@@ -79,68 +168,216 @@ class TrackViewSet(viewsets.ModelViewSet):
                 {'error': 'Only musicians can upload tracks'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        serializer.save(musician=self.request.user)
+        track = serializer.save(musician=self.request.user)
+        # Transcoding and thumbnails run in the media worker pool
+        transaction.on_commit(lambda: media_pipeline.submit(track.pk))
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post', 'delete'])
     def like(self, request, pk=None):
+        """POST likes the track (once per user), DELETE takes the like back"""
         track = self.get_object()
-        track.increment_likes()
-        return Response({'status': 'track liked'})
+        if request.method == 'DELETE':
+            changed = track.unlike(request.user)
+            return Response({'status': 'track unliked' if changed else 'track not liked', 'liked': False})
+        changed = track.like(request.user)
+        return Response({'status': 'track liked' if changed else 'track already liked', 'liked': True})
 
     @action(detail=True, methods=['post'])
     def play(self, request, pk=None):
+        """Count a play (repeats within PLAY_DEDUP_WINDOW are not) and return the audio URLs"""
         track = self.get_object()
-        track.increment_plays()
+        counted = track.increment_plays(request.user)
         return Response({
-            'status': 'play count updated',
-            'audio_url': request.build_absolute_uri(track.audio_file.url)
+            'status': 'play count updated' if counted else 'play already counted',
+            'counted': counted,
+            'audio_url': request.build_absolute_uri(track.audio_file.url),
+            'stream_url': (
+                reverse('track-stream', args=[track.pk], request=request)
+                + '?' + urlencode(signed_stream_params(track.pk))
+            ),
         })
 
+    @action(detail=True, methods=['get'], content_negotiation_class=StreamNegotiation,
+            permission_classes=[IsAuthenticated | HasStreamSignature])
+    def stream(self, request, pk=None):
+        """Serve the audio file (or a ?bitrate= rendition) with byte-range support; JWT or signed URL"""
+        track = self.get_object()
+        bitrate = request.query_params.get('bitrate')
+        if bitrate:
+            name = track.renditions.get(bitrate)
+            if name is None:
+                return Response(
+                    {'error': f'Rendition not available, choose from: {", ".join(sorted(track.renditions, key=int)) or "none"}'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return stream_file(request, name, track.audio_file.storage)
+        return stream_file(request, track.audio_file.name, track.audio_file.storage)
+
+    @action(detail=True, methods=['get'], content_negotiation_class=StreamNegotiation)
+    def waveform(self, request, pk=None):
+        """Precomputed int8 (min, max) peak pairs for the player's waveform"""
+        track = self.get_object()
+        if not track.waveform:
+            return Response(
+                {'error': 'Waveform not available yet', 'processing_status': track.processing_status},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        # Versioned URLs (see TrackSerializer.waveform_url) never change content.
+        versioned = request.query_params.get('v') == waveform_version(track.waveform.name)
+        return stream_file(
+            request, track.waveform.name, track.waveform.storage,
+            content_type='application/octet-stream',
+            cache_control='private, max-age=31536000, immutable' if versioned else 'private, no-cache',
+        )
+
     @action(detail=False, methods=['get'])
     def recommendations(self, request):
-        user = request.user
-        
-        # Get user's preferred genres from playlists
-        user_genres = user.get_listened_genres()
-        
-        # Get top tracks by plays
-        top_tracks = Track.objects.filter(
-            is_active=True
-        ).order_by('-plays')[:10]
-        
-        # If user has genres, get recommendations based on them
-        if user_genres:
-            genre_recommendations = Track.objects.filter(
-                is_active=True,
-                genre__in=user_genres
-            ).order_by('-plays')[:5]
-            top_tracks = list(top_tracks) + list(genre_recommendations)
-        
-        serializer = self.get_serializer(top_tracks, many=True)
-        return Response(serializer.data)
+        """Precomputed co-occurrence recommendations, padded from the charts"""
+        track_ids = recommended_ids(request.user)
+        serializer = FastTrackSerializer(request)
+        rows = {
+            row['id']: row
+            for row in serializer.rows(Track.objects.filter(pk__in=track_ids, is_active=True))
+        }
+        top_tracks = [rows[pk] for pk in track_ids if pk in rows][:recommendation_size()]
+        return Response(serializer.serialize(top_tracks))
 
     @action(detail=False, methods=['get'])
     def charts(self, request):
-        """Get top tracks by plays and likes"""
-        top_by_plays = Track.objects.filter(
-            is_active=True
-        ).order_by('-plays')[:10]
-        
-        top_by_likes = Track.objects.filter(
-            is_active=True
-        ).order_by('-likes')[:10]
-        
-        return Response({
-            'by_plays': self.get_serializer(top_by_plays, many=True).data,
-            'by_likes': self.get_serializer(top_by_likes, many=True).data
-        })
+        """Get top tracks by plays, likes, today and this week (optionally per ?genre=)"""
+        genre = request.query_params.get('genre', None)
+        if genre and genre not in dict(Track.GENRE_CHOICES):
+            return Response(
+                {'error': 'Unknown genre'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        scope = genre or 'all'
+
+        etag = chart_engine.etag(scope)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        etag, data = chart_engine.payload(
+            scope,
+            lambda tracks: self.get_serializer(tracks, many=True).data,
+            variant=request.build_absolute_uri('/'),
+        )
+        return Response(data, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+class UploadViewSet(ReplicaReadMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """Resumable chunked audio uploads: create, PATCH chunks, then complete"""
+    serializer_class = UploadSessionSerializer
+    # Offsets must be read from the primary; the mixin only makes uploads sticky.
+    replica_actions = ()
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        if not self.request.user.is_musician:
+            raise PermissionDenied('Only musicians can upload tracks')
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard(instance)
+        instance.delete()
+
+    def upload_error(self, exc):
+        headers = {'Upload-Offset': str(exc.offset)} if exc.offset is not None else None
+        return Response({'error': str(exc), 'offset': exc.offset}, status=exc.status, headers=headers)
+
+    def partial_update(self, request, pk=None):
+        """Append the raw request body at the Upload-Offset header"""
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset and Content-Length headers are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            checksum = parse_checksum(request.headers.get('Upload-Checksum'))
+            offset = append(session, request.stream, offset, length, checksum) if length else offset
+        except UploadError as exc:
+            return self.upload_error(exc)
+        session.save(update_fields=['updated_at'])
+        return Response({'offset': offset}, headers={'Upload-Offset': str(offset)})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Verify the uploaded file and create the track from it"""
+        session = self.get_object()
+        try:
+            verify(session)
+        except UploadError as exc:
+            return self.upload_error(exc)
+
+        data = {
+            field: request.data[field]
+            for field in ('title', 'description', 'genre', 'cover_image') if field in request.data
+        }
+        with open(staging_path(session), 'rb') as staged:
+            data['audio_file'] = StagedFile(staged, name=session.filename)
+            serializer = TrackCreateSerializer(data=data, context=self.get_serializer_context())
+            serializer.is_valid(raise_exception=True)
+            with transaction.atomic():
+                track = serializer.save(musician=request.user)
+                session.delete()
+                transaction.on_commit(lambda: media_pipeline.submit(track.pk))
+        discard(session)
+        return Response(
+            TrackSerializer(track, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
+
+class CatalogImportViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                           viewsets.GenericViewSet):
+    """Bulk track imports from a manifest on the server (see core.imports): create, poll, resume"""
+    serializer_class = CatalogImportSerializer
+    permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        return CatalogImport.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        if not (user.is_musician or user.is_staff):
+            raise PermissionDenied('Only musicians can import tracks')
+        imports.start(serializer.save(user=user))
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """Continue a failed or interrupted import from its first uncommitted row"""
+        catalog_import = self.get_object()
+        try:
+            imports.start(catalog_import)
+        except imports.CatalogImportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(catalog_import).data, status=status.HTTP_202_ACCEPTED)
 
-class PlaylistViewSet(viewsets.ModelViewSet):
+class PlaylistViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = PLAYLISTS
+    cache_per_user = True
     serializer_class = PlaylistSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-updated_at', '-id')
+
+    def get_cache_namespaces(self):
+        # Playlists embed their tracks, so track changes invalidate them too.
+        return [user_namespace(PLAYLISTS, self.request.user.pk), TRACKS]
 
     def get_queryset(self):
-        return Playlist.objects.filter(user=self.request.user)
+        return Playlist.objects.filter(user=self.request.user).select_related(
+            'user'
+        ).prefetch_related(
+            Prefetch('tracks', queryset=Track.objects.select_related('musician').order_by('playlisttrack__order'))
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -175,21 +412,94 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=True, methods=['post'])
+    def add_tracks(self, request, pk=None):
+        """Append several tracks at once (already present ones are skipped)"""
+        playlist = self.get_object()
+        track_ids = self.track_ids(request.data.get('track_ids'))
+        if track_ids is None:
+            return self.track_ids_error()
+        active = set(Track.objects.filter(pk__in=track_ids, is_active=True).values_list('pk', flat=True))
+        missing = [track_id for track_id in track_ids if track_id not in active]
+        if missing:
+            return Response(
+                {'error': 'Unknown tracks', 'track_ids': missing},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        added = playlist.add_tracks(track_ids)
+        return Response({'status': 'tracks added to playlist', 'added': added})
+
+    @action(detail=True, methods=['post'])
+    def remove_tracks(self, request, pk=None):
+        """Remove several tracks at once"""
+        playlist = self.get_object()
+        track_ids = self.track_ids(request.data.get('track_ids'))
+        if track_ids is None:
+            return self.track_ids_error()
+        removed = playlist.remove_tracks(track_ids)
+        return Response({'status': 'tracks removed from playlist', 'removed': removed})
+
+    @action(detail=True, methods=['post'])
+    def batch(self, request, pk=None):
+        """Apply a list of add/remove/move operations atomically, reporting a result per operation"""
+        playlist = self.get_object()
+        serializer = PlaylistBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = playlist.apply_operations(serializer.validated_data['operations'])
+        return Response({
+            'applied': sum(result['status'] != 'error' for result in results),
+            'results': results,
+        })
+
     @action(detail=True, methods=['post'])
     def reorder_tracks(self, request, pk=None):
+        """
+        Move one track with track_id and position (0-based), reorder with
+        track_ids (new order) or legacy track_orders ([{track_id, order}])
+        """
         playlist = self.get_object()
+        if 'track_id' in request.data:
+            try:
+                track_id, position = int(request.data['track_id']), int(request.data['position'])
+            except (KeyError, TypeError, ValueError):
+                return Response(
+                    {'error': 'track_id needs an integer position'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                playlist.move_track(track_id, position)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'status': 'track moved'})
+        if 'track_ids' in request.data:
+            track_ids = self.track_ids(request.data.get('track_ids'))
+            if track_ids is None:
+                return self.track_ids_error()
+            playlist.reorder_tracks(track_ids)
+            return Response({'status': 'tracks reordered'})
         track_orders = request.data.get('track_orders', [])
-        
         try:
-            for order_data in track_orders:
-                PlaylistTrack.objects.filter(
-                    playlist=playlist,
-                    track_id=order_data['track_id']
-                ).update(order=order_data['order'])
-            
-            return Response({'status': 'tracks reordered'})
-        except Exception as e:
+            orders = {int(item['track_id']): int(item['order']) for item in track_orders}
+        except (KeyError, TypeError, ValueError):
             return Response(
-                {'error': str(e)},
+                {'error': 'track_orders must be a list of {track_id, order}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        playlist.set_track_orders(orders)
+        return Response({'status': 'tracks reordered'})
+
+    @staticmethod
+    def track_ids(value):
+        if not isinstance(value, list):
+            return None
+        try:
+            return [int(track_id) for track_id in value]
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def track_ids_error():
+        return Response(
+            {'error': 'track_ids must be a list of track ids'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
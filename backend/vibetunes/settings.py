@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -85,6 +87,10 @@ DATABASES = {
         'PASSWORD': 'admin',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Keep connections open across requests instead of reconnecting
+        # each time; every worker thread holds at most one.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -139,7 +145,7 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -149,6 +155,12 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ProfiledJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 # JWT settings
@@ -161,4 +173,119 @@ SIMPLE_JWT = {
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+
+# Play/like counters are buffered in memory and flushed to Track in bulk
+# (see core/counters.py). Counts in the API lag by at most this many seconds;
+# 0 writes every increment through immediately.
+COUNTER_FLUSH_INTERVAL = 2.0
+# Flush early once this many distinct tracks have pending increments
+COUNTER_MAX_PENDING = 10000
+
+# Charts are materialized in the cache (see core/charts.py)
+CHARTS_SIZE = 10
+# Full rebuild from the database at most this often, in seconds
+CHARTS_REBUILD_INTERVAL = 300
+# Seconds an update waits for another worker's; past it the state is dropped
+# and rebuilt on the next read
+CHARTS_LOCK_WAIT = 2.0
+
+# Tracks returned by /api/tracks/recommendations/ (see core/recommendations.py)
+RECOMMENDATIONS_SIZE = 15
+
+# Audio streaming offload (see core/streaming.py): None serves files from
+# Django, 'x-accel-redirect' hands them to nginx (internal location at
+# MEDIA_SENDFILE_ROOT aliased to MEDIA_ROOT), 'x-sendfile' to Apache/lighttpd.
+MEDIA_SENDFILE = None
+MEDIA_SENDFILE_ROOT = '/protected-media/'
+
+# Upload processing (see core/processing.py): worker processes for
+# transcoding/thumbnails, 0 processes inline in the request.
+MEDIA_WORKERS = 2
+# MP3 renditions produced when ffmpeg is installed (kbit/s)
+MEDIA_BITRATES = (64, 128, 256)
+# Waveform resolution: (min, max) pairs per track, 2 bytes each
+WAVEFORM_POINTS = 1000
+
+# Resumable chunked uploads (see core/uploads.py). Staged files are moved
+# into MEDIA_ROOT on completion, so keep them on the same filesystem.
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'upload_staging'
+CHUNKED_UPLOAD_MAX_CHUNK = 8 * 1024 * 1024
+# Unfinished uploads are removed by `manage.py purge_uploads` after this many seconds
+CHUNKED_UPLOAD_EXPIRY = 24 * 3600
+
+# Cached API reads (see core/response_cache.py). With the local-memory
+# backend, CULL_FREQUENCY == MAX_ENTRIES evicts exactly the least recently
+# used entry when the cache is full.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 5000},
+    },
+}
+RESPONSE_CACHE_ENABLED = True
+# Upper bound on how stale play/like counts in cached responses can be
+RESPONSE_CACHE_TIMEOUT = 60
+
+# Listening history (see core/events.py): plays are buffered like the
+# counters and inserted in batches; 0 writes every play through.
+PLAY_EVENT_FLUSH_INTERVAL = 2.0
+PLAY_EVENT_MAX_PENDING = 10000
+# Raw events older than this are dropped by `manage.py rollup_plays`;
+# hourly/daily rollups are kept.
+PLAY_EVENTS_RETENTION_DAYS = 90
+
+# Read replicas (see core/replicas.py): add them to DATABASES and list the
+# aliases here. Read-only API actions are spread over them; users who just
+# wrote something read from the primary for REPLICA_STICKY_SECONDS, which
+# should exceed the replication lag.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+
+# Authenticated users are cached (see core/authentication.py) and dropped
+# when saved; this bounds how long changes made without save() go unseen.
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Request profiling (see core/profiling.py): per-endpoint latency, SQL,
+# authentication and serialization histograms at /api/metrics/, and a log
+# of requests slower than PROFILING_SLOW_REQUEST_MS with their slowest
+# queries, for a PROFILING_SLOW_SAMPLE_RATE fraction of them. Staff users
+# can read the metrics; scrapers send "Authorization: Bearer <METRICS_TOKEN>".
+PROFILING_ENABLED = True
+PROFILING_SLOW_REQUEST_MS = 500
+PROFILING_SLOW_SAMPLE_RATE = 1.0
+PROFILING_SLOW_QUERIES = 5
+METRICS_TOKEN = None
+
+# Bulk catalog imports (see core/imports.py). The API only reads manifests
+# below CATALOG_IMPORT_ROOT (None disables it); `manage.py import_catalog`
+# takes any path.
+CATALOG_IMPORT_ROOT = None
+CATALOG_IMPORT_WORKERS = 8
+CATALOG_IMPORT_BATCH_SIZE = 500
+
+# Trending scores behind /api/tracks/?sort=trending (see core/trending.py):
+# a play or like loses half its weight every TRENDING_HALF_LIFE seconds.
+TRENDING_HALF_LIFE = 24 * 3600
+TRENDING_PLAY_WEIGHT = 1.0
+TRENDING_LIKE_WEIGHT = 3.0
+
+# Duplicate events (see core/dedup.py): a user's repeated plays of a track
+# within PLAY_DEDUP_WINDOW seconds count once (0 counts every play), and
+# repeated likes or unlikes within LIKE_DEDUP_WINDOW seconds are answered
+# without a query (0 sends each one to the database).
+PLAY_DEDUP_WINDOW = 300
+PLAY_DEDUP_CAPACITY = 1000000
+PLAY_DEDUP_ERROR_RATE = 0.001
+LIKE_DEDUP_WINDOW = 300
+LIKE_DEDUP_CAPACITY = 100000
+
+# Stream URLs returned by POST /api/tracks/<id>/play/ are signed (see
+# core/streaming.py) so <audio src> can use them without the JWT; they
+# expire after STREAM_URL_MAX_AGE seconds.
+STREAM_URL_MAX_AGE = 3600
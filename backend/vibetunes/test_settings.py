@@ -0,0 +1,28 @@
+"""
+Settings for running the tests without a PostgreSQL server:
+``python manage.py test --settings=vibetunes.test_settings``.
+
+Two local SQLite databases stand in for the primary and a read replica.
+Nothing replicates between them, so the routing tests can tell which one a
+query went to; the other tests leave DATABASE_REPLICAS empty.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'test-primary.sqlite3'},
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'test-replica.sqlite3'},
+}
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# The play and like filters live in process memory and would outlive each
+# test's rollback (ids are reused); DedupTests turn them on.
+PLAY_DEDUP_WINDOW = 0
+LIKE_DEDUP_WINDOW = 0
+
+# Write counters and play events through instead of buffering them for a
+# flush thread, and skip the response cache; ResponseCacheTests and the
+# async view tests turn it back on.
+COUNTER_FLUSH_INTERVAL = 0
+PLAY_EVENT_FLUSH_INTERVAL = 0
+RESPONSE_CACHE_ENABLED = False
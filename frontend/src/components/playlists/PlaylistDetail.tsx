@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from '../../utils/axios';
+import { fetchAllPages } from '../../utils/pagination';
 
 interface Track {
   id: number;
@@ -43,8 +44,7 @@ export default function PlaylistDetail() {
       setPlaylist(playlistResponse.data);
       
       // Загружаем доступные треки
-      const tracksResponse = await axios.get('/tracks/');
-      setAvailableTracks(tracksResponse.data);
+      setAvailableTracks(await fetchAllPages<Track>('/tracks/?page_size=200'));
       
       setError('');
     } catch (err) {
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import axios from '../../utils/axios';
+import { fetchAllPages } from '../../utils/pagination';
 import { Link } from 'react-router-dom';
 
 interface Playlist {
@@ -23,10 +24,7 @@ export default function PlaylistList() {
   const fetchPlaylists = async () => {
     setIsLoading(true);
     try {
-      const response = await axios.get('/playlists/');
-      // Check if response has 'results' property or is an array directly
-      const playlistData = response.data.results || response.data;
-      setPlaylists(playlistData);
+      setPlaylists(await fetchAllPages<Playlist>('/playlists/?page_size=200'));
       setError('');
     } catch (err) {
       console.error('Ошибка при загрузке плейлистов:', err);
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from '../../utils/axios';
 import { useAuth } from '../../contexts/AuthContext';
+import { fetchAllPages } from '../../utils/pagination';
 
 interface Track {
   id: number;
@@ -35,9 +36,8 @@ export default function Stats() {
         setTopByPlays(chartsResponse.data.by_plays);
         setTopByLikes(chartsResponse.data.by_likes);
         
-        // Получаем треки данного музыканта
-        const tracksResponse = await axios.get(`/tracks/?musician=${user.id}`);
-        setMusicianTracks(tracksResponse.data);
+        // Получаем все треки данного музыканта, страница за страницей
+        setMusicianTracks(await fetchAllPages<Track>(`/tracks/?musician=${user.id}&page_size=200`));
         
         setError('');
       } catch (err) {
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useAuth } from '../../contexts/AuthContext';
 import axiosInstance from '../../utils/axios';
+import { fetchAllPages } from '../../utils/pagination';
 
 interface Track {
   id: number;
@@ -30,8 +31,7 @@ export default function TrackList() {
 
   const fetchTracks = async () => {
     try {
-      const response = await axiosInstance.get('/tracks/');
-      setTracks(response.data);
+      setTracks(await fetchAllPages<Track>('/tracks/?page_size=200'));
     } catch (err) {
       setError('Не удалось загрузить треки');
       console.error('Error fetching tracks:', err);
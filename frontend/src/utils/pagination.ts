@@ -0,0 +1,16 @@
+import axios from './axios';
+
+// Списки API отдаются постранично (курсор в `next`); загружаем все страницы
+export async function fetchAllPages<T>(url: string): Promise<T[]> {
+  const items: T[] = [];
+  let next: string | null = url;
+  while (next) {
+    const response = await axios.get(next);
+    if (!response.data.results) {
+      return response.data;
+    }
+    items.push(...response.data.results);
+    next = response.data.next || null;
+  }
+  return items;
+}